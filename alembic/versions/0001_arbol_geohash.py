@@ -0,0 +1,65 @@
+"""Agrega la celda geohash a arbol para consultas espaciales
+
+Revision ID: 0001_arbol_geohash
+Revises:
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app import geo
+
+revision = "0001_arbol_geohash"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 5000
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    # Las tablas pueden haber sido creadas por create_all con la columna ya incluida
+    columnas = {columna["name"] for columna in inspector.get_columns("arbol")}
+    if "geohash" not in columnas:
+        op.add_column("arbol", sa.Column("geohash", sa.String(length=12), nullable=True))
+    indices = {indice["name"] for indice in inspector.get_indexes("arbol")}
+    if "ix_arbol_geohash" not in indices:
+        op.create_index("ix_arbol_geohash", "arbol", ["geohash"])
+
+    # Rellenar el geohash de los árboles existentes por lotes
+    arbol = sa.table(
+        "arbol",
+        sa.column("id_arbol", sa.Integer),
+        sa.column("latitude", sa.Float),
+        sa.column("longitude", sa.Float),
+        sa.column("geohash", sa.String),
+    )
+    ultimo_id = 0
+    while True:
+        filas = bind.execute(
+            sa.select(arbol.c.id_arbol, arbol.c.latitude, arbol.c.longitude)
+            .where(arbol.c.id_arbol > ultimo_id, arbol.c.geohash.is_(None))
+            .order_by(arbol.c.id_arbol)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not filas:
+            break
+        valores = [
+            {"b_id": fila.id_arbol, "b_geohash": geo.encode_geohash(fila.latitude, fila.longitude)}
+            for fila in filas
+            if fila.latitude is not None and fila.longitude is not None
+        ]
+        if valores:
+            bind.execute(
+                arbol.update().where(arbol.c.id_arbol == sa.bindparam("b_id")).values(geohash=sa.bindparam("b_geohash")),
+                valores,
+            )
+        ultimo_id = filas[-1].id_arbol
+
+
+def downgrade():
+    op.drop_index("ix_arbol_geohash", table_name="arbol")
+    op.drop_column("arbol", "geohash")
@@ -0,0 +1,36 @@
+"""Agrega a medicion los campos que ya exponen sus esquemas
+
+Revision ID: 0002_medicion_campos
+Revises: 0001_arbol_geohash
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002_medicion_campos"
+down_revision = "0001_arbol_geohash"
+branch_labels = None
+depends_on = None
+
+COLUMNAS = [
+    sa.Column("interferencia_aerea", sa.String(), nullable=True),
+    sa.Column("tipo_cable", sa.String(), nullable=True),
+    sa.Column("requiere_intervencion", sa.Boolean(), nullable=False, server_default=sa.false()),
+    sa.Column("tipo_intervencion", sa.String(), nullable=True),
+    sa.Column("tratamiento_previo", sa.String(), nullable=True),
+    sa.Column("cazuela", sa.String(), nullable=True),
+    sa.Column("protegido", sa.Boolean(), nullable=False, server_default=sa.false()),
+]
+
+
+def upgrade():
+    # Las tablas pueden haber sido creadas por create_all con las columnas ya incluidas
+    existentes = {columna["name"] for columna in sa.inspect(op.get_bind()).get_columns("medicion")}
+    for columna in COLUMNAS:
+        if columna.name not in existentes:
+            op.add_column("medicion", columna)
+
+
+def downgrade():
+    for columna in reversed(COLUMNAS):
+        op.drop_column("medicion", columna.name)
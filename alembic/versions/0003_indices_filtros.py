@@ -0,0 +1,33 @@
+"""Índices compuestos para los filtros de árboles y mediciones
+
+Revision ID: 0003_indices_filtros
+Revises: 0002_medicion_campos
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003_indices_filtros"
+down_revision = "0002_medicion_campos"
+branch_labels = None
+depends_on = None
+
+INDICES = [
+    ("ix_arbol_municipio_intervencion", "arbol", ["id_municipio", "requiere_intervencion", "id_arbol"]),
+    ("ix_arbol_municipio_especie", "arbol", ["id_municipio", "id_especie", "id_arbol"]),
+    ("ix_arbol_municipio_fecha_censo", "arbol", ["id_municipio", "fecha_censo"]),
+    ("ix_medicion_arbol_fecha", "medicion", ["id_arbol", "fecha_medicion"]),
+]
+
+
+def upgrade():
+    # Las tablas pueden haber sido creadas por create_all con los índices ya incluidos
+    inspector = sa.inspect(op.get_bind())
+    for nombre, tabla, columnas in INDICES:
+        if nombre not in {indice["name"] for indice in inspector.get_indexes(tabla)}:
+            op.create_index(nombre, tabla, columnas)
+
+
+def downgrade():
+    for nombre, tabla, _ in reversed(INDICES):
+        op.drop_index(nombre, table_name=tabla)
@@ -0,0 +1,36 @@
+"""Resumen de árboles por municipio para /estadisticas
+
+Revision ID: 0004_estadistica_municipio
+Revises: 0003_indices_filtros
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app import estadisticas
+
+revision = "0004_estadistica_municipio"
+down_revision = "0003_indices_filtros"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    # La tabla puede haber sido creada por create_all
+    if "estadistica_municipio" not in sa.inspect(bind).get_table_names():
+        op.create_table(
+            "estadistica_municipio",
+            sa.Column("id_municipio", sa.Integer(), sa.ForeignKey("municipio.id_municipio", ondelete="CASCADE"), nullable=False),
+            sa.Column("dimension", sa.String(length=32), nullable=False),
+            sa.Column("valor", sa.String(), nullable=False),
+            sa.Column("cantidad", sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint("id_municipio", "dimension", "valor"),
+        )
+
+    # Cargar el resumen con los árboles existentes; desde aquí lo mantiene crud
+    estadisticas.reconstruir(bind)
+
+
+def downgrade():
+    op.drop_table("estadistica_municipio")
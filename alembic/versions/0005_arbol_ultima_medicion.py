@@ -0,0 +1,42 @@
+"""Puntero a la medición más reciente de cada árbol
+
+Revision ID: 0005_arbol_ultima_medicion
+Revises: 0004_estadistica_municipio
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005_arbol_ultima_medicion"
+down_revision = "0004_estadistica_municipio"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    # Las tablas pueden haber sido creadas por create_all con la columna ya incluida
+    columnas = {columna["name"] for columna in sa.inspect(bind).get_columns("arbol")}
+    if "id_ultima_medicion" not in columnas:
+        op.add_column("arbol", sa.Column("id_ultima_medicion", sa.Integer(), nullable=True))
+
+    # Rellenar el puntero con una subconsulta correlacionada sobre (id_arbol, fecha_medicion)
+    arbol = sa.table("arbol", sa.column("id_arbol", sa.Integer), sa.column("id_ultima_medicion", sa.Integer))
+    medicion = sa.table(
+        "medicion",
+        sa.column("id_medicion", sa.Integer),
+        sa.column("id_arbol", sa.Integer),
+        sa.column("fecha_medicion", sa.Date),
+    )
+    ultima = (
+        sa.select(medicion.c.id_medicion)
+        .where(medicion.c.id_arbol == arbol.c.id_arbol)
+        .order_by(medicion.c.fecha_medicion.desc(), medicion.c.id_medicion.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    bind.execute(arbol.update().values(id_ultima_medicion=ultima))
+
+
+def downgrade():
+    op.drop_column("arbol", "id_ultima_medicion")
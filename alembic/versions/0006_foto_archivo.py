@@ -0,0 +1,36 @@
+"""Datos del archivo almacenado de cada foto
+
+Revision ID: 0006_foto_archivo
+Revises: 0005_arbol_ultima_medicion
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0006_foto_archivo"
+down_revision = "0005_arbol_ultima_medicion"
+branch_labels = None
+depends_on = None
+
+COLUMNAS = [
+    sa.Column("sha256", sa.String(length=64), nullable=True),
+    sa.Column("tamano_bytes", sa.Integer(), nullable=True),
+    sa.Column("content_type", sa.String(), nullable=True),
+]
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    # Las tablas pueden haber sido creadas por create_all con las columnas ya incluidas
+    existentes = {columna["name"] for columna in inspector.get_columns("foto")}
+    for columna in COLUMNAS:
+        if columna.name not in existentes:
+            op.add_column("foto", columna)
+    if "ix_foto_sha256" not in {indice["name"] for indice in inspector.get_indexes("foto")}:
+        op.create_index("ix_foto_sha256", "foto", ["sha256"])
+
+
+def downgrade():
+    op.drop_index("ix_foto_sha256", table_name="foto")
+    for columna in reversed(COLUMNAS):
+        op.drop_column("foto", columna.name)
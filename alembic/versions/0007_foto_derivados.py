@@ -0,0 +1,31 @@
+"""Rutas de los derivados de cada foto
+
+Revision ID: 0007_foto_derivados
+Revises: 0006_foto_archivo
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0007_foto_derivados"
+down_revision = "0006_foto_archivo"
+branch_labels = None
+depends_on = None
+
+COLUMNAS = [
+    sa.Column("ruta_thumb", sa.String(), nullable=True),
+    sa.Column("ruta_medium", sa.String(), nullable=True),
+]
+
+
+def upgrade():
+    # Las tablas pueden haber sido creadas por create_all con las columnas ya incluidas
+    existentes = {columna["name"] for columna in sa.inspect(op.get_bind()).get_columns("foto")}
+    for columna in COLUMNAS:
+        if columna.name not in existentes:
+            op.add_column("foto", columna)
+
+
+def downgrade():
+    for columna in reversed(COLUMNAS):
+        op.drop_column("foto", columna.name)
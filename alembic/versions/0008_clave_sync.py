@@ -0,0 +1,31 @@
+"""Claves de idempotencia de la sincronización de dispositivos
+
+Revision ID: 0008_clave_sync
+Revises: 0007_foto_derivados
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0008_clave_sync"
+down_revision = "0007_foto_derivados"
+branch_labels = None
+depends_on = None
+
+TABLAS = ("medicion", "foto")
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    for tabla in TABLAS:
+        # Las tablas pueden haber sido creadas por create_all con la columna ya incluida
+        if "clave_sync" not in {columna["name"] for columna in inspector.get_columns(tabla)}:
+            op.add_column(tabla, sa.Column("clave_sync", sa.String(length=64), nullable=True))
+        if f"ix_{tabla}_clave_sync" not in {indice["name"] for indice in inspector.get_indexes(tabla)}:
+            op.create_index(f"ix_{tabla}_clave_sync", tabla, ["clave_sync"], unique=True)
+
+
+def downgrade():
+    for tabla in TABLAS:
+        op.drop_index(f"ix_{tabla}_clave_sync", table_name=tabla)
+        op.drop_column(tabla, "clave_sync")
@@ -0,0 +1,40 @@
+"""Versiones de tablas y de árboles para ETag
+
+Revision ID: 0009_versiones
+Revises: 0008_clave_sync
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0009_versiones"
+down_revision = "0008_clave_sync"
+branch_labels = None
+depends_on = None
+
+TABLAS_VERSIONADAS = ("provincia", "municipio", "role")
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    # Las tablas pueden haber sido creadas por create_all
+    if "version_tabla" not in inspector.get_table_names():
+        op.create_table(
+            "version_tabla",
+            sa.Column("tabla", sa.String(length=64), primary_key=True),
+            sa.Column("version", sa.Integer(), nullable=False),
+        )
+    if "version" not in {columna["name"] for columna in inspector.get_columns("arbol")}:
+        op.add_column("arbol", sa.Column("version", sa.Integer(), nullable=False, server_default=sa.text("1")))
+
+    version_tabla = sa.table("version_tabla", sa.column("tabla", sa.String), sa.column("version", sa.Integer))
+    existentes = set(bind.execute(sa.select(version_tabla.c.tabla)).scalars())
+    faltantes = [{"tabla": tabla, "version": 1} for tabla in TABLAS_VERSIONADAS if tabla not in existentes]
+    if faltantes:
+        op.bulk_insert(version_tabla, faltantes)
+
+
+def downgrade():
+    op.drop_column("arbol", "version")
+    op.drop_table("version_tabla")
@@ -0,0 +1,97 @@
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+from decouple import config
+from fastapi import Request, Response
+from fastapi.responses import FileResponse
+
+FOTOS_STORAGE = config("FOTOS_STORAGE", default="local")
+FOTOS_DIR = config("FOTOS_DIR", default="media/fotos")
+FOTOS_MAX_BYTES = config("FOTOS_MAX_BYTES", default=20 * 1024 * 1024, cast=int)
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class ArchivoDemasiadoGrande(Exception):
+    """El archivo subido supera FOTOS_MAX_BYTES."""
+
+
+class AlmacenLocal:
+    """Almacén de archivos direccionado por contenido: cada archivo se guarda una sola vez, bajo su SHA-256."""
+
+    def __init__(self, raiz: str = FOTOS_DIR):
+        self.raiz = Path(raiz)
+
+    def ruta(self, clave: str) -> Path:
+        """Ruta en disco de un archivo a partir de su clave (hash o clave derivada)."""
+        # Dos niveles de directorios para no acumular millones de archivos en uno solo
+        return self.raiz / clave[:2] / clave[2:4] / clave
+
+    def existe(self, clave: str) -> bool:
+        return self.ruta(clave).is_file()
+
+    def guardar(self, origen: BinaryIO, max_bytes: Optional[int] = FOTOS_MAX_BYTES) -> tuple:
+        """Copia el archivo por bloques calculando su hash; devuelve (sha256, tamaño). Si ya existía, no lo duplica."""
+        self.raiz.mkdir(parents=True, exist_ok=True)
+        sha = hashlib.sha256()
+        tamano = 0
+        # El temporal vive en la misma raíz para que el renombrado final sea atómico
+        descriptor, temporal = tempfile.mkstemp(dir=self.raiz, prefix=".subida-")
+        try:
+            with os.fdopen(descriptor, "wb") as destino:
+                while bloque := origen.read(CHUNK_SIZE):
+                    tamano += len(bloque)
+                    if max_bytes is not None and tamano > max_bytes:
+                        raise ArchivoDemasiadoGrande()
+                    sha.update(bloque)
+                    destino.write(bloque)
+
+            clave = sha.hexdigest()
+            final = self.ruta(clave)
+            if final.exists():
+                os.unlink(temporal)
+            else:
+                final.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(temporal, final)
+            return clave, tamano
+        except BaseException:
+            if os.path.exists(temporal):
+                os.unlink(temporal)
+            raise
+
+    def guardar_bytes(self, clave: str, contenido: bytes) -> None:
+        """Guarda un contenido ya generado (por ejemplo, un derivado) bajo la clave indicada."""
+        final = self.ruta(clave)
+        final.parent.mkdir(parents=True, exist_ok=True)
+        descriptor, temporal = tempfile.mkstemp(dir=final.parent, prefix=".derivado-")
+        with os.fdopen(descriptor, "wb") as destino:
+            destino.write(contenido)
+        os.replace(temporal, final)
+
+    def eliminar(self, clave: str) -> None:
+        try:
+            self.ruta(clave).unlink()
+        except FileNotFoundError:
+            pass
+
+
+# Implementaciones disponibles, elegidas con FOTOS_STORAGE
+ALMACENES = {
+    "local": AlmacenLocal,
+}
+
+almacen = ALMACENES[FOTOS_STORAGE]()
+
+
+def respuesta_archivo(request: Request, clave: str, media_type: Optional[str]) -> Response:
+    """Sirve un archivo del almacén con ETag, Range y caché inmutable; 304 si el cliente ya lo tiene."""
+    # El contenido nunca cambia para una misma clave: sirve como ETag y permite cachear sin límite
+    etag = f'"{clave}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if etag in [valor.strip() for valor in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    # FileResponse atiende Range y usa sendfile cuando el servidor lo soporta
+    return FileResponse(almacen.ruta(clave), media_type=media_type, headers=headers)
@@ -0,0 +1,139 @@
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import crud_async, derivados, respuestas, schemas, versiones
+from .almacenamiento import respuesta_archivo
+from .database import get_async_db
+from .pagination import NEXT_CURSOR_HEADER, next_cursor
+
+# Rutas de lectura asíncronas. Con ASYNC_DATABASE habilitado se registran antes
+# que las rutas síncronas de main.py y las reemplazan para los mismos paths;
+# el resto de las rutas sigue atendiéndose con la sesión síncrona.
+router = APIRouter(include_in_schema=False)
+
+
+def _con_cursor(response: Response, items: list, pk_name: str, limit: int):
+    cursor_siguiente = next_cursor(items, pk_name, limit)
+    if cursor_siguiente:
+        response.headers[NEXT_CURSOR_HEADER] = cursor_siguiente
+    return items
+
+
+# --- PROVINCIA ---
+@router.get("/provincias/", response_model=List[schemas.ProvinciaRead])
+async def leer_provincias(request: Request, response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
+    etag = versiones.etag("provincia", (await db.execute(versiones.consulta_tabla("provincia"))).scalar())
+    if (no_modificado := versiones.no_modificado(request, response, etag)):
+        return no_modificado
+    return _con_cursor(response, await crud_async.get_provincias(db, skip=skip, limit=limit, cursor=cursor), "id_provincia", limit)
+
+@router.get("/provincias/{provincia_id:int}", response_model=schemas.ProvinciaRead)
+async def leer_provincia(provincia_id: int, db: AsyncSession = Depends(get_async_db)):
+    return await crud_async.get_provincia(db, provincia_id=provincia_id)
+
+
+# --- MUNICIPIO ---
+@router.get("/municipios/", response_model=List[schemas.MunicipioRead])
+async def leer_municipios(request: Request, response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
+    etag = versiones.etag("municipio", (await db.execute(versiones.consulta_tabla("municipio"))).scalar())
+    if (no_modificado := versiones.no_modificado(request, response, etag)):
+        return no_modificado
+    return _con_cursor(response, await crud_async.get_municipios(db, skip=skip, limit=limit, cursor=cursor), "id_municipio", limit)
+
+@router.get("/municipios/{municipio_id:int}", response_model=schemas.MunicipioRead)
+async def leer_municipio(municipio_id: int, db: AsyncSession = Depends(get_async_db)):
+    return await crud_async.get_municipio(db, municipio_id=municipio_id)
+
+
+# --- ROLE ---
+@router.get("/roles/", response_model=List[schemas.RoleRead])
+async def leer_roles(request: Request, response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
+    etag = versiones.etag("role", (await db.execute(versiones.consulta_tabla("role"))).scalar())
+    if (no_modificado := versiones.no_modificado(request, response, etag)):
+        return no_modificado
+    return _con_cursor(response, await crud_async.get_roles(db, skip=skip, limit=limit, cursor=cursor), "id_role", limit)
+
+@router.get("/roles/{role_id:int}", response_model=schemas.RoleRead)
+async def leer_role(role_id: int, db: AsyncSession = Depends(get_async_db)):
+    return await crud_async.get_role(db, role_id=role_id)
+
+
+# --- USUARIO ---
+@router.get("/usuarios/", response_model=List[schemas.UsuarioRead])
+async def leer_usuarios(response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
+    return _con_cursor(response, await crud_async.get_usuarios(db, skip=skip, limit=limit, cursor=cursor), "id_usuario", limit)
+
+@router.get("/usuarios/{usuario_id:int}", response_model=schemas.UsuarioRead)
+async def leer_usuario(usuario_id: int, db: AsyncSession = Depends(get_async_db)):
+    return await crud_async.get_usuario(db, usuario_id=usuario_id)
+
+
+# --- ÁRBOL ---
+@router.get("/arboles/", response_model=List[schemas.ArbolConUltimaMedicion], response_model_exclude_unset=True)
+async def leer_arboles(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    filtros: schemas.ArbolFiltro = Depends(),
+    embed: Optional[str] = Query(None, pattern="^ultima_medicion$"),
+    fields: Optional[str] = Query(None, description="Campos a devolver, separados por comas"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    con_ultima_medicion = embed == "ultima_medicion"
+    campos = respuestas.campos_pedidos(fields, schemas.ArbolRead, "id_arbol")
+    if campos and con_ultima_medicion:
+        raise HTTPException(status_code=400, detail="fields no se puede combinar con embed.")
+    if campos or (respuestas.JSON_FILAS and not con_ultima_medicion):
+        filas = await crud_async.get_arboles_filas(db, skip=skip, limit=limit, cursor=cursor, filtros=filtros, campos=campos)
+        return respuestas.respuesta_filas(filas, "id_arbol", limit, schemas.ArbolRead, campos)
+    arboles = await crud_async.get_arboles(db, skip=skip, limit=limit, cursor=cursor, filtros=filtros, con_ultima_medicion=con_ultima_medicion)
+    esquema = schemas.ArbolConUltimaMedicion if con_ultima_medicion else schemas.ArbolRead
+    return [esquema.model_validate(arbol) for arbol in _con_cursor(response, arboles, "id_arbol", limit)]
+
+@router.get("/arboles/full", response_model=List[schemas.ArbolDetalle])
+async def leer_arboles_detalle(response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
+    return _con_cursor(response, await crud_async.get_arboles_detalle(db, skip=skip, limit=limit, cursor=cursor), "id_arbol", limit)
+
+@router.get("/arboles/{arbol_id:int}/full", response_model=schemas.ArbolDetalle)
+async def leer_arbol_detalle(arbol_id: int, db: AsyncSession = Depends(get_async_db)):
+    return await crud_async.get_arbol_detalle(db, arbol_id=arbol_id)
+
+@router.get("/arboles/{arbol_id:int}", response_model=schemas.ArbolRead)
+async def leer_arbol(arbol_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_async_db)):
+    version = (await db.execute(versiones.consulta_arbol(arbol_id))).scalar()
+    if version is not None and (no_modificado := versiones.no_modificado(request, response, versiones.etag(f"arbol-{arbol_id}", version))):
+        return no_modificado
+    return await crud_async.get_arbol(db, arbol_id=arbol_id)
+
+
+# --- MEDICIÓN ---
+@router.get("/mediciones/", response_model=List[schemas.MedicionRead])
+async def leer_mediciones(response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, filtros: schemas.MedicionFiltro = Depends(), fields: Optional[str] = Query(None, description="Campos a devolver, separados por comas"), db: AsyncSession = Depends(get_async_db)):
+    campos = respuestas.campos_pedidos(fields, schemas.MedicionRead, "id_medicion")
+    if campos or respuestas.JSON_FILAS:
+        filas = await crud_async.get_mediciones_filas(db, skip=skip, limit=limit, cursor=cursor, filtros=filtros, campos=campos)
+        return respuestas.respuesta_filas(filas, "id_medicion", limit, schemas.MedicionRead, campos)
+    return _con_cursor(response, await crud_async.get_mediciones(db, skip=skip, limit=limit, cursor=cursor, filtros=filtros), "id_medicion", limit)
+
+@router.get("/mediciones/{medicion_id:int}", response_model=schemas.MedicionRead)
+async def leer_medicion(medicion_id: int, db: AsyncSession = Depends(get_async_db)):
+    return await crud_async.get_medicion(db, medicion_id=medicion_id)
+
+
+# --- FOTO ---
+@router.get("/fotos/", response_model=List[schemas.FotoRead])
+async def leer_fotos(response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
+    return _con_cursor(response, await crud_async.get_fotos(db, skip=skip, limit=limit, cursor=cursor), "id_foto", limit)
+
+@router.get("/fotos/{foto_id:int}", response_model=schemas.FotoRead)
+async def leer_foto(
+    foto_id: int,
+    request: Request,
+    size: Optional[str] = Query(None, pattern="^(original|thumb|medium)$"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    db_foto = await crud_async.get_foto(db, foto_id=foto_id)
+    if size and db_foto.sha256:
+        return respuesta_archivo(request, *derivados.archivo_para(db_foto, size))
+    return db_foto
@@ -1,12 +1,19 @@
+import asyncio
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from . import crud, models, schemas
 from decouple import config
+from .cache import principales
 from .database import get_db
 
 # Configuración
@@ -16,20 +23,124 @@ SECRET_KEY = config("SECRET_KEY", default="default_secret_key")  # Deberías alm
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = config("ACCESS_TOKEN_EXPIRE_MINUTES", default=30, cast=int)
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Costo de bcrypt (2^rounds iteraciones) y tamaño del pool dedicado al hashing
+BCRYPT_ROUNDS = config("BCRYPT_ROUNDS", default=12, cast=int)
+PASSWORD_HASH_WORKERS = config("PASSWORD_HASH_WORKERS", default=4, cast=int)
+PASSWORD_HASH_MAX_PENDING = config("PASSWORD_HASH_MAX_PENDING", default=64, cast=int)
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+# bcrypt libera el GIL, así que un pool de hilos propio alcanza para sacarlo del event loop
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+# Cupos en ejecución + en cola; al agotarse se rechaza en lugar de encolar sin límite
+_hash_slots = threading.BoundedSemaphore(PASSWORD_HASH_WORKERS + PASSWORD_HASH_MAX_PENDING)
+
+
+class HashPoolStats:
+    """Contadores y latencias del pool de hashing de contraseñas."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self.wait_sum = 0.0
+        self.run_sum = 0.0
+        self.run_max = 0.0
+
+    def start(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def finish(self, espera: float, ejecucion: float):
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+            self.wait_sum += espera
+            self.run_sum += ejecucion
+            self.run_max = max(self.run_max, ejecucion)
+
+    def discard(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def reject(self):
+        with self._lock:
+            self.rejected += 1
+
+    def render(self) -> str:
+        """Renderiza los contadores en formato de texto de Prometheus."""
+        with self._lock:
+            return (
+                "# HELP password_hash_in_flight Operaciones de bcrypt en ejecución o en cola.\n"
+                "# TYPE password_hash_in_flight gauge\n"
+                f"password_hash_in_flight {self.in_flight}\n"
+                "# HELP password_hash_rejected_total Operaciones rechazadas por falta de cupo.\n"
+                "# TYPE password_hash_rejected_total counter\n"
+                f"password_hash_rejected_total {self.rejected}\n"
+                "# HELP password_hash_queue_seconds Espera en cola antes de ejecutar bcrypt.\n"
+                "# TYPE password_hash_queue_seconds summary\n"
+                f"password_hash_queue_seconds_sum {self.wait_sum}\n"
+                f"password_hash_queue_seconds_count {self.completed}\n"
+                "# HELP password_hash_seconds Duración de cada operación de bcrypt.\n"
+                "# TYPE password_hash_seconds summary\n"
+                f"password_hash_seconds_sum {self.run_sum}\n"
+                f"password_hash_seconds_count {self.completed}\n"
+                "# HELP password_hash_max_seconds Mayor duración observada de bcrypt.\n"
+                "# TYPE password_hash_max_seconds gauge\n"
+                f"password_hash_max_seconds {self.run_max}\n"
+            )
+
+
+hash_stats = HashPoolStats()
+
+
+async def _run_in_hash_pool(func, *args):
+    """Ejecuta func en el pool de hashing, con backpressure y medición de latencia."""
+    if not _hash_slots.acquire(blocking=False):
+        hash_stats.reject()
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Demasiadas operaciones de autenticación en curso. Intente nuevamente.",
+            headers={"Retry-After": "1"},
+        )
+    hash_stats.start()
+    encolado = time.perf_counter()
+    tiempos = {}
+
+    def medir():
+        tiempos["inicio"] = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            tiempos["fin"] = time.perf_counter()
+
+    def liberar(futuro):
+        # El cupo se libera cuando el trabajo termina o se descarta sin empezar, no cuando se cancela la petición
+        _hash_slots.release()
+        if futuro.cancelled():
+            hash_stats.discard()
+            return
+        inicio = tiempos.get("inicio", encolado)
+        hash_stats.finish(inicio - encolado, tiempos.get("fin", inicio) - inicio)
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+    futuro = _hash_executor.submit(medir)
+    futuro.add_done_callback(liberar)
+    return await asyncio.wrap_future(futuro)
 
-def authenticate_user(db: Session, email: str, password: str):
-    user = crud.get_user_by_email(db, email)
+async def verify_password(plain_password, hashed_password):
+    return await _run_in_hash_pool(pwd_context.verify, plain_password, hashed_password)
+
+async def get_password_hash(password):
+    return await _run_in_hash_pool(pwd_context.hash, password)
+
+async def authenticate_user(db: Session, email: str, password: str):
+    # La consulta usa la sesión síncrona: se ejecuta en el threadpool de FastAPI
+    user = await run_in_threadpool(crud.get_user_by_email, db, email)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    if not await verify_password(password, user.hashed_password):
         return False
     return user
 
@@ -43,6 +154,16 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def _token_key(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def _resolver_principal(db: Session, email: str):
+    """Carga el usuario y los permisos de su rol, en el threadpool."""
+    user = crud.get_user_by_email(db, email=email)
+    if user is None:
+        return None
+    return schemas.Principal.model_validate(user)
+
 async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -52,21 +173,29 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: Optional[str] = payload.get("sub")
-        if email is None:
-            raise credentials_exception
         if email is None:
             raise credentials_exception
         token_data = schemas.TokenData(email=email)
     except JWTError:
         raise credentials_exception
-    user = crud.get_user_by_email(db, email=token_data.email)
-    if user is None:
-        raise credentials_exception
-    if user is None:
+
+    # Principal en caché: evita consultar el usuario en cada petición autenticada
+    clave = _token_key(token)
+    principal = principales.get(clave)
+    if principal is not None:
+        return principal
+
+    principal = await run_in_threadpool(_resolver_principal, db, token_data.email)
+    if principal is None:
         raise credentials_exception
-    return user
 
-async def get_current_active_user(current_user: schemas.UsuarioRead = Depends(get_current_user)):
+    # La entrada nunca sobrevive al vencimiento del token
+    restante = payload.get("exp", 0) - time.time()
+    if restante > 0:
+        principales.set(clave, principal, ttl=min(principales.ttl, restante))
+    return principal
+
+async def get_current_active_user(current_user: schemas.Principal = Depends(get_current_user)):
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
\ No newline at end of file
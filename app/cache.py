@@ -0,0 +1,86 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+from decouple import config
+
+CATALOG_CACHE_TTL = config("CATALOG_CACHE_TTL", default=300, cast=float)
+CATALOG_CACHE_MAXSIZE = config("CATALOG_CACHE_MAXSIZE", default=4096, cast=int)
+PRINCIPAL_CACHE_TTL = config("PRINCIPAL_CACHE_TTL", default=60, cast=float)
+PRINCIPAL_CACHE_MAXSIZE = config("PRINCIPAL_CACHE_MAXSIZE", default=10000, cast=int)
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Caché LRU en memoria con expiración por entrada y contadores de aciertos/fallos."""
+
+    def __init__(self, maxsize: int = CATALOG_CACHE_MAXSIZE, ttl: float = CATALOG_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entrada = self._data.get(key, _MISSING)
+            if entrada is not _MISSING:
+                valor, expira = entrada
+                if expira > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return valor
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable = _MISSING) -> None:
+        """Elimina una clave, o toda la caché si no se indica ninguna."""
+        with self._lock:
+            if key is _MISSING:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def invalidate_matching(self, predicate: Callable[[Any], bool]) -> None:
+        """Elimina las entradas cuyo valor cumple el predicado."""
+        with self._lock:
+            for key in [k for k, (valor, _) in self._data.items() if predicate(valor)]:
+                del self._data[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._data), "maxsize": self.maxsize, "ttl": self.ttl, "hits": self.hits, "misses": self.misses}
+
+
+# Existencia de registros de referencia, por tabla. Las bajas en cascada
+# (provincia → municipio → árbol, especie → árbol) se invalidan en crud.
+catalogos = {
+    "provincia": TTLCache(),
+    "municipio": TTLCache(),
+    "especie": TTLCache(),
+    "role": TTLCache(),
+    "arbol": TTLCache(),
+}
+
+
+# Usuarios autenticados, por token. Se invalidan al modificar o eliminar el
+# usuario o su rol, y nunca viven más que el propio token.
+principales = TTLCache(maxsize=PRINCIPAL_CACHE_MAXSIZE, ttl=PRINCIPAL_CACHE_TTL)
+
+
+def cache_stats() -> dict:
+    """Devuelve los contadores de cada caché en memoria."""
+    stats = {nombre: cache.stats() for nombre, cache in catalogos.items()}
+    stats["principales"] = principales.stats()
+    return stats
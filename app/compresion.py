@@ -0,0 +1,151 @@
+import zlib
+from decouple import Csv, config
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él sólo se ofrece gzip
+    brotli = None
+
+# Codificaciones ofrecidas, por orden de preferencia; vacío desactiva la compresión
+COMPRESSION = config("COMPRESSION", default="br,gzip", cast=Csv())
+# Las respuestas más pequeñas se envían sin comprimir: no compensa el coste de CPU
+COMPRESSION_MIN_SIZE = config("COMPRESSION_MIN_SIZE", default=1000, cast=int)
+GZIP_LEVEL = config("GZIP_LEVEL", default=6, cast=int)
+# Calidad 4-5 comprime mejor que gzip 6 con un coste similar; 11 es sólo para contenido estático
+BROTLI_QUALITY = config("BROTLI_QUALITY", default=4, cast=int)
+# Los bloques a partir de este tamaño se comprimen en un hilo para no bloquear el event loop
+COMPRESSION_THREAD_MIN_SIZE = 128 * 1024
+
+# Tipos ya comprimidos o de streaming que no se tocan
+TIPOS_EXCLUIDOS = (
+    "application/grpc",
+    "application/gzip",
+    "application/x-gzip",
+    "application/zip",
+    "audio/*",
+    "font/woff",
+    "font/woff2",
+    "image/avif",
+    "image/gif",
+    "image/jpeg",
+    "image/png",
+    "image/webp",
+    "text/event-stream",
+    "video/*",
+)
+
+
+def codificaciones_aceptadas(accept_encoding: str) -> set:
+    """Codificaciones que admite el cliente según Accept-Encoding (las que tienen q=0 se descartan)."""
+    aceptadas = set()
+    for parte in accept_encoding.lower().split(","):
+        nombre, _, parametros = parte.partition(";")
+        calidad = parametros.strip()
+        if calidad.startswith("q="):
+            try:
+                if float(calidad[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        if nombre.strip():
+            aceptadas.add(nombre.strip())
+    return aceptadas
+
+
+class Compresor:
+    """Compresor incremental de una respuesta: cada bloque se vacía para que el streaming no espere al final."""
+
+    def __init__(self, codificacion: str, nivel_gzip: int = GZIP_LEVEL, calidad_brotli: int = BROTLI_QUALITY):
+        self.codificacion = codificacion
+        if codificacion == "br":
+            self._brotli = brotli.Compressor(quality=calidad_brotli)
+        else:
+            self._zlib = zlib.compressobj(nivel_gzip, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def comprimir(self, cuerpo: bytes, final: bool) -> bytes:
+        if self.codificacion == "br":
+            return self._brotli.process(cuerpo) + (self._brotli.finish() if final else self._brotli.flush())
+        return self._zlib.compress(cuerpo) + self._zlib.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+def _tipo_excluido(content_type: str) -> bool:
+    tipo = content_type.partition(";")[0].strip().lower()
+    return tipo in TIPOS_EXCLUIDOS or f"{tipo.partition('/')[0]}/*" in TIPOS_EXCLUIDOS
+
+
+class CompresionMiddleware:
+    """Comprime las respuestas con la primera codificación de COMPRESSION que acepte el cliente."""
+
+    def __init__(
+        self,
+        app,
+        codificaciones=tuple(COMPRESSION),
+        minimum_size: int = COMPRESSION_MIN_SIZE,
+        compresslevel: int = GZIP_LEVEL,
+        brotli_quality: int = BROTLI_QUALITY,
+    ) -> None:
+        self.app = app
+        self.codificaciones = [c for c in codificaciones if c == "gzip" or (c == "br" and brotli is not None)]
+        self.minimum_size = minimum_size
+        self.compresslevel = compresslevel
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        aceptadas = codificaciones_aceptadas(Headers(scope=scope).get("accept-encoding", ""))
+        codificacion = next((c for c in self.codificaciones if c in aceptadas), None)
+        retenido = None
+        compresor = None
+
+        async def enviar(message) -> None:
+            nonlocal retenido, compresor
+            tipo = message["type"]
+            if tipo == "http.response.start":
+                headers = MutableHeaders(raw=message["headers"])
+                if "content-encoding" in headers or message["status"] == 206 or _tipo_excluido(headers.get("content-type", "")):
+                    await send(message)
+                    return
+                if self.codificaciones:
+                    headers.add_vary_header("Accept-Encoding")
+                if codificacion is None:
+                    await send(message)
+                else:
+                    # Los encabezados se retienen hasta ver el primer bloque y decidir si se comprime
+                    retenido = message
+            elif tipo == "http.response.body" and compresor is not None:
+                message["body"] = await self._comprimir(compresor, message.get("body", b""), not message.get("more_body", False))
+                await send(message)
+            elif tipo == "http.response.body" and retenido is not None:
+                inicio, retenido = retenido, None
+                cuerpo = message.get("body", b"")
+                mas = message.get("more_body", False)
+                if len(cuerpo) >= self.minimum_size or mas:
+                    compresor = Compresor(codificacion, self.compresslevel, self.brotli_quality)
+                    message["body"] = await self._comprimir(compresor, cuerpo, not mas)
+                    headers = MutableHeaders(raw=inicio["headers"])
+                    headers["Content-Encoding"] = codificacion
+                    if mas or inicio.get("trailers", False):
+                        del headers["Content-Length"]
+                    else:
+                        headers["Content-Length"] = str(len(message["body"]))
+                await send(inicio)
+                await send(message)
+            else:
+                # Sin compresión, o pathsend/trailers/early hints: se reenvía tal cual
+                if retenido is not None:
+                    await send(retenido)
+                    retenido = None
+                await send(message)
+
+        await self.app(scope, receive, enviar)
+
+    @staticmethod
+    async def _comprimir(compresor: Compresor, cuerpo: bytes, final: bool) -> bytes:
+        if len(cuerpo) >= COMPRESSION_THREAD_MIN_SIZE:
+            return await run_in_threadpool(compresor.comprimir, cuerpo, final)
+        return compresor.comprimir(cuerpo, final)
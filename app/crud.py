@@ -1,673 +1,16 @@
+import heapq
+from itertools import islice
+from typing import BinaryIO, Iterable, Optional
 from fastapi import HTTPException
-from sqlalchemy.orm import Session
-from . import models, schemas
-
-# Valores permitidos para los campos restringidos
-ALTURA_VALUES = {"1-2 m", ">3 m", "3-5 m", "> 5m"}
-DIAMETRO_TRONCO_VALUES = {"1-5 cm", "5-15 cm", "> 15 cm", "Especificar"}
-AMBITO_VALUES = {"Urbano", "Rural", "Otro"}
-INTERFERENCIA_AEREA_VALUES = {"Línea alta", "Iluminaria y media", "Baja"}
-TIPO_CABLE_VALUES = {"Preensamblado", "Cable desnudo", ""}
-TIPO_INTERVENCION_VALUES = {"Poda de altura", "Poda de formación", "Poda de aclareo", "Raleo", "Aplicación de fungicida", ""}
-
-
-# --- CRUD para Provincia ---
-def get_provincias(db: Session, skip: int = 0, limit: int = 100):
-    """Obtiene una lista de provincias con paginación."""
-    return db.query(models.Provincia).offset(skip).limit(limit).all()
-
-def get_provincia(db: Session, provincia_id: int):
-    """Obtiene una provincia específica por su ID."""
-    provincia = db.query(models.Provincia).filter(models.Provincia.id_provincia == provincia_id).first()
-    if not provincia:
-        raise HTTPException(status_code=404, detail="Provincia no encontrada")
-    return provincia
-
-def create_provincia(db: Session, provincia: schemas.ProvinciaCreate):
-    """Crea una nueva provincia en la base de datos."""
-    # Normalizar nombre para evitar inconsistencias
-    nombre_normalizado = provincia.nombre.strip().title()
-
-    # Verificar si el nombre ya existe (ignorar mayúsculas/minúsculas)
-    if db.query(models.Provincia).filter(models.Provincia.nombre.ilike(nombre_normalizado)).first():
-        raise HTTPException(status_code=400, detail=f"La provincia '{nombre_normalizado}' ya existe.")
-
-    # Crear la provincia
-    db_provincia = models.Provincia(nombre=nombre_normalizado)
-    try:
-        db.add(db_provincia)
-        db.commit()
-        db.refresh(db_provincia)
-    except IntegrityError:
-        db.rollback()
-        raise HTTPException(status_code=400, detail="Error de integridad al crear la provincia.")
-    
-    return db_provincia
-
-def update_provincia(db: Session, provincia_id: int, provincia: schemas.ProvinciaCreate):
-    """Actualiza una provincia existente por su ID."""
-    db_provincia = db.query(models.Provincia).filter(models.Provincia.id_provincia == provincia_id).first()
-    if not db_provincia:
-        raise HTTPException(status_code=404, detail="Provincia no encontrada")
-
-    # Normalizar nombre
-    nombre_normalizado = provincia.nombre.strip().title()
-
-    # Validar duplicados para otros registros
-    if db.query(models.Provincia).filter(models.Provincia.nombre.ilike(nombre_normalizado), models.Provincia.id_provincia != provincia_id).first():
-        raise HTTPException(status_code=400, detail=f"Ya existe otra provincia con el nombre '{nombre_normalizado}'.")
-
-    # Actualizar la provincia
-    db_provincia.nombre = nombre_normalizado
-    db.commit()
-    db.refresh(db_provincia)
-    
-    return db_provincia
-
-def delete_provincia(db: Session, provincia_id: int):
-    """Elimina una provincia si existe."""
-    db_provincia = db.query(models.Provincia).filter(models.Provincia.id_provincia == provincia_id).first()
-    if not db_provincia:
-        raise HTTPException(status_code=404, detail="Provincia no encontrada")
-
-    # Eliminar la provincia
-    db.delete(db_provincia)
-    db.commit()
-    
-    return {"detail": f"Provincia '{db_provincia.nombre}' eliminada exitosamente."}
-
-
-# --- CRUD para Municipio ---
-def get_municipios(db: Session, skip: int = 0, limit: int = 100):
-    """Obtiene una lista de municipios con paginación."""
-    return db.query(models.Municipio).offset(skip).limit(limit).all()
-
-def get_municipio(db: Session, municipio_id: int):
-    """Obtiene un municipio específico por su ID."""
-    municipio = db.query(models.Municipio).filter(models.Municipio.id_municipio == municipio_id).first()
-    if not municipio:
-        raise HTTPException(status_code=404, detail="Municipio no encontrado")
-    return municipio
-
-def create_municipio(db: Session, municipio: schemas.MunicipioCreate):
-    """Crea un nuevo municipio en la base de datos."""
-    # Normalizar nombre para evitar inconsistencias
-    nombre_normalizado = municipio.nombre.strip().title()
-
-    # Verificar si el municipio ya existe en la misma provincia (ignorando mayúsculas/minúsculas)
-    existing_municipio = db.query(models.Municipio).filter(
-        models.Municipio.nombre.ilike(nombre_normalizado),
-        models.Municipio.id_provincia == municipio.id_provincia
-    ).first()
-    if existing_municipio:
-        raise HTTPException(status_code=400, detail=f"El municipio '{nombre_normalizado}' ya existe en esta provincia.")
-    
-    # Crear un nuevo municipio
-    db_municipio = models.Municipio(
-        id_provincia=municipio.id_provincia,
-        nombre=nombre_normalizado,
-        latitude=municipio.latitude,
-        longitude=municipio.longitude
-    )
-    try:
-        db.add(db_municipio)
-        db.commit()
-        db.refresh(db_municipio)
-    except IntegrityError:
-        db.rollback()
-        raise HTTPException(status_code=400, detail="Error de integridad al crear el municipio.")
-    
-    return db_municipio
-
-def update_municipio(db: Session, municipio_id: int, municipio: schemas.MunicipioCreate):
-    """Actualiza un municipio existente por su ID."""
-    db_municipio = db.query(models.Municipio).filter(models.Municipio.id_municipio == municipio_id).first()
-    if not db_municipio:
-        raise HTTPException(status_code=404, detail="Municipio no encontrado")
-
-    # Normalizar nombre
-    nombre_normalizado = municipio.nombre.strip().title()
-
-    # Validar que no haya duplicados al actualizar el nombre
-    existing_municipio = db.query(models.Municipio).filter(
-        models.Municipio.nombre.ilike(nombre_normalizado),
-        models.Municipio.id_provincia == municipio.id_provincia,
-        models.Municipio.id_municipio != municipio_id
-    ).first()
-    if existing_municipio:
-        raise HTTPException(status_code=400, detail=f"Ya existe otro municipio con el nombre '{nombre_normalizado}' en esta provincia.")
-    
-    # Actualizar los datos del municipio
-    db_municipio.nombre = nombre_normalizado
-    db_municipio.latitude = municipio.latitude
-    db_municipio.longitude = municipio.longitude
-
-    db.commit()
-    db.refresh(db_municipio)
-    return db_municipio
-
-def delete_municipio(db: Session, municipio_id: int):
-    """Elimina un municipio si existe."""
-    db_municipio = db.query(models.Municipio).filter(models.Municipio.id_municipio == municipio_id).first()
-    if not db_municipio:
-        raise HTTPException(status_code=404, detail="Municipio no encontrado")
-    
-    # Eliminar el municipio
-    db.delete(db_municipio)
-    db.commit()
-    
-    return {"detail": f"Municipio '{db_municipio.nombre}' eliminado exitosamente."}
-
-
-
-# --- CRUD para Role ---
-def get_roles(db: Session, skip: int = 0, limit: int = 100):
-    """Obtiene una lista de roles con paginación."""
-    return db.query(models.Role).offset(skip).limit(limit).all()
-
-def get_role(db: Session, role_id: int):
-    """Obtiene un rol específico por su ID."""
-    db_role = db.query(models.Role).filter(models.Role.id_role == role_id).first()
-    if not db_role:
-        raise HTTPException(status_code=404, detail="Rol no encontrado")
-    return db_role
-
-def create_role(db: Session, role: schemas.RoleCreate):
-    """Crea un nuevo rol en la base de datos."""
-    # Normalizar el nombre del rol para evitar duplicados
-    role_name_normalizado = role.role_name.strip().title()
-
-    # Verificar si el rol ya existe (ignorando mayúsculas/minúsculas)
-    existing_role = db.query(models.Role).filter(models.Role.role_name.ilike(role_name_normalizado)).first()
-    if existing_role:
-        raise HTTPException(status_code=400, detail=f"El rol '{role_name_normalizado}' ya existe.")
-    
-    # Crear un nuevo rol
-    db_role = models.Role(
-        role_name=role_name_normalizado,
-        can_manage_users=role.can_manage_users,
-        can_manage_all_relevamientos=role.can_manage_all_relevamientos,
-        can_create_relevamientos=role.can_create_relevamientos,
-        can_modify_own_relevamientos=role.can_modify_own_relevamientos,
-        can_generate_reports=role.can_generate_reports
-    )
-
-    try:
-        db.add(db_role)
-        db.commit()
-        db.refresh(db_role)
-    except IntegrityError:
-        db.rollback()
-        raise HTTPException(status_code=400, detail="Error de integridad al crear el rol.")
-    
-    return db_role
-
-def update_role(db: Session, role_id: int, role: schemas.RoleCreate):
-    """Actualiza un rol existente por su ID."""
-    db_role = db.query(models.Role).filter(models.Role.id_role == role_id).first()
-    if not db_role:
-        raise HTTPException(status_code=404, detail="Rol no encontrado")
-    
-    # Normalizar nombre
-    role_name_normalizado = role.role_name.strip().title()
-
-    # Validar que no haya duplicados al actualizar el nombre del rol
-    existing_role = db.query(models.Role).filter(
-        models.Role.role_name.ilike(role_name_normalizado),
-        models.Role.id_role != role_id
-    ).first()
-    if existing_role:
-        raise HTTPException(status_code=400, detail=f"Ya existe otro rol con el nombre '{role_name_normalizado}'.")
-    
-    # Actualizar los datos del rol
-    db_role.role_name = role_name_normalizado
-    db_role.can_manage_users = role.can_manage_users
-    db_role.can_manage_all_relevamientos = role.can_manage_all_relevamientos
-    db_role.can_create_relevamientos = role.can_create_relevamientos
-    db_role.can_modify_own_relevamientos = role.can_modify_own_relevamientos
-    db_role.can_generate_reports = role.can_generate_reports
-
-    db.commit()
-    db.refresh(db_role)
-    return db_role
-
-def delete_role(db: Session, role_id: int):
-    """Elimina un rol si existe."""
-    db_role = db.query(models.Role).filter(models.Role.id_role == role_id).first()
-    if not db_role:
-        raise HTTPException(status_code=404, detail="Rol no encontrado")
-    
-    # Eliminar el rol
-    db.delete(db_role)
-    db.commit()
-    
-    return {"detail": f"Rol '{db_role.role_name}' eliminado exitosamente."}
-
-
-# --- CRUD para Usuario ---
-def get_usuarios(db: Session, skip: int = 0, limit: int = 100):
-    """Obtiene una lista de usuarios con paginación."""
-    return db.query(models.Usuario).offset(skip).limit(limit).all()
-
-def get_usuario(db: Session, usuario_id: int):
-    """Obtiene un usuario específico por su ID."""
-    db_usuario = db.query(models.Usuario).filter(models.Usuario.id_usuario == usuario_id).first()
-    if not db_usuario:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
-    return db_usuario
-
-def create_usuario(db: Session, usuario: schemas.UsuarioCreate):
-    """Crea un nuevo usuario en la base de datos."""
-    # Normalizar email y nombre
-    email_normalizado = usuario.email.strip().lower()
-    nombre_normalizado = usuario.nombre.strip().title()
-
-    # Validar que el correo electrónico sea único
-    existing_usuario = db.query(models.Usuario).filter(models.Usuario.email == email_normalizado).first()
-    if existing_usuario:
-        raise HTTPException(status_code=400, detail=f"El correo '{email_normalizado}' ya está en uso.")
-
-    # Verificar que el municipio y el rol existen antes de asignarlos
-    municipio = db.query(models.Municipio).filter(models.Municipio.id_municipio == usuario.id_municipio).first()
-    role = db.query(models.Role).filter(models.Role.id_role == usuario.id_role).first()
-    
-    if not municipio:
-        raise HTTPException(status_code=400, detail=f"El municipio con ID {usuario.id_municipio} no existe.")
-    if not role:
-        raise HTTPException(status_code=400, detail=f"El rol con ID {usuario.id_role} no existe.")
-
-    # Crear el usuario
-    db_usuario = models.Usuario(
-        id_municipio=usuario.id_municipio,
-        id_role=usuario.id_role,
-        nombre=nombre_normalizado,
-        email=email_normalizado,
-        is_active=usuario.is_active,
-        is_superuser=usuario.is_superuser,
-        date_joined=usuario.date_joined,
-        created_by=usuario.created_by
-    )
-
-    try:
-        db.add(db_usuario)
-        db.commit()
-        db.refresh(db_usuario)
-    except IntegrityError:
-        db.rollback()
-        raise HTTPException(status_code=400, detail="Error de integridad al crear el usuario.")
-    
-    return db_usuario
-
-def update_usuario(db: Session, usuario_id: int, usuario: schemas.UsuarioCreate):
-    """Actualiza un usuario existente por su ID."""
-    db_usuario = db.query(models.Usuario).filter(models.Usuario.id_usuario == usuario_id).first()
-    if not db_usuario:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
-
-    # Normalizar email y nombre
-    email_normalizado = usuario.email.strip().lower()
-    nombre_normalizado = usuario.nombre.strip().title()
-
-    # Validar que no haya duplicados al actualizar el correo electrónico
-    existing_usuario = db.query(models.Usuario).filter(
-        models.Usuario.email == email_normalizado,
-        models.Usuario.id_usuario != usuario_id
-    ).first()
-    if existing_usuario:
-        raise HTTPException(status_code=400, detail=f"El correo '{email_normalizado}' ya está en uso por otro usuario.")
-
-    # Validar que el municipio y rol existan si se cambian
-    if usuario.id_municipio and usuario.id_municipio != db_usuario.id_municipio:
-        municipio = db.query(models.Municipio).filter(models.Municipio.id_municipio == usuario.id_municipio).first()
-        if not municipio:
-            raise HTTPException(status_code=400, detail=f"El municipio con ID {usuario.id_municipio} no existe.")
-
-    if usuario.id_role and usuario.id_role != db_usuario.id_role:
-        role = db.query(models.Role).filter(models.Role.id_role == usuario.id_role).first()
-        if not role:
-            raise HTTPException(status_code=400, detail=f"El rol con ID {usuario.id_role} no existe.")
-
-    # Actualizar los datos del usuario
-    db_usuario.nombre = nombre_normalizado
-    db_usuario.email = email_normalizado
-    db_usuario.is_active = usuario.is_active
-    db_usuario.is_superuser = usuario.is_superuser
-    db_usuario.date_joined = usuario.date_joined
-    db_usuario.id_municipio = usuario.id_municipio
-    db_usuario.id_role = usuario.id_role
-    db_usuario.created_by = usuario.created_by
-
-    db.commit()
-    db.refresh(db_usuario)
-    return db_usuario
-
-def delete_usuario(db: Session, usuario_id: int):
-    """Elimina un usuario si existe."""
-    db_usuario = db.query(models.Usuario).filter(models.Usuario.id_usuario == usuario_id).first()
-    if not db_usuario:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
-
-    # Eliminar el usuario
-    db.delete(db_usuario)
-    db.commit()
-    
-    return {"detail": f"Usuario '{db_usuario.email}' eliminado exitosamente."}
-
-
-# --- CRUD para Especie ---
-def get_especies(db: Session, skip: int = 0, limit: int = 100):
-    """Obtiene una lista de especies con paginación."""
-    return db.query(models.Especie).offset(skip).limit(limit).all()
-
-def get_especie(db: Session, especie_id: int):
-    """Obtiene una especie específica por su ID."""
-    db_especie = db.query(models.Especie).filter(models.Especie.id_especie == especie_id).first()
-    if not db_especie:
-        raise HTTPException(status_code=404, detail="Especie no encontrada")
-    return db_especie
-
-def create_especie(db: Session, especie: schemas.EspecieCreate):
-    """Crea una nueva especie en la base de datos."""
-    # Normalizar nombres
-    nombre_cientifico_normalizado = especie.nombre_cientifico.strip().capitalize()
-    nombre_comun_normalizado = especie.nombre_comun.strip().title()
-    origen_normalizado = especie.origen.strip().lower()
-
-    # Validar que el nombre científico sea único
-    existing_especie = db.query(models.Especie).filter(
-        models.Especie.nombre_cientifico == nombre_cientifico_normalizado
-    ).first()
-    
-    if existing_especie:
-        raise HTTPException(
-            status_code=400,
-            detail=f"La especie con nombre científico '{nombre_cientifico_normalizado}' ya existe."
-        )
-
-    # Crear la especie
-    db_especie = models.Especie(
-        nombre_cientifico=nombre_cientifico_normalizado,
-        nombre_comun=nombre_comun_normalizado,
-        origen=origen_normalizado
-    )
-
-    try:
-        db.add(db_especie)
-        db.commit()
-        db.refresh(db_especie)
-    except IntegrityError:
-        db.rollback()
-        raise HTTPException(status_code=400, detail="Error de integridad al crear la especie.")
-    
-    return db_especie
-
-def update_especie(db: Session, especie_id: int, especie: schemas.EspecieCreate):
-    """Actualiza una especie existente por su ID."""
-    db_especie = db.query(models.Especie).filter(models.Especie.id_especie == especie_id).first()
-    if not db_especie:
-        raise HTTPException(status_code=404, detail="Especie no encontrada")
-
-    # Normalizar nombres
-    nombre_cientifico_normalizado = especie.nombre_cientifico.strip().capitalize()
-    nombre_comun_normalizado = especie.nombre_comun.strip().title()
-    origen_normalizado = especie.origen.strip().lower()
-
-    # Validar que el nombre científico no se repita al actualizar
-    existing_especie = db.query(models.Especie).filter(
-        models.Especie.nombre_cientifico == nombre_cientifico_normalizado,
-        models.Especie.id_especie != especie_id
-    ).first()
-    
-    if existing_especie:
-        raise HTTPException(
-            status_code=400,
-            detail=f"El nombre científico '{nombre_cientifico_normalizado}' ya está en uso por otra especie."
-        )
-
-    # Actualizar datos de la especie
-    db_especie.nombre_cientifico = nombre_cientifico_normalizado
-    db_especie.nombre_comun = nombre_comun_normalizado
-    db_especie.origen = origen_normalizado
-
-    db.commit()
-    db.refresh(db_especie)
-    return db_especie
-
-def delete_especie(db: Session, especie_id: int):
-    """Elimina una especie si existe."""
-    db_especie = db.query(models.Especie).filter(models.Especie.id_especie == especie_id).first()
-    if not db_especie:
-        raise HTTPException(status_code=404, detail="Especie no encontrada")
-
-    # Eliminar la especie
-    db.delete(db_especie)
-    db.commit()
-    
-    return {"detail": f"Especie '{db_especie.nombre_cientifico}' eliminada exitosamente."}
-
-
-
-# --- CRUD para Arbol ---
-def get_arboles(db: Session, skip: int = 0, limit: int = 100):
-    """Obtiene una lista de árboles con paginación."""
-    return db.query(models.Arbol).offset(skip).limit(limit).all()
-
-def get_arbol(db: Session, arbol_id: int):
-    """Obtiene un árbol específico por su ID."""
-    db_arbol = db.query(models.Arbol).filter(models.Arbol.id_arbol == arbol_id).first()
-    if not db_arbol:
-        raise HTTPException(status_code=404, detail="Árbol no encontrado")
-    return db_arbol
-
-def create_arbol(db: Session, arbol: schemas.ArbolCreate):
-    """Crea un nuevo árbol en la base de datos."""
-    # Validar existencia de municipio y especie
-    municipio = db.query(models.Municipio).filter(models.Municipio.id_municipio == arbol.id_municipio).first()
-    especie = db.query(models.Especie).filter(models.Especie.id_especie == arbol.id_especie).first()
-
-    if not municipio:
-        raise HTTPException(status_code=400, detail=f"El municipio con ID {arbol.id_municipio} no existe.")
-    if not especie:
-        raise HTTPException(status_code=400, detail=f"La especie con ID {arbol.id_especie} no existe.")
-
-    # Normalizar datos
-    arbol_data = arbol.dict()
-    arbol_data["calle"] = arbol_data["calle"].strip().title() if arbol_data["calle"] else None
-    arbol_data["barrio"] = arbol_data["barrio"].strip().title() if arbol_data["barrio"] else None
-    arbol_data["identificacion"] = arbol_data["identificacion"].strip() if arbol_data["identificacion"] else None
-
-    # Crear el árbol
-    db_arbol = models.Arbol(**arbol_data)
-    try:
-        db.add(db_arbol)
-        db.commit()
-        db.refresh(db_arbol)
-    except IntegrityError:
-        db.rollback()
-        raise HTTPException(status_code=400, detail="Error de integridad al crear el árbol.")
-
-    return db_arbol
-
-def update_arbol(db: Session, arbol_id: int, arbol: schemas.ArbolCreate):
-    """Actualiza un árbol existente por su ID."""
-    db_arbol = db.query(models.Arbol).filter(models.Arbol.id_arbol == arbol_id).first()
-    if not db_arbol:
-        raise HTTPException(status_code=404, detail="Árbol no encontrado")
-
-    # Validar que el municipio y la especie existan antes de actualizar
-    if arbol.id_municipio:
-        municipio = db.query(models.Municipio).filter(models.Municipio.id_municipio == arbol.id_municipio).first()
-        if not municipio:
-            raise HTTPException(status_code=400, detail=f"El municipio con ID {arbol.id_municipio} no existe.")
-
-    if arbol.id_especie:
-        especie = db.query(models.Especie).filter(models.Especie.id_especie == arbol.id_especie).first()
-        if not especie:
-            raise HTTPException(status_code=400, detail=f"La especie con ID {arbol.id_especie} no existe.")
-
-    # Normalizar datos antes de actualizar
-    arbol_data = arbol.dict()
-    arbol_data["calle"] = arbol_data["calle"].strip().title() if arbol_data["calle"] else None
-    arbol_data["barrio"] = arbol_data["barrio"].strip().title() if arbol_data["barrio"] else None
-    arbol_data["identificacion"] = arbol_data["identificacion"].strip() if arbol_data["identificacion"] else None
-
-    # Actualizar los campos del árbol
-    for key, value in arbol_data.items():
-        setattr(db_arbol, key, value)
-    db.commit()
-    db.refresh(db_arbol)
-    return db_arbol
-
-def delete_arbol(db: Session, arbol_id: int):
-    """Elimina un árbol si existe."""
-    db_arbol = db.query(models.Arbol).filter(models.Arbol.id_arbol == arbol_id).first()
-    if not db_arbol:
-        raise HTTPException(status_code=404, detail="Árbol no encontrado")
-
-    # Eliminar el árbol
-    db.delete(db_arbol)
-    db.commit()
-    
-    return {"detail": f"Árbol con ID {arbol_id} eliminado exitosamente."}
-
-
-# --- CRUD para Medición ---
-def get_mediciones(db: Session, skip: int = 0, limit: int = 100):
-    """Obtiene una lista de mediciones con paginación."""
-    return db.query(models.Medicion).offset(skip).limit(limit).all()
-
-def get_medicion(db: Session, medicion_id: int):
-    """Obtiene una medición específica por su ID."""
-    db_medicion = db.query(models.Medicion).filter(models.Medicion.id_medicion == medicion_id).first()
-    if not db_medicion:
-        raise HTTPException(status_code=404, detail="Medición no encontrada")
-    return db_medicion
-
-def create_medicion(db: Session, medicion: schemas.MedicionCreate):
-    """Crea una nueva medición en la base de datos."""
-    # Validar que el árbol y el usuario existan antes de crear la medición
-    arbol = db.query(models.Arbol).filter(models.Arbol.id_arbol == medicion.id_arbol).first()
-    usuario = db.query(models.Usuario).filter(models.Usuario.id_usuario == medicion.id_usuario).first()
-
-    if not arbol:
-        raise HTTPException(status_code=400, detail=f"El árbol con ID {medicion.id_arbol} no existe.")
-    if not usuario:
-        raise HTTPException(status_code=400, detail=f"El usuario con ID {medicion.id_usuario} no existe.")
-
-    # Normalizar datos antes de crear la medición
-    medicion_data = medicion.dict()
-    medicion_data["tratamiento_previo"] = medicion_data["tratamiento_previo"].strip().title() if medicion_data["tratamiento_previo"] else None
-    medicion_data["cazuela"] = medicion_data["cazuela"].strip().title() if medicion_data["cazuela"] else None
-
-    # Crear la medición
-    db_medicion = models.Medicion(**medicion_data)
-    try:
-        db.add(db_medicion)
-        db.commit()
-        db.refresh(db_medicion)
-    except IntegrityError:
-        db.rollback()
-        raise HTTPException(status_code=400, detail="Error de integridad al crear la medición.")
-
-    return db_medicion
-
-def update_medicion(db: Session, medicion_id: int, medicion: schemas.MedicionCreate):
-    """Actualiza una medición existente por su ID."""
-    db_medicion = db.query(models.Medicion).filter(models.Medicion.id_medicion == medicion_id).first()
-    if not db_medicion:
-        raise HTTPException(status_code=404, detail="Medición no encontrada")
-
-    # Validar que el árbol y el usuario existan antes de actualizar
-    if medicion.id_arbol:
-        arbol = db.query(models.Arbol).filter(models.Arbol.id_arbol == medicion.id_arbol).first()
-        if not arbol:
-            raise HTTPException(status_code=400, detail=f"El árbol con ID {medicion.id_arbol} no existe.")
-
-    if medicion.id_usuario:
-        usuario = db.query(models.Usuario).filter(models.Usuario.id_usuario == medicion.id_usuario).first()
-        if not usuario:
-            raise HTTPException(status_code=400, detail=f"El usuario con ID {medicion.id_usuario} no existe.")
-
-    # Normalizar datos antes de actualizar la medición
-    medicion_data = medicion.dict()
-    medicion_data["tratamiento_previo"] = medicion_data["tratamiento_previo"].strip().title() if medicion_data["tratamiento_previo"] else None
-    medicion_data["cazuela"] = medicion_data["cazuela"].strip().title() if medicion_data["cazuela"] else None
-
-    # Actualizar los campos de la medición
-    for key, value in medicion_data.items():
-        setattr(db_medicion, key, value)
-    db.commit()
-    db.refresh(db_medicion)
-    return db_medicion
-
-def delete_medicion(db: Session, medicion_id: int):
-    """Elimina una medición si existe."""
-    db_medicion = db.query(models.Medicion).filter(models.Medicion.id_medicion == medicion_id).first()
-    if not db_medicion:
-        raise HTTPException(status_code=404, detail="Medición no encontrada")
-
-    # Eliminar la medición
-    db.delete(db_medicion)
-    db.commit()
-    
-    return {"detail": f"Medición con ID {medicion_id} eliminada exitosamente."}
-
-
-# --- CRUD para Foto ---
-def get_fotos(db: Session, skip: int = 0, limit: int = 100):
-    """Obtiene una lista de fotos con paginación."""
-    return db.query(models.Foto).offset(skip).limit(limit).all()
-
-def get_foto(db: Session, foto_id: int):
-    """Obtiene una foto específica por su ID."""
-    db_foto = db.query(models.Foto).filter(models.Foto.id_foto == foto_id).first()
-    if not db_foto:
-        raise HTTPException(status_code=404, detail="Foto no encontrada")
-    return db_foto
-
-def create_foto(db: Session, foto: schemas.FotoCreate):
-    """Crea una nueva foto asociada a una medición."""
-    # Validar que la medición asociada exista
-    medicion = db.query(models.Medicion).filter(models.Medicion.id_medicion == foto.id_medicion).first()
-    if not medicion:
-        raise HTTPException(status_code=400, detail=f"La medición con ID {foto.id_medicion} no existe.")
-
-    # Normalizar datos antes de insertar
-    foto_data = foto.dict()
-    foto_data["tipo_foto"] = foto_data["tipo_foto"].strip().title()
-    foto_data["ruta_foto"] = foto_data["ruta_foto"].strip()
-
-    # Crear la foto
-    db_foto = models.Foto(**foto_data)
-    try:
-        db.add(db_foto)
-        db.commit()
-        db.refresh(db_foto)
-    except IntegrityError:
-        db.rollback()
-        raise HTTPException(status_code=400, detail="Error de integridad al crear la foto.")
-
-    return db_foto
-
-def update_foto(db: Session, foto_id: int, foto: schemas.FotoCreate):
-    """Actualiza una foto existente por su ID."""
-    db_foto = db.query(models.Foto).filter(models.Foto.id_foto == foto_id).first()
-    if not db_foto:
-        raise HTTPException(status_code=404, detail="Foto no encontrada")
-
-    # Validar que la medición asociada exista si se cambia
-    if foto.id_medicion and foto.id_medicion != db_foto.id_medicion:
-        medicion = db.query(models.Medicion).filter(models.Medicion.id_medicion == foto.id_medicion).first()
-        if not medicion:
-            raise HTTPException(status_code=400, detail=f"La medición con ID {foto.id_medicion} no existe.")
-
-    # Normalizar datos antes de actualizar
-    foto_data = foto.dict()
-    foto_data["tipo_foto"] = foto_data["tipo_foto"].strip().title()
-    foto_data["ruta_foto"] = foto_data["ruta_foto"].strip()
+from pydantic import ValidationError
+from sqlalchemy import and_, insert, or_, select, update
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import Session
-from . import models, schemas
+from sqlalchemy.orm import Session, joinedload, selectinload
+from . import derivados, estadisticas, geo, models, schemas, versiones
+from .almacenamiento import ArchivoDemasiadoGrande, almacen
+from .cache import catalogos, principales
+from .pagination import apply_pagination, paginate
+from .respuestas import columnas_esquema
 
 # Valores permitidos para los campos restringidos
 ALTURA_VALUES = {"1-2 m", ">3 m", "3-5 m", "> 5m"}
@@ -677,11 +20,83 @@ INTERFERENCIA_AEREA_VALUES = {"Línea alta", "Iluminaria y media", "Baja"}
 TIPO_CABLE_VALUES = {"Preensamblado", "Cable desnudo", ""}
 TIPO_INTERVENCION_VALUES = {"Poda de altura", "Poda de formación", "Poda de aclareo", "Raleo", "Aplicación de fungicida", ""}
 
+# Tablas cuyos registros se eliminan en cascada al borrar un registro de cada catálogo
+CASCADAS = {
+    "provincia": ("municipio", "arbol"),
+    "municipio": ("arbol",),
+    "especie": ("arbol",),
+    "usuario": ("arbol",),
+}
+
+
+# --- Caché de existencia de catálogos ---
+def _existe(db: Session, columna, id_: int) -> bool:
+    """Verifica si existe un registro por su clave primaria, usando la caché de catálogos."""
+    cache = catalogos.get(columna.table.name)
+    if cache and cache.get(id_):
+        return True
+    existe = db.query(columna).filter(columna == id_).first() is not None
+    if existe and cache:
+        cache.set(id_, True)
+    return existe
+
+def _invalidar_catalogo(tabla: str, id_: int, eliminado: bool = False):
+    """Invalida la entrada de un registro y, si fue eliminado, las tablas que dependen de él en cascada."""
+    if tabla in catalogos:
+        catalogos[tabla].invalidate(id_)
+    if eliminado:
+        for dependiente in CASCADAS.get(tabla, ()):
+            catalogos[dependiente].invalidate()
+        if tabla in ("provincia", "municipio"):
+            # Los usuarios del municipio también se eliminan en cascada
+            principales.invalidate()
+
+
+# --- Escrituras en una sola sentencia ---
+# Las referencias las valida la base con sus FK; el 400 específico se arma sólo si la escritura falla.
+def _insertar(db: Session, modelo, datos: dict):
+    """INSERT ... RETURNING: devuelve la fila creada con todas sus columnas, sin volver a consultarla."""
+    tabla = modelo.__table__
+    return db.execute(insert(tabla).values(**datos).returning(*tabla.c)).one()
+
+def _actualizar(db: Session, modelo, id_: int, datos: dict):
+    """UPDATE ... RETURNING por clave primaria: devuelve la fila actualizada, o None si no existe."""
+    tabla = modelo.__table__
+    pk = tabla.primary_key.columns[0]
+    return db.execute(update(tabla).where(pk == id_).values(**datos).returning(*tabla.c)).first()
+
+def _error_integridad(db: Session, referencias: list, detalle: str) -> HTTPException:
+    """Revierte y traduce un IntegrityError al 400 de la primera referencia inexistente, o al genérico si todas existen."""
+    db.rollback()
+    for columna, id_, entidad in referencias:
+        if id_ is not None and not _existe(db, columna, id_):
+            return HTTPException(status_code=400, detail=f"{entidad} con ID {id_} no existe.")
+    return HTTPException(status_code=400, detail=detalle)
+
+def referencias_arbol(datos: dict) -> list:
+    """(columna, ID, entidad) de las FK de un árbol, en el orden en que se informan."""
+    return [
+        (models.Municipio.id_municipio, datos["id_municipio"], "El municipio"),
+        (models.Especie.id_especie, datos["id_especie"], "La especie"),
+        (models.Usuario.id_usuario, datos["id_usuario"], "El usuario"),
+    ]
+
+def referencias_medicion(datos: dict) -> list:
+    """(columna, ID, entidad) de las FK de una medición, en el orden en que se informan."""
+    return [
+        (models.Arbol.id_arbol, datos["id_arbol"], "El árbol"),
+        (models.Usuario.id_usuario, datos["id_usuario"], "El usuario"),
+    ]
+
+def referencias_foto(datos: dict) -> list:
+    """(columna, ID, entidad) de las FK de una foto, en el orden en que se informan."""
+    return [(models.Medicion.id_medicion, datos["id_medicion"], "La medición")]
+
 
 # --- CRUD para Provincia ---
-def get_provincias(db: Session, skip: int = 0, limit: int = 100):
-    """Obtiene una lista de provincias con paginación."""
-    return db.query(models.Provincia).offset(skip).limit(limit).all()
+def get_provincias(db: Session, skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    """Obtiene una lista de provincias con paginación por offset o por cursor."""
+    return paginate(db.query(models.Provincia), models.Provincia.id_provincia, skip=skip, limit=limit, cursor=cursor)
 
 def get_provincia(db: Session, provincia_id: int):
     """Obtiene una provincia específica por su ID."""
@@ -703,6 +118,7 @@ def create_provincia(db: Session, provincia: schemas.ProvinciaCreate):
     db_provincia = models.Provincia(nombre=nombre_normalizado)
     try:
         db.add(db_provincia)
+        versiones.incrementar(db, "provincia")
         db.commit()
         db.refresh(db_provincia)
     except IntegrityError:
@@ -726,8 +142,10 @@ def update_provincia(db: Session, provincia_id: int, provincia: schemas.Provinci
 
     # Actualizar la provincia
     db_provincia.nombre = nombre_normalizado
+    versiones.incrementar(db, "provincia")
     db.commit()
     db.refresh(db_provincia)
+    _invalidar_catalogo("provincia", provincia_id)
     
     return db_provincia
 
@@ -739,15 +157,17 @@ def delete_provincia(db: Session, provincia_id: int):
 
     # Eliminar la provincia
     db.delete(db_provincia)
+    versiones.incrementar(db, "provincia", "municipio")
     db.commit()
+    _invalidar_catalogo("provincia", provincia_id, eliminado=True)
     
     return {"detail": f"Provincia '{db_provincia.nombre}' eliminada exitosamente."}
 
 
 # --- CRUD para Municipio ---
-def get_municipios(db: Session, skip: int = 0, limit: int = 100):
-    """Obtiene una lista de municipios con paginación."""
-    return db.query(models.Municipio).offset(skip).limit(limit).all()
+def get_municipios(db: Session, skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    """Obtiene una lista de municipios con paginación por offset o por cursor."""
+    return paginate(db.query(models.Municipio), models.Municipio.id_municipio, skip=skip, limit=limit, cursor=cursor)
 
 def get_municipio(db: Session, municipio_id: int):
     """Obtiene un municipio específico por su ID."""
@@ -778,6 +198,7 @@ def create_municipio(db: Session, municipio: schemas.MunicipioCreate):
     )
     try:
         db.add(db_municipio)
+        versiones.incrementar(db, "municipio")
         db.commit()
         db.refresh(db_municipio)
     except IntegrityError:
@@ -809,8 +230,10 @@ def update_municipio(db: Session, municipio_id: int, municipio: schemas.Municipi
     db_municipio.latitude = municipio.latitude
     db_municipio.longitude = municipio.longitude
 
+    versiones.incrementar(db, "municipio")
     db.commit()
     db.refresh(db_municipio)
+    _invalidar_catalogo("municipio", municipio_id)
     return db_municipio
 
 def delete_municipio(db: Session, municipio_id: int):
@@ -821,16 +244,18 @@ def delete_municipio(db: Session, municipio_id: int):
     
     # Eliminar el municipio
     db.delete(db_municipio)
+    versiones.incrementar(db, "municipio")
     db.commit()
+    _invalidar_catalogo("municipio", municipio_id, eliminado=True)
     
     return {"detail": f"Municipio '{db_municipio.nombre}' eliminado exitosamente."}
 
 
 
 # --- CRUD para Role ---
-def get_roles(db: Session, skip: int = 0, limit: int = 100):
-    """Obtiene una lista de roles con paginación."""
-    return db.query(models.Role).offset(skip).limit(limit).all()
+def get_roles(db: Session, skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    """Obtiene una lista de roles con paginación por offset o por cursor."""
+    return paginate(db.query(models.Role), models.Role.id_role, skip=skip, limit=limit, cursor=cursor)
 
 def get_role(db: Session, role_id: int):
     """Obtiene un rol específico por su ID."""
@@ -861,6 +286,7 @@ def create_role(db: Session, role: schemas.RoleCreate):
 
     try:
         db.add(db_role)
+        versiones.incrementar(db, "role")
         db.commit()
         db.refresh(db_role)
     except IntegrityError:
@@ -894,8 +320,11 @@ def update_role(db: Session, role_id: int, role: schemas.RoleCreate):
     db_role.can_modify_own_relevamientos = role.can_modify_own_relevamientos
     db_role.can_generate_reports = role.can_generate_reports
 
+    versiones.incrementar(db, "role")
     db.commit()
     db.refresh(db_role)
+    _invalidar_catalogo("role", role_id)
+    principales.invalidate_matching(lambda p: p.id_role == role_id)
     return db_role
 
 def delete_role(db: Session, role_id: int):
@@ -906,15 +335,18 @@ def delete_role(db: Session, role_id: int):
     
     # Eliminar el rol
     db.delete(db_role)
+    versiones.incrementar(db, "role")
     db.commit()
+    _invalidar_catalogo("role", role_id, eliminado=True)
+    principales.invalidate_matching(lambda p: p.id_role == role_id)
     
     return {"detail": f"Rol '{db_role.role_name}' eliminado exitosamente."}
 
 
 # --- CRUD para Usuario ---
-def get_usuarios(db: Session, skip: int = 0, limit: int = 100):
-    """Obtiene una lista de usuarios con paginación."""
-    return db.query(models.Usuario).offset(skip).limit(limit).all()
+def get_usuarios(db: Session, skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    """Obtiene una lista de usuarios con paginación por offset o por cursor."""
+    return paginate(db.query(models.Usuario), models.Usuario.id_usuario, skip=skip, limit=limit, cursor=cursor)
 
 def get_usuario(db: Session, usuario_id: int):
     """Obtiene un usuario específico por su ID."""
@@ -935,12 +367,9 @@ def create_usuario(db: Session, usuario: schemas.UsuarioCreate):
         raise HTTPException(status_code=400, detail=f"El correo '{email_normalizado}' ya está en uso.")
 
     # Verificar que el municipio y el rol existen antes de asignarlos
-    municipio = db.query(models.Municipio).filter(models.Municipio.id_municipio == usuario.id_municipio).first()
-    role = db.query(models.Role).filter(models.Role.id_role == usuario.id_role).first()
-    
-    if not municipio:
+    if not _existe(db, models.Municipio.id_municipio, usuario.id_municipio):
         raise HTTPException(status_code=400, detail=f"El municipio con ID {usuario.id_municipio} no existe.")
-    if not role:
+    if not _existe(db, models.Role.id_role, usuario.id_role):
         raise HTTPException(status_code=400, detail=f"El rol con ID {usuario.id_role} no existe.")
 
     # Crear el usuario
@@ -985,13 +414,11 @@ def update_usuario(db: Session, usuario_id: int, usuario: schemas.UsuarioCreate)
 
     # Validar que el municipio y rol existan si se cambian
     if usuario.id_municipio and usuario.id_municipio != db_usuario.id_municipio:
-        municipio = db.query(models.Municipio).filter(models.Municipio.id_municipio == usuario.id_municipio).first()
-        if not municipio:
+        if not _existe(db, models.Municipio.id_municipio, usuario.id_municipio):
             raise HTTPException(status_code=400, detail=f"El municipio con ID {usuario.id_municipio} no existe.")
 
     if usuario.id_role and usuario.id_role != db_usuario.id_role:
-        role = db.query(models.Role).filter(models.Role.id_role == usuario.id_role).first()
-        if not role:
+        if not _existe(db, models.Role.id_role, usuario.id_role):
             raise HTTPException(status_code=400, detail=f"El rol con ID {usuario.id_role} no existe.")
 
     # Actualizar los datos del usuario
@@ -1006,6 +433,7 @@ def update_usuario(db: Session, usuario_id: int, usuario: schemas.UsuarioCreate)
 
     db.commit()
     db.refresh(db_usuario)
+    principales.invalidate_matching(lambda p: p.id_usuario == usuario_id)
     return db_usuario
 
 def delete_usuario(db: Session, usuario_id: int):
@@ -1014,17 +442,22 @@ def delete_usuario(db: Session, usuario_id: int):
     if not db_usuario:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
 
-    # Eliminar el usuario
+    # Eliminar el usuario; sus árboles y mediciones se eliminan en cascada
+    estadisticas.aplicar(db, estadisticas.contar_consulta(db, models.Arbol.id_usuario == usuario_id, signo=-1))
+    arboles_medidos = db.scalars(select(models.Medicion.id_arbol).where(models.Medicion.id_usuario == usuario_id).distinct()).all()
     db.delete(db_usuario)
+    _actualizar_ultima_medicion(db, arboles_medidos)
     db.commit()
+    principales.invalidate_matching(lambda p: p.id_usuario == usuario_id)
+    _invalidar_catalogo("usuario", usuario_id, eliminado=True)
     
     return {"detail": f"Usuario '{db_usuario.email}' eliminado exitosamente."}
 
 
 # --- CRUD para Especie ---
-def get_especies(db: Session, skip: int = 0, limit: int = 100):
-    """Obtiene una lista de especies con paginación."""
-    return db.query(models.Especie).offset(skip).limit(limit).all()
+def get_especies(db: Session, skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    """Obtiene una lista de especies con paginación por offset o por cursor."""
+    return paginate(db.query(models.Especie), models.Especie.id_especie, skip=skip, limit=limit, cursor=cursor)
 
 def get_especie(db: Session, especie_id: int):
     """Obtiene una especie específica por su ID."""
@@ -1098,6 +531,7 @@ def update_especie(db: Session, especie_id: int, especie: schemas.EspecieCreate)
 
     db.commit()
     db.refresh(db_especie)
+    _invalidar_catalogo("especie", especie_id)
     return db_especie
 
 def delete_especie(db: Session, especie_id: int):
@@ -1106,18 +540,142 @@ def delete_especie(db: Session, especie_id: int):
     if not db_especie:
         raise HTTPException(status_code=404, detail="Especie no encontrada")
 
-    # Eliminar la especie
+    # Eliminar la especie; sus árboles se eliminan en cascada y se descuentan del resumen
+    estadisticas.aplicar(db, estadisticas.contar_consulta(db, models.Arbol.id_especie == especie_id, signo=-1))
     db.delete(db_especie)
     db.commit()
+    _invalidar_catalogo("especie", especie_id, eliminado=True)
     
     return {"detail": f"Especie '{db_especie.nombre_cientifico}' eliminada exitosamente."}
 
 
 
 # --- CRUD para Arbol ---
-def get_arboles(db: Session, skip: int = 0, limit: int = 100):
-    """Obtiene una lista de árboles con paginación."""
-    return db.query(models.Arbol).offset(skip).limit(limit).all()
+def normalizar_arbol(arbol: schemas.ArbolCreate) -> dict:
+    """Normaliza los datos de un árbol y calcula su celda geohash."""
+    arbol_data = arbol.dict()
+    arbol_data["calle"] = arbol_data["calle"].strip().title() if arbol_data["calle"] else None
+    arbol_data["barrio"] = arbol_data["barrio"].strip().title() if arbol_data["barrio"] else None
+    arbol_data["identificacion"] = arbol_data["identificacion"].strip() if arbol_data["identificacion"] else None
+    if arbol_data["latitude"] is not None and arbol_data["longitude"] is not None:
+        arbol_data["geohash"] = geo.encode_geohash(arbol_data["latitude"], arbol_data["longitude"])
+    else:
+        arbol_data["geohash"] = None
+    return arbol_data
+
+def filtros_arbol(filtros: Optional[schemas.ArbolFiltro]) -> list:
+    """Traduce los filtros de la consulta de árboles a condiciones SQL; los omitidos no filtran."""
+    condiciones = []
+    if filtros is None:
+        return condiciones
+    if filtros.id_municipio is not None:
+        condiciones.append(models.Arbol.id_municipio == filtros.id_municipio)
+    if filtros.id_especie is not None:
+        condiciones.append(models.Arbol.id_especie == filtros.id_especie)
+    if filtros.requiere_intervencion is not None:
+        condiciones.append(models.Arbol.requiere_intervencion == filtros.requiere_intervencion)
+    if filtros.protegido is not None:
+        condiciones.append(models.Arbol.protegido == filtros.protegido)
+    if filtros.altura is not None:
+        condiciones.append(models.Arbol.altura == filtros.altura)
+    if filtros.fecha_desde is not None:
+        condiciones.append(models.Arbol.fecha_censo >= filtros.fecha_desde)
+    if filtros.fecha_hasta is not None:
+        condiciones.append(models.Arbol.fecha_censo <= filtros.fecha_hasta)
+    return condiciones
+
+def get_arboles(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    filtros: Optional[schemas.ArbolFiltro] = None,
+    con_ultima_medicion: bool = False,
+):
+    """Obtiene una lista de árboles filtrados con paginación por offset o por cursor, opcionalmente con su última medición."""
+    query = db.query(models.Arbol).filter(*filtros_arbol(filtros))
+    if con_ultima_medicion:
+        query = query.options(joinedload(models.Arbol.ultima_medicion))
+    return paginate(query, models.Arbol.id_arbol, skip=skip, limit=limit, cursor=cursor)
+
+# Columnas de los esquemas de lectura, para servir los listados sin pasar por el ORM
+ARBOL_READ_COLUMNS = columnas_esquema(models.Arbol, schemas.ArbolRead)
+MEDICION_READ_COLUMNS = columnas_esquema(models.Medicion, schemas.MedicionRead)
+
+def consulta_filas(columnas: list, pk_column, condiciones, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, campos: Optional[tuple] = None):
+    """Construye la consulta paginada de un listado que se serializa directamente desde las filas, opcionalmente sólo con algunos campos."""
+    if campos:
+        columnas = [columna for columna in columnas if columna.name in campos]
+    return apply_pagination(select(*columnas).where(*condiciones), pk_column, skip=skip, limit=limit, cursor=cursor)
+
+def get_arboles_filas(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    filtros: Optional[schemas.ArbolFiltro] = None,
+    campos: Optional[tuple] = None,
+):
+    """Obtiene una página de árboles filtrados como filas con las columnas de ArbolRead (o sólo las de campos)."""
+    stmt = consulta_filas(ARBOL_READ_COLUMNS, models.Arbol.id_arbol, filtros_arbol(filtros), skip=skip, limit=limit, cursor=cursor, campos=campos)
+    return db.execute(stmt).all()
+
+def _filtro_bbox(min_lat: float, min_lon: float, max_lat: float, max_lon: float):
+    """Construye el filtro espacial: rangos de geohash (índice) más el rectángulo exacto."""
+    # Cada celda se traduce en un rango sobre el índice B-tree de geohash
+    rangos = [models.Arbol.geohash.between(*geo.rango_prefijo(celda)) for celda in geo.cubrir_bbox(min_lat, min_lon, max_lat, max_lon)]
+    return and_(
+        or_(*rangos),
+        models.Arbol.latitude.between(min_lat, max_lat),
+        models.Arbol.longitude.between(min_lon, max_lon),
+    )
+
+def get_arboles_bbox(db: Session, min_lat: float, min_lon: float, max_lat: float, max_lon: float, limit: int = 500):
+    """Obtiene los árboles dentro de un rectángulo usando el índice de geohash."""
+    if min_lat > max_lat or min_lon > max_lon:
+        raise HTTPException(status_code=400, detail="El rectángulo de búsqueda es inválido.")
+
+    return db.query(models.Arbol).filter(
+        _filtro_bbox(min_lat, min_lon, max_lat, max_lon)
+    ).order_by(models.Arbol.id_arbol).limit(limit).all()
+
+def get_arboles_cercanos(db: Session, lat: float, lon: float, radio_m: float, limit: int = 100):
+    """Obtiene los árboles a menos de radio_m metros del punto, ordenados por distancia."""
+    min_lat, min_lon, max_lat, max_lon = geo.bbox_radio(lat, lon, radio_m)
+    # Para medir distancias alcanzan el ID y las coordenadas: no se cargan objetos del ORM
+    candidatos = db.execute(
+        select(models.Arbol.id_arbol, models.Arbol.latitude, models.Arbol.longitude)
+        .where(_filtro_bbox(min_lat, min_lon, max_lat, max_lon))
+    ).all()
+
+    # Filtrar el círculo exacto y ordenar por distancia al punto
+    cercanos = []
+    for id_arbol, latitude, longitude in candidatos:
+        distancia = geo.distancia_m(lat, lon, latitude, longitude)
+        if distancia <= radio_m:
+            cercanos.append((distancia, id_arbol))
+    ids = [id_arbol for _, id_arbol in heapq.nsmallest(limit, cercanos)]
+    if not ids:
+        return []
+
+    # Sólo los `limit` más cercanos se cargan completos, en el orden de la distancia
+    arboles = {arbol.id_arbol: arbol for arbol in db.query(models.Arbol).filter(models.Arbol.id_arbol.in_(ids))}
+    return [arboles[id_arbol] for id_arbol in ids if id_arbol in arboles]
+
+# Columnas públicas de un árbol, en el orden de la exportación
+ARBOL_EXPORT_COLUMNS = [c for c in models.Arbol.__table__.columns if c.name not in ("geohash", "id_ultima_medicion")]
+
+def stream_arboles(db: Session, id_municipio: Optional[int] = None, fecha_desde=None, fecha_hasta=None, yield_per: int = 1000):
+    """Recorre los árboles filtrados con un cursor del lado del servidor, sin materializar objetos ORM."""
+    stmt = (
+        select(*ARBOL_EXPORT_COLUMNS)
+        .where(*filtros_arbol(schemas.ArbolFiltro(id_municipio=id_municipio, fecha_desde=fecha_desde, fecha_hasta=fecha_hasta)))
+        .order_by(models.Arbol.id_arbol)
+    )
+
+    result = db.execute(stmt.execution_options(stream_results=True))
+    for fila in result.yield_per(yield_per).mappings():
+        yield fila
 
 def get_arbol(db: Session, arbol_id: int):
     """Obtiene un árbol específico por su ID."""
@@ -1126,63 +684,138 @@ def get_arbol(db: Session, arbol_id: int):
         raise HTTPException(status_code=404, detail="Árbol no encontrado")
     return db_arbol
 
-def create_arbol(db: Session, arbol: schemas.ArbolCreate):
-    """Crea un nuevo árbol en la base de datos."""
-    # Validar existencia de municipio y especie
-    municipio = db.query(models.Municipio).filter(models.Municipio.id_municipio == arbol.id_municipio).first()
-    especie = db.query(models.Especie).filter(models.Especie.id_especie == arbol.id_especie).first()
+def opciones_detalle_arbol():
+    """Carga ansiosa del árbol completo: una consulta por nivel, sin importar la cantidad de hijos."""
+    return (
+        joinedload(models.Arbol.especie),
+        joinedload(models.Arbol.municipio),
+        selectinload(models.Arbol.mediciones).selectinload(models.Medicion.fotos),
+    )
 
-    if not municipio:
-        raise HTTPException(status_code=400, detail=f"El municipio con ID {arbol.id_municipio} no existe.")
-    if not especie:
-        raise HTTPException(status_code=400, detail=f"La especie con ID {arbol.id_especie} no existe.")
+def get_arboles_detalle(db: Session, skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    """Obtiene árboles con su especie, municipio, mediciones y fotos en un número fijo de consultas."""
+    query = db.query(models.Arbol).options(*opciones_detalle_arbol())
+    return paginate(query, models.Arbol.id_arbol, skip=skip, limit=limit, cursor=cursor)
+
+def get_arbol_detalle(db: Session, arbol_id: int):
+    """Obtiene un árbol con su especie, municipio, mediciones y fotos."""
+    db_arbol = db.query(models.Arbol).options(*opciones_detalle_arbol()).filter(models.Arbol.id_arbol == arbol_id).first()
+    if not db_arbol:
+        raise HTTPException(status_code=404, detail="Árbol no encontrado")
+    return db_arbol
 
+def create_arbol(db: Session, arbol: schemas.ArbolCreate):
+    """Crea un nuevo árbol en la base de datos."""
     # Normalizar datos
-    arbol_data = arbol.dict()
-    arbol_data["calle"] = arbol_data["calle"].strip().title() if arbol_data["calle"] else None
-    arbol_data["barrio"] = arbol_data["barrio"].strip().title() if arbol_data["barrio"] else None
-    arbol_data["identificacion"] = arbol_data["identificacion"].strip() if arbol_data["identificacion"] else None
+    arbol_data = normalizar_arbol(arbol)
 
-    # Crear el árbol
-    db_arbol = models.Arbol(**arbol_data)
+    # Crear el árbol; las FK validan municipio, especie y usuario
     try:
-        db.add(db_arbol)
+        db_arbol = _insertar(db, models.Arbol, arbol_data)
+        estadisticas.aplicar(db, estadisticas.contar([arbol_data]))
         db.commit()
-        db.refresh(db_arbol)
     except IntegrityError:
-        db.rollback()
-        raise HTTPException(status_code=400, detail="Error de integridad al crear el árbol.")
+        raise _error_integridad(db, referencias_arbol(arbol_data), "Error de integridad al crear el árbol.")
 
     return db_arbol
 
+def _ids_existentes(db: Session, columna, ids: set, en_cache: bool = True) -> set:
+    """Devuelve cuáles de los IDs dados existen; los que no están en caché se resuelven con una sola consulta."""
+    cache = catalogos.get(columna.table.name) if en_cache else None
+    existentes = {id_ for id_ in ids if cache and cache.get(id_)}
+    faltantes = ids - existentes
+    if faltantes:
+        for id_ in db.execute(select(columna).where(columna.in_(faltantes))).scalars():
+            if cache:
+                cache.set(id_, True)
+            existentes.add(id_)
+    return existentes
+
+def _detalle_validacion(error: ValidationError) -> str:
+    """Resume los errores de validación de una fila en un solo mensaje."""
+    return "; ".join(f"{'.'.join(str(p) for p in e['loc'])}: {e['msg']}" for e in error.errors())
+
+def create_arboles_bulk(db: Session, filas: Iterable[dict], chunk_size: int = 1000):
+    """Crea árboles en lote: valida cada fila, resuelve las referencias por lote e inserta en transacciones por bloque."""
+    insertados = 0
+    errores = []
+    filas = enumerate(filas, start=1)
+
+    while True:
+        bloque = list(islice(filas, chunk_size))
+        if not bloque:
+            break
+
+        # Validar cada fila contra el esquema de creación
+        validas = []
+        for numero, fila in bloque:
+            try:
+                validas.append((numero, schemas.ArbolCreate(**fila)))
+            except ValidationError as e:
+                errores.append({"fila": numero, "detalle": _detalle_validacion(e)})
+            except TypeError:
+                errores.append({"fila": numero, "detalle": "La fila no es un objeto JSON válido."})
+
+        # Resolver municipios y especies con (a lo sumo) una consulta por tabla
+        municipios_conocidos = _ids_existentes(db, models.Municipio.id_municipio, {a.id_municipio for _, a in validas})
+        especies_conocidas = _ids_existentes(db, models.Especie.id_especie, {a.id_especie for _, a in validas})
+
+        registros = []
+        for numero, arbol in validas:
+            if arbol.id_municipio not in municipios_conocidos:
+                errores.append({"fila": numero, "detalle": f"El municipio con ID {arbol.id_municipio} no existe."})
+            elif arbol.id_especie not in especies_conocidas:
+                errores.append({"fila": numero, "detalle": f"La especie con ID {arbol.id_especie} no existe."})
+            else:
+                registros.append((numero, normalizar_arbol(arbol)))
+        if not registros:
+            continue
+
+        # Insertar el bloque completo con executemany en una sola transacción
+        try:
+            db.execute(insert(models.Arbol), [datos for _, datos in registros])
+            estadisticas.aplicar(db, estadisticas.contar(datos for _, datos in registros))
+            db.commit()
+            insertados += len(registros)
+            continue
+        except IntegrityError:
+            db.rollback()
+
+        # Si el bloque falla, aislar las filas inválidas con savepoints
+        aceptados = []
+        for numero, datos in registros:
+            try:
+                with db.begin_nested():
+                    db.execute(insert(models.Arbol), [datos])
+                aceptados.append(datos)
+            except IntegrityError:
+                errores.append({"fila": numero, "detalle": "Error de integridad al crear el árbol."})
+        estadisticas.aplicar(db, estadisticas.contar(aceptados))
+        db.commit()
+        insertados += len(aceptados)
+
+    return {"insertados": insertados, "errores": errores}
+
 def update_arbol(db: Session, arbol_id: int, arbol: schemas.ArbolCreate):
     """Actualiza un árbol existente por su ID."""
-    db_arbol = db.query(models.Arbol).filter(models.Arbol.id_arbol == arbol_id).first()
-    if not db_arbol:
+    # Sólo las columnas del resumen: hace falta restar sus conteos anteriores
+    anterior = db.execute(
+        select(*[models.Arbol.__table__.c[columna] for columna in estadisticas.COLUMNAS]).where(models.Arbol.id_arbol == arbol_id)
+    ).first()
+    if not anterior:
         raise HTTPException(status_code=404, detail="Árbol no encontrado")
 
-    # Validar que el municipio y la especie existan antes de actualizar
-    if arbol.id_municipio:
-        municipio = db.query(models.Municipio).filter(models.Municipio.id_municipio == arbol.id_municipio).first()
-        if not municipio:
-            raise HTTPException(status_code=400, detail=f"El municipio con ID {arbol.id_municipio} no existe.")
-
-    if arbol.id_especie:
-        especie = db.query(models.Especie).filter(models.Especie.id_especie == arbol.id_especie).first()
-        if not especie:
-            raise HTTPException(status_code=400, detail=f"La especie con ID {arbol.id_especie} no existe.")
-
     # Normalizar datos antes de actualizar
-    arbol_data = arbol.dict()
-    arbol_data["calle"] = arbol_data["calle"].strip().title() if arbol_data["calle"] else None
-    arbol_data["barrio"] = arbol_data["barrio"].strip().title() if arbol_data["barrio"] else None
-    arbol_data["identificacion"] = arbol_data["identificacion"].strip() if arbol_data["identificacion"] else None
+    arbol_data = normalizar_arbol(arbol)
 
-    # Actualizar los campos del árbol
-    for key, value in arbol_data.items():
-        setattr(db_arbol, key, value)
-    db.commit()
-    db.refresh(db_arbol)
+    # Actualizar los campos del árbol y mover sus conteos en el resumen
+    try:
+        db_arbol = _actualizar(db, models.Arbol, arbol_id, {**arbol_data, "version": models.Arbol.version + 1})
+        estadisticas.aplicar(db, estadisticas.diferencia(estadisticas.datos_arbol(anterior), arbol_data))
+        db.commit()
+    except IntegrityError:
+        raise _error_integridad(db, referencias_arbol(arbol_data), "Error de integridad al actualizar el árbol.")
+    _invalidar_catalogo("arbol", arbol_id)
     return db_arbol
 
 def delete_arbol(db: Session, arbol_id: int):
@@ -1191,17 +824,85 @@ def delete_arbol(db: Session, arbol_id: int):
     if not db_arbol:
         raise HTTPException(status_code=404, detail="Árbol no encontrado")
 
-    # Eliminar el árbol
+    # Eliminar el árbol y descontarlo del resumen
     db.delete(db_arbol)
+    estadisticas.aplicar(db, estadisticas.contar([estadisticas.datos_arbol(db_arbol)], signo=-1))
     db.commit()
+    _invalidar_catalogo("arbol", arbol_id, eliminado=True)
     
     return {"detail": f"Árbol con ID {arbol_id} eliminado exitosamente."}
 
 
+def get_estadisticas_municipio(db: Session, municipio_id: int):
+    """Obtiene los conteos de árboles de un municipio por especie, altura e intervención."""
+    if not _existe(db, models.Municipio.id_municipio, municipio_id):
+        raise HTTPException(status_code=404, detail="Municipio no encontrado")
+
+    resumen = {dimension: {} for dimension in estadisticas.DIMENSIONES}
+    filas = db.query(models.EstadisticaMunicipio).filter(
+        models.EstadisticaMunicipio.id_municipio == municipio_id,
+        models.EstadisticaMunicipio.cantidad > 0,
+    )
+    for fila in filas:
+        resumen[fila.dimension][fila.valor] = fila.cantidad
+    return {"id_municipio": municipio_id, "total": sum(resumen["altura"].values()), **resumen}
+
+
 # --- CRUD para Medición ---
-def get_mediciones(db: Session, skip: int = 0, limit: int = 100):
-    """Obtiene una lista de mediciones con paginación."""
-    return db.query(models.Medicion).offset(skip).limit(limit).all()
+def _actualizar_ultima_medicion(db: Session, arbol_ids: Iterable[int]):
+    """Recalcula el puntero a la medición más reciente de los árboles indicados, en una sola sentencia."""
+    arbol_ids = set(arbol_ids)
+    if not arbol_ids:
+        return
+    db.flush()
+    # Subconsulta correlacionada: cada árbol la resuelve con el índice (id_arbol, fecha_medicion)
+    ultima = (
+        select(models.Medicion.id_medicion)
+        .where(models.Medicion.id_arbol == models.Arbol.id_arbol)
+        .order_by(models.Medicion.fecha_medicion.desc(), models.Medicion.id_medicion.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    db.execute(
+        update(models.Arbol)
+        .where(models.Arbol.id_arbol.in_(arbol_ids))
+        .values(id_ultima_medicion=ultima, version=models.Arbol.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+def filtros_medicion(filtros: Optional[schemas.MedicionFiltro]) -> list:
+    """Traduce los filtros de la consulta de mediciones a condiciones SQL; los omitidos no filtran."""
+    condiciones = []
+    if filtros is None:
+        return condiciones
+    if filtros.id_arbol is not None:
+        condiciones.append(models.Medicion.id_arbol == filtros.id_arbol)
+    if filtros.id_usuario is not None:
+        condiciones.append(models.Medicion.id_usuario == filtros.id_usuario)
+    if filtros.requiere_intervencion is not None:
+        condiciones.append(models.Medicion.requiere_intervencion == filtros.requiere_intervencion)
+    if filtros.fecha_desde is not None:
+        condiciones.append(models.Medicion.fecha_medicion >= filtros.fecha_desde)
+    if filtros.fecha_hasta is not None:
+        condiciones.append(models.Medicion.fecha_medicion <= filtros.fecha_hasta)
+    return condiciones
+
+def get_mediciones(db: Session, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, filtros: Optional[schemas.MedicionFiltro] = None):
+    """Obtiene una lista de mediciones filtradas con paginación por offset o por cursor."""
+    query = db.query(models.Medicion).filter(*filtros_medicion(filtros))
+    return paginate(query, models.Medicion.id_medicion, skip=skip, limit=limit, cursor=cursor)
+
+def get_mediciones_filas(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    filtros: Optional[schemas.MedicionFiltro] = None,
+    campos: Optional[tuple] = None,
+):
+    """Obtiene una página de mediciones filtradas como filas con las columnas de MedicionRead (o sólo las de campos)."""
+    stmt = consulta_filas(MEDICION_READ_COLUMNS, models.Medicion.id_medicion, filtros_medicion(filtros), skip=skip, limit=limit, cursor=cursor, campos=campos)
+    return db.execute(stmt).all()
 
 def get_medicion(db: Session, medicion_id: int):
     """Obtiene una medición específica por su ID."""
@@ -1210,61 +911,49 @@ def get_medicion(db: Session, medicion_id: int):
         raise HTTPException(status_code=404, detail="Medición no encontrada")
     return db_medicion
 
+def normalizar_medicion(medicion: schemas.MedicionCreate) -> dict:
+    """Normaliza los datos de una medición antes de guardarla."""
+    medicion_data = medicion.dict(include=set(schemas.MedicionCreate.model_fields))
+    medicion_data["tratamiento_previo"] = medicion_data["tratamiento_previo"].strip().title() if medicion_data["tratamiento_previo"] else None
+    medicion_data["cazuela"] = medicion_data["cazuela"].strip().title() if medicion_data["cazuela"] else None
+    return medicion_data
+
 def create_medicion(db: Session, medicion: schemas.MedicionCreate):
     """Crea una nueva medición en la base de datos."""
-    # Validar que el árbol y el usuario existan antes de crear la medición
-    arbol = db.query(models.Arbol).filter(models.Arbol.id_arbol == medicion.id_arbol).first()
-    usuario = db.query(models.Usuario).filter(models.Usuario.id_usuario == medicion.id_usuario).first()
-
-    if not arbol:
-        raise HTTPException(status_code=400, detail=f"El árbol con ID {medicion.id_arbol} no existe.")
-    if not usuario:
-        raise HTTPException(status_code=400, detail=f"El usuario con ID {medicion.id_usuario} no existe.")
-
     # Normalizar datos antes de crear la medición
-    medicion_data = medicion.dict()
-    medicion_data["tratamiento_previo"] = medicion_data["tratamiento_previo"].strip().title() if medicion_data["tratamiento_previo"] else None
-    medicion_data["cazuela"] = medicion_data["cazuela"].strip().title() if medicion_data["cazuela"] else None
+    medicion_data = normalizar_medicion(medicion)
 
-    # Crear la medición
-    db_medicion = models.Medicion(**medicion_data)
+    # Crear la medición; las FK validan el árbol y el usuario
     try:
-        db.add(db_medicion)
+        db_medicion = _insertar(db, models.Medicion, medicion_data)
+        _actualizar_ultima_medicion(db, [db_medicion.id_arbol])
         db.commit()
-        db.refresh(db_medicion)
     except IntegrityError:
-        db.rollback()
-        raise HTTPException(status_code=400, detail="Error de integridad al crear la medición.")
+        raise _error_integridad(db, referencias_medicion(medicion_data), "Error de integridad al crear la medición.")
 
     return db_medicion
 
 def update_medicion(db: Session, medicion_id: int, medicion: schemas.MedicionCreate):
     """Actualiza una medición existente por su ID."""
-    db_medicion = db.query(models.Medicion).filter(models.Medicion.id_medicion == medicion_id).first()
-    if not db_medicion:
+    # El árbol anterior también recalcula su última medición si la medición cambia de árbol
+    arbol_anterior = db.execute(select(models.Medicion.id_arbol).where(models.Medicion.id_medicion == medicion_id)).scalar()
+    if arbol_anterior is None:
         raise HTTPException(status_code=404, detail="Medición no encontrada")
 
-    # Validar que el árbol y el usuario existan antes de actualizar
-    if medicion.id_arbol:
-        arbol = db.query(models.Arbol).filter(models.Arbol.id_arbol == medicion.id_arbol).first()
-        if not arbol:
-            raise HTTPException(status_code=400, detail=f"El árbol con ID {medicion.id_arbol} no existe.")
-
-    if medicion.id_usuario:
-        usuario = db.query(models.Usuario).filter(models.Usuario.id_usuario == medicion.id_usuario).first()
-        if not usuario:
-            raise HTTPException(status_code=400, detail=f"El usuario con ID {medicion.id_usuario} no existe.")
-
     # Normalizar datos antes de actualizar la medición
-    medicion_data = medicion.dict()
-    medicion_data["tratamiento_previo"] = medicion_data["tratamiento_previo"].strip().title() if medicion_data["tratamiento_previo"] else None
-    medicion_data["cazuela"] = medicion_data["cazuela"].strip().title() if medicion_data["cazuela"] else None
+    medicion_data = normalizar_medicion(medicion)
 
-    # Actualizar los campos de la medición
-    for key, value in medicion_data.items():
-        setattr(db_medicion, key, value)
-    db.commit()
-    db.refresh(db_medicion)
+    # Actualizar los campos de la medición; puede cambiar de árbol o de fecha
+    try:
+        db_medicion = _actualizar(db, models.Medicion, medicion_id, medicion_data)
+        if not db_medicion:
+            # Se eliminó entre la consulta del árbol anterior y el UPDATE
+            db.rollback()
+            raise HTTPException(status_code=404, detail="Medición no encontrada")
+        _actualizar_ultima_medicion(db, [arbol_anterior, db_medicion.id_arbol])
+        db.commit()
+    except IntegrityError:
+        raise _error_integridad(db, referencias_medicion(medicion_data), "Error de integridad al actualizar la medición.")
     return db_medicion
 
 def delete_medicion(db: Session, medicion_id: int):
@@ -1273,17 +962,18 @@ def delete_medicion(db: Session, medicion_id: int):
     if not db_medicion:
         raise HTTPException(status_code=404, detail="Medición no encontrada")
 
-    # Eliminar la medición
+    # Eliminar la medición y apuntar el árbol a la anterior
     db.delete(db_medicion)
+    _actualizar_ultima_medicion(db, [db_medicion.id_arbol])
     db.commit()
     
     return {"detail": f"Medición con ID {medicion_id} eliminada exitosamente."}
 
 
 # --- CRUD para Foto ---
-def get_fotos(db: Session, skip: int = 0, limit: int = 100):
-    """Obtiene una lista de fotos con paginación."""
-    return db.query(models.Foto).offset(skip).limit(limit).all()
+def get_fotos(db: Session, skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    """Obtiene una lista de fotos con paginación por offset o por cursor."""
+    return paginate(db.query(models.Foto), models.Foto.id_foto, skip=skip, limit=limit, cursor=cursor)
 
 def get_foto(db: Session, foto_id: int):
     """Obtiene una foto específica por su ID."""
@@ -1292,20 +982,51 @@ def get_foto(db: Session, foto_id: int):
         raise HTTPException(status_code=404, detail="Foto no encontrada")
     return db_foto
 
-def create_foto(db: Session, foto: schemas.FotoCreate):
-    """Crea una nueva foto asociada a una medición."""
-    # Validar que la medición asociada exista
-    medicion = db.query(models.Medicion).filter(models.Medicion.id_medicion == foto.id_medicion).first()
-    if not medicion:
-        raise HTTPException(status_code=400, detail=f"La medición con ID {foto.id_medicion} no existe.")
-
-    # Normalizar datos antes de insertar
+def normalizar_foto(foto: schemas.FotoCreate) -> dict:
+    """Normaliza los datos de una foto antes de guardarla."""
     foto_data = foto.dict()
     foto_data["tipo_foto"] = foto_data["tipo_foto"].strip().title()
     foto_data["ruta_foto"] = foto_data["ruta_foto"].strip()
+    return foto_data
+
+def create_foto(db: Session, foto: schemas.FotoCreate):
+    """Crea una nueva foto asociada a una medición."""
+    # Normalizar datos antes de insertar
+    foto_data = normalizar_foto(foto)
+
+    # Crear la foto; la FK valida la medición
+    try:
+        db_foto = _insertar(db, models.Foto, foto_data)
+        db.commit()
+    except IntegrityError:
+        raise _error_integridad(db, referencias_foto(foto_data), "Error de integridad al crear la foto.")
+
+    return db_foto
+
+def create_foto_archivo(db: Session, id_medicion: int, tipo_foto: str, archivo: BinaryIO, content_type: Optional[str]):
+    """Guarda la imagen en el almacén y registra la foto; devuelve (foto, creada), reutilizando la foto si la medición ya tiene ese contenido."""
+    if not content_type or not content_type.startswith("image/"):
+        raise HTTPException(status_code=415, detail="El archivo debe ser una imagen.")
+    if not db.query(models.Medicion.id_medicion).filter(models.Medicion.id_medicion == id_medicion).first():
+        raise HTTPException(status_code=400, detail=f"La medición con ID {id_medicion} no existe.")
 
-    # Crear la foto
-    db_foto = models.Foto(**foto_data)
+    try:
+        sha256, tamano = almacen.guardar(archivo)
+    except ArchivoDemasiadoGrande:
+        raise HTTPException(status_code=413, detail="La foto supera el tamaño máximo permitido.")
+
+    existente = db.query(models.Foto).filter(models.Foto.id_medicion == id_medicion, models.Foto.sha256 == sha256).first()
+    if existente:
+        return existente, False
+
+    db_foto = models.Foto(
+        id_medicion=id_medicion,
+        tipo_foto=tipo_foto.strip().title(),
+        ruta_foto=almacen.ruta(sha256).relative_to(almacen.raiz).as_posix(),
+        sha256=sha256,
+        tamano_bytes=tamano,
+        content_type=content_type,
+    )
     try:
         db.add(db_foto)
         db.commit()
@@ -1314,30 +1035,23 @@ def create_foto(db: Session, foto: schemas.FotoCreate):
         db.rollback()
         raise HTTPException(status_code=400, detail="Error de integridad al crear la foto.")
 
-    return db_foto
+    # Miniaturas en segundo plano; la respuesta no las espera
+    derivados.programar(sha256)
+    return db_foto, True
 
 def update_foto(db: Session, foto_id: int, foto: schemas.FotoCreate):
     """Actualiza una foto existente por su ID."""
-    db_foto = db.query(models.Foto).filter(models.Foto.id_foto == foto_id).first()
-    if not db_foto:
-        raise HTTPException(status_code=404, detail="Foto no encontrada")
-
-    # Validar que la medición asociada exista si se cambia
-    if foto.id_medicion and foto.id_medicion != db_foto.id_medicion:
-        medicion = db.query(models.Medicion).filter(models.Medicion.id_medicion == foto.id_medicion).first()
-        if not medicion:
-            raise HTTPException(status_code=400, detail=f"La medición con ID {foto.id_medicion} no existe.")
-
     # Normalizar datos antes de actualizar
-    foto_data = foto.dict()
-    foto_data["tipo_foto"] = foto_data["tipo_foto"].strip().title()
-    foto_data["ruta_foto"] = foto_data["ruta_foto"].strip()
+    foto_data = normalizar_foto(foto)
 
-    # Actualizar los campos de la foto
-    for key, value in foto_data.items():
-        setattr(db_foto, key, value)
-    db.commit()
-    db.refresh(db_foto)
+    # Actualizar los campos de la foto; la FK valida la medición
+    try:
+        db_foto = _actualizar(db, models.Foto, foto_id, foto_data)
+        db.commit()
+    except IntegrityError:
+        raise _error_integridad(db, referencias_foto(foto_data), "Error de integridad al actualizar la foto.")
+    if not db_foto:
+        raise HTTPException(status_code=404, detail="Foto no encontrada")
     return db_foto
 
 def delete_foto(db: Session, foto_id: int):
@@ -1346,12 +1060,104 @@ def delete_foto(db: Session, foto_id: int):
     if not db_foto:
         raise HTTPException(status_code=404, detail="Foto no encontrada")
 
-    # Eliminar la foto
+    # Eliminar la foto y, si nadie más lo usa, su archivo del almacén
     db.delete(db_foto)
     db.commit()
+    if db_foto.sha256 and not db.query(models.Foto.id_foto).filter(models.Foto.sha256 == db_foto.sha256).first():
+        almacen.eliminar(db_foto.sha256)
+        for tamano in derivados.TAMANOS:
+            almacen.eliminar(derivados.clave_derivado(db_foto.sha256, tamano))
     
     return {"detail": f"Foto con ID {foto_id} eliminada exitosamente."}
 
+# --- Sincronización de dispositivos ---
+def _claves_existentes(db: Session, columna_clave, columna_id, claves: set) -> dict:
+    """Devuelve {clave_sync: id} de los registros ya sincronizados, con una sola consulta."""
+    if not claves:
+        return {}
+    return dict(db.execute(select(columna_clave, columna_id).where(columna_clave.in_(claves))).all())
+
+def _sync_lote(db: Session, lote: schemas.SyncLote) -> dict:
+    errores = []
+    creadas = 0
+
+    # Mediciones: las claves ya conocidas son repeticiones y no se vuelven a escribir
+    mediciones = _claves_existentes(db, models.Medicion.clave_sync, models.Medicion.id_medicion, {m.clave for m in lote.mediciones})
+    nuevas = {m.clave: m for m in lote.mediciones if m.clave not in mediciones}
+    # Las referencias se comprueban contra la base y no la caché: un positivo obsoleto haría fallar todo el lote por la FK
+    arboles = _ids_existentes(db, models.Arbol.id_arbol, {m.id_arbol for m in nuevas.values()}, en_cache=False)
+    usuarios = _ids_existentes(db, models.Usuario.id_usuario, {m.id_usuario for m in nuevas.values() if m.id_usuario is not None}, en_cache=False)
+
+    filas = []
+    for clave, medicion in nuevas.items():
+        if medicion.id_arbol not in arboles:
+            errores.append({"clave": clave, "detalle": f"El árbol con ID {medicion.id_arbol} no existe."})
+        elif medicion.id_usuario is not None and medicion.id_usuario not in usuarios:
+            errores.append({"clave": clave, "detalle": f"El usuario con ID {medicion.id_usuario} no existe."})
+        elif medicion.fecha_medicion is None:
+            errores.append({"clave": clave, "detalle": "La medición no tiene fecha_medicion."})
+        else:
+            filas.append({**normalizar_medicion(medicion), "clave_sync": clave})
+    if filas:
+        # executemany con RETURNING: los IDs nuevos sirven para resolver las fotos del mismo lote
+        insertadas = db.execute(
+            insert(models.Medicion).returning(models.Medicion.clave_sync, models.Medicion.id_medicion), filas
+        ).all()
+        mediciones.update(dict(insertadas))
+        creadas += len(insertadas)
+        _actualizar_ultima_medicion(db, {fila["id_arbol"] for fila in filas})
+
+    # Fotos: pueden referirse a una medición por ID o por la clave con que se sincronizó
+    fotos = _claves_existentes(db, models.Foto.clave_sync, models.Foto.id_foto, {f.clave for f in lote.fotos})
+    nuevas_fotos = {f.clave: f for f in lote.fotos if f.clave not in fotos}
+    claves_externas = {f.clave_medicion for f in nuevas_fotos.values() if f.clave_medicion and f.clave_medicion not in mediciones}
+    mediciones.update(_claves_existentes(db, models.Medicion.clave_sync, models.Medicion.id_medicion, claves_externas))
+    ids_medicion = {f.id_medicion for f in nuevas_fotos.values() if not f.clave_medicion and f.id_medicion is not None}
+    mediciones_por_id = _ids_existentes(db, models.Medicion.id_medicion, ids_medicion, en_cache=False)
+
+    filas = []
+    for foto in nuevas_fotos.values():
+        if foto.clave_medicion:
+            id_medicion = mediciones.get(foto.clave_medicion)
+        else:
+            id_medicion = foto.id_medicion if foto.id_medicion in mediciones_por_id else None
+        if id_medicion is None:
+            errores.append({"clave": foto.clave, "detalle": "La medición de la foto no existe."})
+            continue
+        filas.append({
+            "id_medicion": id_medicion,
+            "tipo_foto": foto.tipo_foto.strip().title(),
+            "ruta_foto": foto.ruta_foto.strip(),
+            "clave_sync": foto.clave,
+        })
+    if filas:
+        insertadas = db.execute(insert(models.Foto).returning(models.Foto.clave_sync, models.Foto.id_foto), filas).all()
+        fotos.update(dict(insertadas))
+        creadas += len(insertadas)
+
+    db.commit()
+    repetidas = len({m.clave for m in lote.mediciones}) - len(nuevas) + len({f.clave for f in lote.fotos}) - len(nuevas_fotos)
+    return {
+        "mediciones": {m.clave: mediciones[m.clave] for m in lote.mediciones if m.clave in mediciones},
+        "fotos": {f.clave: fotos[f.clave] for f in lote.fotos if f.clave in fotos},
+        "creadas": creadas,
+        "repetidas": repetidas,
+        "errores": errores,
+    }
+
+def sync_lote(db: Session, lote: schemas.SyncLote):
+    """Sincroniza en una transacción las mediciones y fotos encoladas por un dispositivo; las claves ya vistas no se repiten."""
+    try:
+        return _sync_lote(db, lote)
+    except IntegrityError:
+        # Las referencias ya se validaron en la transacción: el conflicto es otro envío del mismo lote escribiendo las mismas claves
+        db.rollback()
+    try:
+        return _sync_lote(db, lote)
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Conflicto al sincronizar el lote.")
+
 def get_user_by_email(db: Session, email: str):
     """Obtiene un usuario específico por su email."""
     return db.query(models.Usuario).filter(models.Usuario.email == email).first()
\ No newline at end of file
@@ -0,0 +1,149 @@
+from typing import Optional
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from . import crud, models, schemas
+from .pagination import apply_pagination
+
+# Versiones asíncronas de las lecturas de crud.py, para el modo ASYNC_DATABASE.
+# Reutilizan los filtros y las consultas del CRUD síncrono; las escrituras (y el
+# resumen de estadisticas.py que mantienen) se hacen sólo en crud.py.
+
+
+# --- Utilidades ---
+async def _listar(db: AsyncSession, modelo, pk_column, skip: int, limit: int, cursor: Optional[str], opciones=(), condiciones=()):
+    stmt = apply_pagination(select(modelo).options(*opciones).where(*condiciones), pk_column, skip=skip, limit=limit, cursor=cursor)
+    return (await db.execute(stmt)).scalars().all()
+
+async def _obtener(db: AsyncSession, modelo, pk_column, id_: int, mensaje_404: str, opciones=()):
+    resultado = await db.execute(select(modelo).options(*opciones).where(pk_column == id_))
+    registro = resultado.scalars().first()
+    if not registro:
+        raise HTTPException(status_code=404, detail=mensaje_404)
+    return registro
+
+
+# --- Provincia ---
+async def get_provincias(db: AsyncSession, skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    """Obtiene una lista de provincias con paginación por offset o por cursor."""
+    return await _listar(db, models.Provincia, models.Provincia.id_provincia, skip, limit, cursor)
+
+async def get_provincia(db: AsyncSession, provincia_id: int):
+    """Obtiene una provincia específica por su ID."""
+    return await _obtener(db, models.Provincia, models.Provincia.id_provincia, provincia_id, "Provincia no encontrada")
+
+
+# --- Municipio ---
+async def get_municipios(db: AsyncSession, skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    """Obtiene una lista de municipios con paginación por offset o por cursor."""
+    return await _listar(db, models.Municipio, models.Municipio.id_municipio, skip, limit, cursor)
+
+async def get_municipio(db: AsyncSession, municipio_id: int):
+    """Obtiene un municipio específico por su ID."""
+    return await _obtener(db, models.Municipio, models.Municipio.id_municipio, municipio_id, "Municipio no encontrado")
+
+
+# --- Role ---
+async def get_roles(db: AsyncSession, skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    """Obtiene una lista de roles con paginación por offset o por cursor."""
+    return await _listar(db, models.Role, models.Role.id_role, skip, limit, cursor)
+
+async def get_role(db: AsyncSession, role_id: int):
+    """Obtiene un rol específico por su ID."""
+    return await _obtener(db, models.Role, models.Role.id_role, role_id, "Rol no encontrado")
+
+
+# --- Usuario ---
+async def get_usuarios(db: AsyncSession, skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    """Obtiene una lista de usuarios con paginación por offset o por cursor."""
+    return await _listar(db, models.Usuario, models.Usuario.id_usuario, skip, limit, cursor)
+
+async def get_usuario(db: AsyncSession, usuario_id: int):
+    """Obtiene un usuario específico por su ID."""
+    return await _obtener(db, models.Usuario, models.Usuario.id_usuario, usuario_id, "Usuario no encontrado")
+
+async def get_user_by_email(db: AsyncSession, email: str):
+    """Obtiene un usuario específico por su email."""
+    resultado = await db.execute(select(models.Usuario).where(models.Usuario.email == email))
+    return resultado.scalars().first()
+
+
+# --- Especie ---
+async def get_especies(db: AsyncSession, skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    """Obtiene una lista de especies con paginación por offset o por cursor."""
+    return await _listar(db, models.Especie, models.Especie.id_especie, skip, limit, cursor)
+
+async def get_especie(db: AsyncSession, especie_id: int):
+    """Obtiene una especie específica por su ID."""
+    return await _obtener(db, models.Especie, models.Especie.id_especie, especie_id, "Especie no encontrada")
+
+
+# --- Arbol ---
+async def get_arboles(
+    db: AsyncSession,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    filtros: Optional[schemas.ArbolFiltro] = None,
+    con_ultima_medicion: bool = False,
+):
+    """Obtiene una lista de árboles filtrados con paginación por offset o por cursor, opcionalmente con su última medición."""
+    opciones = (joinedload(models.Arbol.ultima_medicion),) if con_ultima_medicion else ()
+    return await _listar(db, models.Arbol, models.Arbol.id_arbol, skip, limit, cursor, opciones, crud.filtros_arbol(filtros))
+
+async def get_arboles_filas(
+    db: AsyncSession,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    filtros: Optional[schemas.ArbolFiltro] = None,
+    campos: Optional[tuple] = None,
+):
+    """Obtiene una página de árboles filtrados como filas con las columnas de ArbolRead (o sólo las de campos)."""
+    stmt = crud.consulta_filas(crud.ARBOL_READ_COLUMNS, models.Arbol.id_arbol, crud.filtros_arbol(filtros), skip=skip, limit=limit, cursor=cursor, campos=campos)
+    return (await db.execute(stmt)).all()
+
+async def get_arbol(db: AsyncSession, arbol_id: int):
+    """Obtiene un árbol específico por su ID."""
+    return await _obtener(db, models.Arbol, models.Arbol.id_arbol, arbol_id, "Árbol no encontrado")
+
+async def get_arboles_detalle(db: AsyncSession, skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    """Obtiene árboles con su especie, municipio, mediciones y fotos en un número fijo de consultas."""
+    return await _listar(db, models.Arbol, models.Arbol.id_arbol, skip, limit, cursor, crud.opciones_detalle_arbol())
+
+async def get_arbol_detalle(db: AsyncSession, arbol_id: int):
+    """Obtiene un árbol con su especie, municipio, mediciones y fotos."""
+    return await _obtener(db, models.Arbol, models.Arbol.id_arbol, arbol_id, "Árbol no encontrado", crud.opciones_detalle_arbol())
+
+
+# --- Medición ---
+async def get_mediciones(db: AsyncSession, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, filtros: Optional[schemas.MedicionFiltro] = None):
+    """Obtiene una lista de mediciones filtradas con paginación por offset o por cursor."""
+    return await _listar(db, models.Medicion, models.Medicion.id_medicion, skip, limit, cursor, condiciones=crud.filtros_medicion(filtros))
+
+async def get_mediciones_filas(
+    db: AsyncSession,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    filtros: Optional[schemas.MedicionFiltro] = None,
+    campos: Optional[tuple] = None,
+):
+    """Obtiene una página de mediciones filtradas como filas con las columnas de MedicionRead (o sólo las de campos)."""
+    stmt = crud.consulta_filas(crud.MEDICION_READ_COLUMNS, models.Medicion.id_medicion, crud.filtros_medicion(filtros), skip=skip, limit=limit, cursor=cursor, campos=campos)
+    return (await db.execute(stmt)).all()
+
+async def get_medicion(db: AsyncSession, medicion_id: int):
+    """Obtiene una medición específica por su ID."""
+    return await _obtener(db, models.Medicion, models.Medicion.id_medicion, medicion_id, "Medición no encontrada")
+
+
+# --- Foto ---
+async def get_fotos(db: AsyncSession, skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    """Obtiene una lista de fotos con paginación por offset o por cursor."""
+    return await _listar(db, models.Foto, models.Foto.id_foto, skip, limit, cursor)
+
+async def get_foto(db: AsyncSession, foto_id: int):
+    """Obtiene una foto específica por su ID."""
+    return await _obtener(db, models.Foto, models.Foto.id_foto, foto_id, "Foto no encontrada")
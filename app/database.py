@@ -1,17 +1,244 @@
+import itertools
+import logging
+import threading
+import time
+
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from starlette.requests import Request
+from starlette.responses import Response
+
+from .pool_metrics import InstrumentedQueuePool, instrument_engine
+from .query_metrics import SQL_METRICS, instrument_queries
+
+from decouple import Csv, config
+
+# Modo asíncrono opcional (asyncpg para PostgreSQL, aiosqlite para SQLite)
+ASYNC_DATABASE = config("ASYNC_DATABASE", default=False, cast=bool)
+
+# Drivers asíncronos equivalentes a cada driver síncrono
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+# Réplicas de lectura opcionales: los GET se reparten entre ellas y las escrituras van a la primaria
+DATABASE_REPLICA_URLS = config("DATABASE_REPLICA_URLS", default="", cast=Csv())
+# Segundos que una réplica que no responde queda fuera de la rotación
+REPLICA_RETRY_SECONDS = config("REPLICA_RETRY_SECONDS", default=30, cast=float)
+# Segundos que un cliente lee de la primaria después de escribir, para ver sus propios cambios
+REPLICA_STICKY_SECONDS = config("REPLICA_STICKY_SECONDS", default=5, cast=float)
+
+# Cookie que fija la lectura en la primaria tras una escritura, y cabecera para pedirlo explícitamente
+PRIMARY_COOKIE = "read_primary_until"
+PRIMARY_HEADER = "X-Read-Primary"
+
+logger = logging.getLogger(__name__)
+
+# Configuración del pool de conexiones (no aplica a SQLite)
+DB_POOL_SIZE = config("DB_POOL_SIZE", default=5, cast=int)
+DB_MAX_OVERFLOW = config("DB_MAX_OVERFLOW", default=10, cast=int)
+DB_POOL_TIMEOUT = config("DB_POOL_TIMEOUT", default=30, cast=float)
+DB_POOL_RECYCLE = config("DB_POOL_RECYCLE", default=-1, cast=int)
+DB_POOL_PRE_PING = config("DB_POOL_PRE_PING", default=False, cast=bool)
+
+
+def pool_options(url: str, instrumented: bool = False) -> dict:
+    """Opciones de pool para create_engine según el motor de la URL."""
+    if url.startswith("sqlite"):
+        return {}
+    opciones = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    if instrumented:
+        # Mide la espera de cada checkout; el motor asíncrono usa su propio pool
+        opciones["poolclass"] = InstrumentedQueuePool
+    return opciones
+
+
+def sqlite_foreign_keys(engine):
+    """En SQLite activa las FK en cada conexión: crud delega en ellas la existencia de las referencias."""
+    if engine.dialect.name == "sqlite":
+        @event.listens_for(engine, "connect")
+        def _activar(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA foreign_keys=ON")
+            cursor.close()
+    return engine
+
+
+# Los motores se crean en el primer uso (el lifespan de la app, un worker o un script),
+# no al importar el módulo: importar la app no lee DATABASE_URL ni prepara conexiones.
+_motores = {}
+_motores_lock = threading.Lock()
 
-# Leer la URL de la base de datos desde el .env
-from decouple import config
 
-DATABASE_URL = config("DATABASE_URL")
+def database_url() -> str:
+    """Lee la URL de la base de datos desde el entorno o el .env."""
+    return config("DATABASE_URL")
+
+
+def get_engine():
+    """Devuelve el motor síncrono, creándolo la primera vez."""
+    if "sync" not in _motores:
+        with _motores_lock:
+            if "sync" not in _motores:
+                url = database_url()
+                motor = create_engine(url, **pool_options(url, instrumented=True))
+                sqlite_foreign_keys(motor)
+                instrument_engine(motor)
+                if SQL_METRICS:
+                    instrument_queries(motor)
+                _motores["sync"] = motor
+    return _motores["sync"]
+
+
+class LazySessionmaker(sessionmaker):
+    """sessionmaker que se enlaza al motor al crear la primera sesión."""
+
+    def __call__(self, **local_kw):
+        if self.kw.get("bind") is None and "bind" not in local_kw:
+            self.configure(bind=get_engine())
+        return super().__call__(**local_kw)
 
-# Motor de base de datos
-engine = create_engine(DATABASE_URL)
 
 # Configuración de la sesión
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = LazySessionmaker(autocommit=False, autoflush=False)
+
+class Replicas:
+    """Réplicas de lectura en round-robin; la que falla al conectar queda fuera durante REPLICA_RETRY_SECONDS."""
+
+    def __init__(self, urls: list, retry_seconds: float = REPLICA_RETRY_SECONDS):
+        self.urls = list(urls)
+        self.retry_seconds = retry_seconds
+        self._motores = None
+        self._fabricas_async = None
+        # Índice de réplica → instante hasta el que queda fuera (compartido por los modos síncrono y asíncrono)
+        self._caidas = {}
+        self._turno = itertools.count()
+        self._lock = threading.Lock()
+
+    def motores(self) -> list:
+        """Motores de las réplicas, creados la primera vez (sin abrir conexiones)."""
+        if self._motores is None:
+            with self._lock:
+                if self._motores is None:
+                    motores = []
+                    for url in self.urls:
+                        motor = create_engine(url, **pool_options(url, instrumented=True))
+                        sqlite_foreign_keys(motor)
+                        instrument_engine(motor)
+                        if SQL_METRICS:
+                            instrument_queries(motor)
+                        motores.append(motor)
+                    self._motores = motores
+        return self._motores
+
+    def fabricas_async(self) -> list:
+        """(motor asíncrono, fábrica de sesiones) de cada réplica, en el mismo orden que las URLs."""
+        if self._fabricas_async is None:
+            with self._lock:
+                if self._fabricas_async is None:
+                    self._fabricas_async = [create_async_session_factory(url) for url in self.urls]
+        return self._fabricas_async
+
+    def disponibles(self) -> list:
+        """Índices de las réplicas disponibles, empezando por la siguiente en la rotación."""
+        if not self.urls:
+            return []
+        inicio = next(self._turno) % len(self.urls)
+        ahora = time.monotonic()
+        orden = list(range(inicio, len(self.urls))) + list(range(inicio))
+        return [indice for indice in orden if self._caidas.get(indice, 0) <= ahora]
+
+    def candidatas(self) -> list:
+        """Motores de las réplicas disponibles, empezando por la siguiente en la rotación."""
+        motores = self.motores()
+        return [motores[indice] for indice in self.disponibles()]
+
+    def marcar_caida(self, indice: int) -> None:
+        self._caidas[indice] = time.monotonic() + self.retry_seconds
+        logger.warning("Réplica de lectura %s no disponible; se excluye durante %.0f s", self.motores()[indice].url.render_as_string(hide_password=True), self.retry_seconds)
+
+    async def dispose(self):
+        if self._fabricas_async is not None:
+            for async_engine, _ in self._fabricas_async:
+                await async_engine.dispose()
+        if self._motores is not None:
+            for motor in self._motores:
+                motor.dispose()
+
+
+replicas = Replicas(DATABASE_REPLICA_URLS)
+
+
+def read_session():
+    """Abre una sesión en una réplica disponible, o en la primaria si no hay ninguna."""
+    for indice in replicas.disponibles():
+        db = SessionLocal(bind=replicas.motores()[indice])
+        try:
+            # Tomar la conexión ya: si la réplica no responde se pasa a la siguiente
+            db.connection()
+            return db
+        except OperationalError:
+            db.close()
+            replicas.marcar_caida(indice)
+    return SessionLocal()
+
+
+async def async_read_session():
+    """Versión asíncrona de read_session: réplica disponible o, si no hay ninguna, la primaria."""
+    for indice in replicas.disponibles():
+        db = replicas.fabricas_async()[indice][1]()
+        try:
+            await db.connection()
+            return db
+        except OperationalError:
+            await db.close()
+            replicas.marcar_caida(indice)
+    return get_async_session_factory()[1]()
+
+
+def lee_de_primaria(request) -> bool:
+    """Indica si la petición debe leer de la primaria: escribió hace poco o lo pide con X-Read-Primary."""
+    if request.headers.get(PRIMARY_HEADER):
+        return True
+    try:
+        return float(request.cookies.get(PRIMARY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def usa_replica(request, response=None) -> bool:
+    """Decide si la petición lee de una réplica; en las escrituras fija la cookie de read-your-writes."""
+    if not replicas.urls:
+        return False
+    if request.method in ("GET", "HEAD"):
+        return not lee_de_primaria(request)
+    if response is not None:
+        # Las lecturas siguientes del mismo cliente van a la primaria hasta que las réplicas alcancen la escritura
+        response.set_cookie(PRIMARY_COOKIE, str(time.time() + REPLICA_STICKY_SECONDS), max_age=max(int(REPLICA_STICKY_SECONDS), 1), httponly=True)
+    return False
+
+
+def session_for_request(request, response=None):
+    """Sesión para una petición HTTP: réplica para las lecturas, primaria para escrituras y read-your-writes."""
+    return read_session() if usa_replica(request, response) else SessionLocal()
+
+
+async def async_session_for_request(request, response=None):
+    """Sesión asíncrona para una petición HTTP, con el mismo criterio que session_for_request."""
+    if usa_replica(request, response):
+        return await async_read_session()
+    return get_async_session_factory()[1]()
+
 
 # Base para los modelos
 Base = declarative_base()
@@ -23,3 +250,59 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def async_database_url(url: str) -> str:
+    """Traduce una URL síncrona a su equivalente con driver asíncrono."""
+    esquema, separador, resto = url.partition("://")
+    return ASYNC_DRIVERS.get(esquema, esquema) + separador + resto
+
+
+def create_async_session_factory(url: str):
+    """Crea el motor asíncrono y su fábrica de sesiones."""
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    async_engine = create_async_engine(async_database_url(url), **pool_options(url))
+    sqlite_foreign_keys(async_engine.sync_engine)
+    instrument_engine(async_engine.sync_engine)
+    if SQL_METRICS:
+        instrument_queries(async_engine.sync_engine)
+    return async_engine, async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+def get_async_session_factory():
+    """Devuelve (motor asíncrono, fábrica de sesiones), creándolos la primera vez."""
+    if "async" not in _motores:
+        with _motores_lock:
+            if "async" not in _motores:
+                _motores["async"] = create_async_session_factory(config("ASYNC_DATABASE_URL", default=database_url()))
+    return _motores["async"]
+
+
+async def dispose_engines():
+    """Cierra las conexiones abiertas de los motores creados; se llama al apagar la app."""
+    if "async" in _motores:
+        await _motores["async"][0].dispose()
+    if "sync" in _motores:
+        _motores["sync"].dispose()
+    await replicas.dispose()
+
+
+def __getattr__(nombre):
+    # Compatibilidad con `database.engine`, `database.DATABASE_URL`, etc.: se resuelven al usarlos
+    if nombre == "engine":
+        return get_engine()
+    if nombre == "DATABASE_URL":
+        return database_url()
+    if nombre in ("async_engine", "AsyncSessionLocal"):
+        if not ASYNC_DATABASE:
+            return None
+        async_engine, AsyncSessionLocal = get_async_session_factory()
+        return async_engine if nombre == "async_engine" else AsyncSessionLocal
+    raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}")
+
+
+# Dependencia asíncrona para los endpoints async; los GET se reparten entre las réplicas como en get_db
+async def get_async_db(request: Request, response: Response):
+    async with await async_session_for_request(request, response) as db:
+        yield db
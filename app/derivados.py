@@ -0,0 +1,128 @@
+import io
+import logging
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+from decouple import config
+
+from . import models
+from .almacenamiento import AlmacenLocal, almacen
+from .database import SessionLocal
+
+# Dónde se generan los derivados: "thread" (hilos del propio proceso), "process"
+# (pool de procesos del propio proceso) o "externo" (python -m app.derivados)
+DERIVADOS_MODO = config("DERIVADOS_MODO", default="thread")
+DERIVADOS_WORKERS = config("DERIVADOS_WORKERS", default=2, cast=int)
+DERIVADOS_CALIDAD = config("DERIVADOS_CALIDAD", default=80, cast=int)
+
+# Lado mayor, en píxeles, de cada tamaño derivado; cada uno se guarda en Foto.ruta_<tamaño>
+TAMANOS = {
+    "thumb": 256,
+    "medium": 1024,
+}
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[Executor] = None
+
+
+def clave_derivado(sha256: str, tamano: str) -> str:
+    """Clave en el almacén de un derivado: depende sólo del original, así que también se deduplica."""
+    return f"{sha256}-{tamano}.webp"
+
+
+def archivo_para(db_foto: models.Foto, tamano: str = "original") -> tuple:
+    """Devuelve (clave, media_type) del archivo a servir; mientras el derivado no exista se sirve el original."""
+    if tamano in TAMANOS and getattr(db_foto, f"ruta_{tamano}"):
+        return clave_derivado(db_foto.sha256, tamano), "image/webp"
+    return db_foto.sha256, db_foto.content_type
+
+
+def generar(raiz: str, sha256: str, calidad: int = DERIVADOS_CALIDAD) -> dict:
+    """Genera los derivados WebP de un original y devuelve {tamaño: clave}; se ejecuta en el pool de trabajo."""
+    from PIL import Image, ImageOps
+
+    destino = AlmacenLocal(raiz)
+    claves = {}
+    with Image.open(destino.ruta(sha256)) as original:
+        # Respetar la orientación EXIF de las fotos tomadas con el teléfono
+        original = ImageOps.exif_transpose(original)
+        if original.mode not in ("RGB", "RGBA"):
+            original = original.convert("RGB")
+        for tamano, lado in TAMANOS.items():
+            clave = clave_derivado(sha256, tamano)
+            if not destino.existe(clave):
+                imagen = original.copy()
+                imagen.thumbnail((lado, lado))
+                contenido = io.BytesIO()
+                imagen.save(contenido, "WEBP", quality=calidad)
+                destino.guardar_bytes(clave, contenido.getvalue())
+            claves[tamano] = clave
+    return claves
+
+
+def registrar(sha256: str, claves: dict) -> None:
+    """Anota los derivados en todas las fotos con ese contenido."""
+    db = SessionLocal()
+    try:
+        valores = {f"ruta_{tamano}": almacen.ruta(clave).relative_to(almacen.raiz).as_posix() for tamano, clave in claves.items()}
+        db.query(models.Foto).filter(models.Foto.sha256 == sha256).update(valores, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _executor_actual() -> Executor:
+    global _executor
+    if _executor is None:
+        if DERIVADOS_MODO == "process":
+            _executor = ProcessPoolExecutor(max_workers=DERIVADOS_WORKERS)
+        else:
+            _executor = ThreadPoolExecutor(max_workers=DERIVADOS_WORKERS, thread_name_prefix="derivados")
+    return _executor
+
+
+def programar(sha256: str) -> None:
+    """Encola la generación de derivados de un original sin esperar el resultado."""
+    if DERIVADOS_MODO == "externo":
+        return
+
+    def al_terminar(futuro):
+        try:
+            registrar(sha256, futuro.result())
+        except Exception:
+            logger.exception("No se pudieron generar los derivados de %s", sha256)
+
+    _executor_actual().submit(generar, str(almacen.raiz), sha256).add_done_callback(al_terminar)
+
+
+def procesar_pendientes(lote: int = 100, fallidos: Optional[set] = None) -> int:
+    """Genera los derivados de las fotos almacenadas que todavía no los tienen; devuelve cuántos originales procesó."""
+    fallidos = set() if fallidos is None else fallidos
+    db = SessionLocal()
+    try:
+        query = db.query(models.Foto.sha256).filter(models.Foto.sha256.isnot(None), models.Foto.ruta_thumb.is_(None))
+        if fallidos:
+            query = query.filter(models.Foto.sha256.notin_(fallidos))
+        pendientes = [sha256 for (sha256,) in query.distinct().limit(lote)]
+    finally:
+        db.close()
+
+    for sha256 in pendientes:
+        try:
+            registrar(sha256, generar(str(almacen.raiz), sha256))
+        except Exception:
+            # No reintentar en este proceso un original que no se puede leer
+            fallidos.add(sha256)
+            logger.exception("No se pudieron generar los derivados de %s", sha256)
+    return len(pendientes)
+
+
+if __name__ == "__main__":
+    # Worker independiente para DERIVADOS_MODO=externo
+    logging.basicConfig(level=logging.INFO)
+    fallidos = set()
+    while True:
+        if not procesar_pendientes(fallidos=fallidos):
+            time.sleep(5)
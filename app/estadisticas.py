@@ -0,0 +1,124 @@
+from collections import Counter
+from typing import Iterable
+
+from sqlalchemy import String, case, cast, delete, func, insert, select, update
+
+from . import models
+
+# Valor con el que se cuenta un árbol sin tipo de intervención
+SIN_DATO = "ninguna"
+
+_arbol = models.Arbol.__table__
+_resumen = models.EstadisticaMunicipio.__table__
+
+# Dimensiones del resumen: (valor a partir de los datos de un árbol, expresión SQL equivalente)
+DIMENSIONES = {
+    "especie": (
+        lambda datos: str(datos["id_especie"]),
+        cast(_arbol.c.id_especie, String),
+    ),
+    "altura": (
+        lambda datos: datos["altura"],
+        _arbol.c.altura,
+    ),
+    "requiere_intervencion": (
+        lambda datos: "true" if datos["requiere_intervencion"] else "false",
+        case((_arbol.c.requiere_intervencion, "true"), else_="false"),
+    ),
+    "tipo_intervencion": (
+        lambda datos: datos.get("tipo_intervencion") or SIN_DATO,
+        func.coalesce(func.nullif(_arbol.c.tipo_intervencion, ""), SIN_DATO),
+    ),
+}
+
+# Columnas de arbol de las que depende el resumen
+COLUMNAS = ("id_municipio", "id_especie", "altura", "requiere_intervencion", "tipo_intervencion")
+
+
+def datos_arbol(db_arbol: models.Arbol) -> dict:
+    """Extrae de un árbol del ORM los campos que usa el resumen."""
+    return {columna: getattr(db_arbol, columna) for columna in COLUMNAS}
+
+
+def claves(datos: dict) -> list:
+    """Devuelve las claves (id_municipio, dimensión, valor) en las que cuenta un árbol."""
+    return [(datos["id_municipio"], dimension, valor(datos)) for dimension, (valor, _) in DIMENSIONES.items()]
+
+
+def contar(filas: Iterable[dict], signo: int = 1) -> Counter:
+    """Acumula los incrementos del resumen para un conjunto de árboles."""
+    conteos = Counter()
+    for datos in filas:
+        for clave in claves(datos):
+            conteos[clave] += signo
+    return conteos
+
+
+def diferencia(anterior: dict, nuevo: dict) -> Counter:
+    """Incrementos del resumen al pasar un árbol de unos datos a otros."""
+    conteos = contar([nuevo])
+    conteos.subtract(contar([anterior]))
+    return conteos
+
+
+def aplicar(db, conteos: Counter) -> None:
+    """Suma los incrementos al resumen dentro de la transacción en curso."""
+    filas = [
+        {"id_municipio": id_municipio, "dimension": dimension, "valor": valor, "cantidad": delta}
+        for (id_municipio, dimension, valor), delta in conteos.items()
+        if delta
+    ]
+    if not filas:
+        return
+
+    # db puede ser una Session (crud) o una Connection (migraciones)
+    dialecto = (db.get_bind() if hasattr(db, "get_bind") else db).dialect.name
+    if dialecto in ("postgresql", "sqlite"):
+        # Importados al escribir y no al arrancar: el dialecto de PostgreSQL es caro de importar
+        from sqlalchemy.dialects import postgresql, sqlite
+
+        # Upsert atómico: dos escrituras concurrentes sobre la misma clave no se pisan
+        upsert = (postgresql if dialecto == "postgresql" else sqlite).insert(_resumen)
+        upsert = upsert.on_conflict_do_update(
+            index_elements=[_resumen.c.id_municipio, _resumen.c.dimension, _resumen.c.valor],
+            set_={"cantidad": _resumen.c.cantidad + upsert.excluded.cantidad},
+        )
+        db.execute(upsert, filas)
+        return
+
+    for fila in filas:
+        actualizadas = db.execute(
+            update(_resumen)
+            .where(
+                _resumen.c.id_municipio == fila["id_municipio"],
+                _resumen.c.dimension == fila["dimension"],
+                _resumen.c.valor == fila["valor"],
+            )
+            .values(cantidad=_resumen.c.cantidad + fila["cantidad"])
+        ).rowcount
+        if not actualizadas:
+            db.execute(insert(_resumen), [fila])
+
+
+def contar_consulta(db, *condiciones, signo: int = 1) -> Counter:
+    """Acumula los incrementos del resumen para los árboles que cumplen las condiciones, agregando en SQL."""
+    conteos = Counter()
+    for dimension, (_, expresion) in DIMENSIONES.items():
+        stmt = (
+            select(_arbol.c.id_municipio, expresion, func.count())
+            .where(*condiciones)
+            .group_by(_arbol.c.id_municipio, expresion)
+        )
+        for id_municipio, valor, cantidad in db.execute(stmt):
+            conteos[(id_municipio, dimension, valor)] += signo * cantidad
+    return conteos
+
+
+def reconstruir(db, id_municipio=None) -> None:
+    """Recalcula el resumen desde la tabla de árboles, para todos los municipios o sólo uno."""
+    condiciones = [] if id_municipio is None else [_arbol.c.id_municipio == id_municipio]
+    borrado = delete(_resumen)
+    if id_municipio is not None:
+        borrado = borrado.where(_resumen.c.id_municipio == id_municipio)
+    db.execute(borrado)
+    aplicar(db, contar_consulta(db, *condiciones))
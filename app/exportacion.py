@@ -0,0 +1,50 @@
+import csv
+import io
+import json
+from typing import Iterable, Iterator, List
+
+from . import crud
+from .database import SessionLocal, read_session
+
+# Filas agrupadas por cada bloque enviado al cliente
+FILAS_POR_BLOQUE = 500
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def _ndjson(filas: Iterable) -> Iterator[str]:
+    bloque = []
+    for fila in filas:
+        bloque.append(json.dumps(dict(fila), default=str, ensure_ascii=False))
+        if len(bloque) == FILAS_POR_BLOQUE:
+            yield "\n".join(bloque) + "\n"
+            bloque = []
+    if bloque:
+        yield "\n".join(bloque) + "\n"
+
+
+def _csv(filas: Iterable, columnas: List[str]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columnas)
+    for numero, fila in enumerate(filas, start=1):
+        writer.writerow([fila[c] for c in columnas])
+        if numero % FILAS_POR_BLOQUE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def exportar_arboles(formato: str, replica: bool = True, **filtros) -> Iterator[str]:
+    """Genera la exportación de árboles en el formato pedido, usando una sesión propia durante todo el streaming."""
+    # La sesión de la dependencia se cierra antes de que termine el streaming; con read-your-writes se lee de la primaria
+    db = read_session() if replica else SessionLocal()
+    try:
+        filas = crud.stream_arboles(db, **filtros)
+        if formato == "csv":
+            yield from _csv(filas, [c.name for c in crud.ARBOL_EXPORT_COLUMNS])
+        else:
+            yield from _ndjson(filas)
+    finally:
+        db.close()
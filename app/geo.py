@@ -0,0 +1,97 @@
+import math
+from typing import List, Tuple
+
+# Alfabeto base32 usado por geohash
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# Precisión almacenada en Arbol.geohash (9 caracteres ≈ celdas de 5 m)
+GEOHASH_PRECISION = 9
+
+# Máximo de celdas por consulta; limita la cantidad de rangos enviados al índice
+MAX_CELDAS = 16
+
+RADIO_TIERRA_M = 6_371_000
+
+
+def encode_geohash(lat: float, lon: float, precision: int = GEOHASH_PRECISION) -> str:
+    """Codifica una coordenada como geohash de la precisión indicada."""
+    lat_min, lat_max = -90.0, 90.0
+    lon_min, lon_max = -180.0, 180.0
+    geohash = []
+    bits, bit_count, es_lon = 0, 0, True
+    while len(geohash) < precision:
+        if es_lon:
+            medio = (lon_min + lon_max) / 2
+            if lon >= medio:
+                bits = (bits << 1) | 1
+                lon_min = medio
+            else:
+                bits <<= 1
+                lon_max = medio
+        else:
+            medio = (lat_min + lat_max) / 2
+            if lat >= medio:
+                bits = (bits << 1) | 1
+                lat_min = medio
+            else:
+                bits <<= 1
+                lat_max = medio
+        es_lon = not es_lon
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(_BASE32[bits])
+            bits, bit_count = 0, 0
+    return "".join(geohash)
+
+
+def _tamano_celda(precision: int) -> Tuple[float, float]:
+    """Devuelve (alto, ancho) en grados de una celda geohash."""
+    total_bits = 5 * precision
+    lon_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def cubrir_bbox(min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> List[str]:
+    """Devuelve los prefijos geohash que cubren el rectángulo, con la mayor precisión que no supere MAX_CELDAS."""
+    precision = 1
+    for p in range(GEOHASH_PRECISION, 0, -1):
+        alto, ancho = _tamano_celda(p)
+        filas = math.ceil((max_lat - min_lat) / alto) + 1
+        columnas = math.ceil((max_lon - min_lon) / ancho) + 1
+        if filas * columnas <= MAX_CELDAS:
+            precision = p
+            break
+
+    alto, ancho = _tamano_celda(precision)
+    latitudes = [min(min_lat + i * alto, max_lat) for i in range(math.ceil((max_lat - min_lat) / alto) + 1)]
+    longitudes = [min(min_lon + j * ancho, max_lon) for j in range(math.ceil((max_lon - min_lon) / ancho) + 1)]
+    latitudes.append(max_lat)
+    longitudes.append(max_lon)
+    return sorted({encode_geohash(lat, lon, precision) for lat in latitudes for lon in longitudes})
+
+
+def rango_prefijo(prefijo: str) -> Tuple[str, str]:
+    """Devuelve el rango [desde, hasta] de geohashes completos que comienzan con el prefijo."""
+    return prefijo, prefijo + _BASE32[-1] * (GEOHASH_PRECISION - len(prefijo))
+
+
+def distancia_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Distancia en metros entre dos coordenadas (fórmula de haversine)."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = math.radians(lat2 - lat1)
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * RADIO_TIERRA_M * math.asin(math.sqrt(a))
+
+
+def bbox_radio(lat: float, lon: float, radio_m: float) -> Tuple[float, float, float, float]:
+    """Devuelve el rectángulo (min_lat, min_lon, max_lat, max_lon) que contiene el círculo dado."""
+    dlat = math.degrees(radio_m / RADIO_TIERRA_M)
+    dlon = math.degrees(radio_m / (RADIO_TIERRA_M * max(math.cos(math.radians(lat)), 1e-6)))
+    return (
+        max(lat - dlat, -90.0),
+        max(lon - dlon, -180.0),
+        min(lat + dlat, 90.0),
+        min(lon + dlon, 180.0),
+    )
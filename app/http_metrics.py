@@ -0,0 +1,260 @@
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from pathlib import Path
+
+from decouple import config
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+
+from .query_metrics import SIN_RUTA, plantilla_ruta
+
+# Directorio compartido por los workers (uvicorn --workers, gunicorn): cada proceso vuelca
+# ahí sus contadores y /metrics los suma. Vacío: sólo las métricas del proceso que responde.
+METRICS_DIR = config("METRICS_DIR", default="")
+# Cada cuánto, como máximo, un proceso vuelca sus contadores al directorio compartido
+METRICS_FLUSH_SECONDS = config("METRICS_FLUSH_SECONDS", default=1.0, cast=float)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+# Histogramas: nombre → (ayuda, límites de los buckets)
+HISTOGRAMAS = {
+    "http_request_duration_seconds": ("Duración de las peticiones HTTP.", LATENCY_BUCKETS),
+    "http_request_size_bytes": ("Tamaño del cuerpo de las peticiones (Content-Length).", SIZE_BUCKETS),
+    "http_response_size_bytes": ("Bytes del cuerpo enviados en cada respuesta.", SIZE_BUCKETS),
+}
+
+
+def _clave(*etiquetas) -> str:
+    return "|".join(etiquetas)
+
+
+class HttpMetrics:
+    """Contadores, histogramas y peticiones en curso por ruta; se pueden volcar y sumar entre procesos."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            # "método|ruta|estado" → peticiones
+            self.requests = {}
+            # histograma → "método|ruta" → [conteo por bucket..., +Inf, suma]
+            self.histograms = {nombre: {} for nombre in HISTOGRAMAS}
+            # método → peticiones en curso
+            self.in_flight = {}
+
+    def start(self, metodo: str):
+        with self._lock:
+            self.in_flight[metodo] = self.in_flight.get(metodo, 0) + 1
+
+    def finish(self, metodo: str, ruta: str, estado: int, segundos: float, bytes_peticion: int, bytes_respuesta: int):
+        with self._lock:
+            self.in_flight[metodo] -= 1
+            clave = _clave(metodo, ruta, str(estado))
+            self.requests[clave] = self.requests.get(clave, 0) + 1
+            for nombre, valor in (
+                ("http_request_duration_seconds", segundos),
+                ("http_request_size_bytes", bytes_peticion),
+                ("http_response_size_bytes", bytes_respuesta),
+            ):
+                limites = HISTOGRAMAS[nombre][1]
+                serie = self.histograms[nombre].setdefault(_clave(metodo, ruta), [0] * (len(limites) + 2))
+                # Conteo no acumulado por bucket; el acumulado se calcula al renderizar
+                serie[bisect_left(limites, valor)] += 1
+                serie[-1] += valor
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "requests": dict(self.requests),
+                "histograms": {nombre: {clave: list(serie) for clave, serie in series.items()} for nombre, series in self.histograms.items()},
+                "in_flight": dict(self.in_flight),
+            }
+
+
+http_metrics = HttpMetrics()
+
+
+def sumar(snapshots: list) -> dict:
+    """Suma las instantáneas de varios procesos."""
+    total = {"requests": {}, "histograms": {nombre: {} for nombre in HISTOGRAMAS}, "in_flight": {}}
+    for snapshot in snapshots:
+        for clave, valor in snapshot.get("requests", {}).items():
+            total["requests"][clave] = total["requests"].get(clave, 0) + valor
+        for nombre, series in snapshot.get("histograms", {}).items():
+            for clave, serie in series.items():
+                acumulada = total["histograms"].setdefault(nombre, {}).get(clave)
+                total["histograms"][nombre][clave] = serie if acumulada is None else [a + b for a, b in zip(acumulada, serie)]
+        for metodo, valor in snapshot.get("in_flight", {}).items():
+            total["in_flight"][metodo] = total["in_flight"].get(metodo, 0) + valor
+    return total
+
+
+def _vivo(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# Suma de los procesos que ya terminaron; sus volcados <pid>.json se integran aquí y se eliminan
+FINALIZADOS = "finalizados.json"
+
+
+def _leer_json(archivo: Path):
+    try:
+        return json.loads(archivo.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def _escribir_json(directorio: Path, nombre: str, contenido: dict) -> None:
+    descriptor, temporal = tempfile.mkstemp(dir=directorio, prefix=".metricas-")
+    with os.fdopen(descriptor, "w") as archivo:
+        json.dump(contenido, archivo)
+    # Renombrado atómico: quien lee nunca ve un archivo a medio escribir
+    os.replace(temporal, directorio / nombre)
+
+
+class VolcadoMultiproceso:
+    """Vuelca periódicamente las métricas del proceso a METRICS_DIR/<pid>.json y lee las de todos los workers."""
+
+    def __init__(self, directorio: str, metricas: HttpMetrics, intervalo: float = METRICS_FLUSH_SECONDS):
+        self.directorio = Path(directorio)
+        self.metricas = metricas
+        self.intervalo = intervalo
+        self._ultimo = 0.0
+        self._lock = threading.Lock()
+
+    def pendiente(self) -> bool:
+        """Indica si pasó el intervalo desde el último volcado."""
+        return time.monotonic() - self._ultimo >= self.intervalo
+
+    def volcar(self, forzar: bool = False):
+        with self._lock:
+            if not forzar and not self.pendiente():
+                return
+            self._ultimo = time.monotonic()
+            self.directorio.mkdir(parents=True, exist_ok=True)
+            _escribir_json(self.directorio, f"{os.getpid()}.json", self.metricas.snapshot())
+
+    def leer(self) -> dict:
+        """Suma las métricas de todos los procesos; los que terminaron pasan a FINALIZADOS, sin sus peticiones en curso."""
+        self.volcar(forzar=True)
+        import fcntl
+
+        with open(self.directorio / ".lock", "w") as bloqueo:
+            # Un scrape a la vez por directorio: dos workers no integran el mismo volcado dos veces
+            fcntl.flock(bloqueo, fcntl.LOCK_EX)
+            finalizados = _leer_json(self.directorio / FINALIZADOS) or {}
+            vivos, terminados = [], []
+            for archivo in self.directorio.glob("*.json"):
+                if not archivo.stem.isdigit():
+                    continue
+                snapshot = _leer_json(archivo)
+                if snapshot is None:
+                    continue
+                if _vivo(int(archivo.stem)):
+                    vivos.append(snapshot)
+                else:
+                    terminados.append((archivo, snapshot))
+            if terminados:
+                finalizados = sumar([finalizados] + [snapshot for _, snapshot in terminados])
+                finalizados["in_flight"] = {}
+                _escribir_json(self.directorio, FINALIZADOS, finalizados)
+                for archivo, _ in terminados:
+                    archivo.unlink(missing_ok=True)
+        return sumar(vivos + [finalizados])
+
+
+volcado = VolcadoMultiproceso(METRICS_DIR, http_metrics) if METRICS_DIR else None
+if volcado is not None:
+    atexit.register(volcado.volcar, True)
+
+
+def metricas_actuales() -> dict:
+    """Métricas HTTP de todos los workers si hay METRICS_DIR, o del proceso actual si no."""
+    return volcado.leer() if volcado is not None else http_metrics.snapshot()
+
+
+def _etiquetas(clave: str, nombres: tuple) -> str:
+    return ",".join(f'{nombre}="{valor}"' for nombre, valor in zip(nombres, clave.split("|")))
+
+
+def render_http_metrics(snapshot: dict) -> str:
+    """Renderiza las métricas HTTP en formato de texto de Prometheus."""
+    lineas = [
+        "# HELP http_requests_total Peticiones HTTP atendidas, por ruta y estado.",
+        "# TYPE http_requests_total counter",
+    ]
+    for clave, valor in sorted(snapshot["requests"].items()):
+        lineas.append(f"http_requests_total{{{_etiquetas(clave, ('method', 'route', 'status'))}}} {valor}")
+
+    lineas += [
+        "# HELP http_requests_in_flight Peticiones HTTP en curso.",
+        "# TYPE http_requests_in_flight gauge",
+    ]
+    for metodo, valor in sorted(snapshot["in_flight"].items()):
+        lineas.append(f'http_requests_in_flight{{method="{metodo}"}} {valor}')
+
+    for nombre, (ayuda, limites) in HISTOGRAMAS.items():
+        lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} histogram"]
+        for clave, serie in sorted(snapshot["histograms"].get(nombre, {}).items()):
+            etiquetas = _etiquetas(clave, ("method", "route"))
+            acumulado = 0
+            for limite, conteo in zip(limites + ("+Inf",), serie[:-1]):
+                acumulado += conteo
+                lineas.append(f'{nombre}_bucket{{{etiquetas},le="{limite}"}} {acumulado}')
+            lineas.append(f"{nombre}_sum{{{etiquetas}}} {serie[-1]}")
+            lineas.append(f"{nombre}_count{{{etiquetas}}} {acumulado}")
+    return "\n".join(lineas) + "\n"
+
+
+class HttpMetricsMiddleware:
+    """Registra estado, duración y tamaños de cada petición HTTP, agrupando por plantilla de ruta."""
+
+    def __init__(self, app, metricas: HttpMetrics = http_metrics):
+        self.app = app
+        self.metricas = metricas
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        metodo = scope["method"]
+        inicio = time.perf_counter()
+        estado = 500
+        enviados = 0
+
+        async def send_medido(message):
+            nonlocal estado, enviados
+            if message["type"] == "http.response.start":
+                estado = message["status"]
+            elif message["type"] == "http.response.body":
+                enviados += len(message.get("body", b""))
+            await send(message)
+
+        self.metricas.start(metodo)
+        try:
+            await self.app(scope, receive, send_medido)
+        finally:
+            ruta = plantilla_ruta(scope, SIN_RUTA)
+            try:
+                bytes_peticion = int(Headers(scope=scope).get("content-length", 0))
+            except ValueError:
+                bytes_peticion = 0
+            self.metricas.finish(metodo, ruta, estado, time.perf_counter() - inicio, bytes_peticion, enviados)
+            if volcado is not None and volcado.pendiente():
+                # La escritura del archivo no bloquea el event loop
+                await run_in_threadpool(volcado.volcar)
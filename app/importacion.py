@@ -0,0 +1,51 @@
+import csv
+import io
+import json
+from typing import Iterator
+
+from fastapi import HTTPException
+
+# Tipos de contenido aceptados por los endpoints de carga masiva
+JSON_TYPES = {"application/json"}
+NDJSON_TYPES = {"application/x-ndjson", "application/ndjson", "application/jsonl"}
+CSV_TYPES = {"text/csv", "application/csv"}
+
+
+def _filas_ndjson(texto: str) -> Iterator[dict]:
+    for linea in texto.splitlines():
+        if not linea.strip():
+            continue
+        try:
+            yield json.loads(linea)
+        except json.JSONDecodeError:
+            # Una línea corrupta se reporta como error de fila sin abortar la carga
+            yield None
+
+
+def _filas_csv(texto: str) -> Iterator[dict]:
+    for fila in csv.DictReader(io.StringIO(texto)):
+        # Las celdas vacías del CSV se interpretan como valores ausentes
+        yield {clave: (valor if valor != "" else None) for clave, valor in fila.items()}
+
+
+def parse_filas(content_type: str, cuerpo: bytes) -> Iterator[dict]:
+    """Convierte el cuerpo de una carga masiva (JSON, NDJSON o CSV) en un iterador de filas."""
+    tipo = (content_type or "").split(";")[0].strip().lower()
+    try:
+        texto = cuerpo.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="El archivo debe estar codificado en UTF-8.")
+
+    if tipo in JSON_TYPES:
+        try:
+            filas = json.loads(texto)
+        except json.JSONDecodeError:
+            raise HTTPException(status_code=400, detail="El cuerpo JSON es inválido.")
+        if not isinstance(filas, list):
+            raise HTTPException(status_code=400, detail="El cuerpo JSON debe ser una lista de filas.")
+        return iter(filas)
+    if tipo in NDJSON_TYPES:
+        return _filas_ndjson(texto)
+    if tipo in CSV_TYPES:
+        return _filas_csv(texto)
+    raise HTTPException(status_code=415, detail=f"Tipo de contenido no soportado: '{tipo}'.")
@@ -1,56 +1,88 @@
-from fastapi import FastAPI, Depends, HTTPException
+import time
+
+# Inicio de la importación de la aplicación, para medir cuánto tarda en arrancar un worker
+_inicio_importacion = time.perf_counter()
+
+import logging
+from contextlib import asynccontextmanager
+from fastapi import APIRouter, FastAPI, Depends, File, Form, HTTPException, Query, Request, Response, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
-from . import models, schemas, crud
-from .database import SessionLocal, engine
+from typing import List, Optional
+from datetime import date
+from decouple import config
+from . import models, schemas, crud, derivados, exportacion, respuestas, versiones
+from .almacenamiento import respuesta_archivo
+from .cache import cache_stats
+from .compresion import COMPRESSION, CompresionMiddleware
+from . import database
+from .auth import hash_stats
+from .database import ASYNC_DATABASE
+from .importacion import parse_filas
+from .pagination import NEXT_CURSOR_HEADER, next_cursor
+from .http_metrics import HttpMetricsMiddleware, metricas_actuales, render_http_metrics
+from .pool_metrics import render_pool_metrics
+from .query_metrics import SQL_METRICS, QueryStatsMiddleware, query_stats
 import os
 from dotenv import load_dotenv
 
 # Cargar variables de entorno
 load_dotenv()
 
-# Crear todas las tablas en la base de datos
-models.Base.metadata.create_all(bind=engine)
+# Crear las tablas que falten al arrancar. En producción el esquema lo gestiona
+# Alembic (`alembic upgrade head`) y conviene CREATE_SCHEMA=false: create_all
+# inspecciona cada tabla y obliga a conectarse a la base antes de atender.
+CREATE_SCHEMA = config("CREATE_SCHEMA", default=True, cast=bool)
+
+logger = logging.getLogger(__name__)
 
-# Instanciar la aplicación FastAPI
-app = FastAPI(
-    title="API REST - Gestión de Árboles",
-    description="API para gestionar información de árboles, municipios, especies, usuarios, mediciones y más.",
-    version="2.0.0",
-)
+# Duración de la importación y del arranque del proceso actual, expuestas en /metrics
+tiempos_arranque = {"import_seconds": 0.0, "startup_seconds": 0.0}
 
-# Dependencia para obtener la sesión de la base de datos
-def get_db():
-    db = SessionLocal()
+# Rutas síncronas; create_app() las registra en cada aplicación
+router = APIRouter()
+
+# Dependencia para obtener la sesión de la base de datos (réplica de lectura en los GET, si hay)
+def get_db(request: Request, response: Response):
+    db = database.session_for_request(request, response)
     try:
         yield db
     finally:
         db.close()
 
 # --- RUTAS PARA PROVINCIA ---
-@app.post("/provincias/", response_model=schemas.ProvinciaRead, status_code=201)
+@router.post("/provincias/", response_model=schemas.ProvinciaRead, status_code=201)
 def crear_provincia(provincia: schemas.ProvinciaCreate, db: Session = Depends(get_db)):
     return crud.create_provincia(db=db, provincia=provincia)
 
-@app.get("/provincias/", response_model=List[schemas.ProvinciaRead])
-def leer_provincias(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_provincias(db, skip=skip, limit=limit)
-
-@app.get("/provincias/{provincia_id}", response_model=schemas.ProvinciaRead)
+@router.get("/provincias/", response_model=List[schemas.ProvinciaRead])
+def leer_provincias(request: Request, response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, db: Session = Depends(get_db)):
+    # Si la tabla no cambió desde la versión que tiene el cliente, 304 sin consultar el listado
+    etag = versiones.etag("provincia", db.execute(versiones.consulta_tabla("provincia")).scalar())
+    if (no_modificado := versiones.no_modificado(request, response, etag)):
+        return no_modificado
+    provincias = crud.get_provincias(db, skip=skip, limit=limit, cursor=cursor)
+    cursor_siguiente = next_cursor(provincias, "id_provincia", limit)
+    if cursor_siguiente:
+        response.headers[NEXT_CURSOR_HEADER] = cursor_siguiente
+    return provincias
+
+@router.get("/provincias/{provincia_id}", response_model=schemas.ProvinciaRead)
 def leer_provincia(provincia_id: int, db: Session = Depends(get_db)):
     db_provincia = crud.get_provincia(db, provincia_id=provincia_id)
     if not db_provincia:
         raise HTTPException(status_code=404, detail="Provincia no encontrada")
     return db_provincia
 
-@app.put("/provincias/{provincia_id}", response_model=schemas.ProvinciaRead)
+@router.put("/provincias/{provincia_id}", response_model=schemas.ProvinciaRead)
 def actualizar_provincia(provincia_id: int, provincia: schemas.ProvinciaCreate, db: Session = Depends(get_db)):
     db_provincia = crud.update_provincia(db, provincia_id=provincia_id, provincia=provincia)
     if not db_provincia:
         raise HTTPException(status_code=404, detail="Provincia no encontrada")
     return db_provincia
 
-@app.delete("/provincias/{provincia_id}", status_code=204)
+@router.delete("/provincias/{provincia_id}", status_code=204)
 def eliminar_provincia(provincia_id: int, db: Session = Depends(get_db)):
     eliminado = crud.delete_provincia(db, provincia_id=provincia_id)
     if not eliminado:
@@ -58,29 +90,37 @@ def eliminar_provincia(provincia_id: int, db: Session = Depends(get_db)):
     return
 
 # --- RUTAS PARA MUNICIPIO ---
-@app.post("/municipios/", response_model=schemas.MunicipioRead, status_code=201)
+@router.post("/municipios/", response_model=schemas.MunicipioRead, status_code=201)
 def crear_municipio(municipio: schemas.MunicipioCreate, db: Session = Depends(get_db)):
     return crud.create_municipio(db=db, municipio=municipio)
 
-@app.get("/municipios/", response_model=List[schemas.MunicipioRead])
-def leer_municipios(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_municipios(db, skip=skip, limit=limit)
-
-@app.get("/municipios/{municipio_id}", response_model=schemas.MunicipioRead)
+@router.get("/municipios/", response_model=List[schemas.MunicipioRead])
+def leer_municipios(request: Request, response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, db: Session = Depends(get_db)):
+    # Si la tabla no cambió desde la versión que tiene el cliente, 304 sin consultar el listado
+    etag = versiones.etag("municipio", db.execute(versiones.consulta_tabla("municipio")).scalar())
+    if (no_modificado := versiones.no_modificado(request, response, etag)):
+        return no_modificado
+    municipios = crud.get_municipios(db, skip=skip, limit=limit, cursor=cursor)
+    cursor_siguiente = next_cursor(municipios, "id_municipio", limit)
+    if cursor_siguiente:
+        response.headers[NEXT_CURSOR_HEADER] = cursor_siguiente
+    return municipios
+
+@router.get("/municipios/{municipio_id}", response_model=schemas.MunicipioRead)
 def leer_municipio(municipio_id: int, db: Session = Depends(get_db)):
     db_municipio = crud.get_municipio(db, municipio_id=municipio_id)
     if not db_municipio:
         raise HTTPException(status_code=404, detail="Municipio no encontrado")
     return db_municipio
 
-@app.put("/municipios/{municipio_id}", response_model=schemas.MunicipioRead)
+@router.put("/municipios/{municipio_id}", response_model=schemas.MunicipioRead)
 def actualizar_municipio(municipio_id: int, municipio: schemas.MunicipioCreate, db: Session = Depends(get_db)):
     db_municipio = crud.update_municipio(db, municipio_id=municipio_id, municipio=municipio)
     if not db_municipio:
         raise HTTPException(status_code=404, detail="Municipio no encontrado")
     return db_municipio
 
-@app.delete("/municipios/{municipio_id}", status_code=204)
+@router.delete("/municipios/{municipio_id}", status_code=204)
 def eliminar_municipio(municipio_id: int, db: Session = Depends(get_db)):
     eliminado = crud.delete_municipio(db, municipio_id=municipio_id)
     if not eliminado:
@@ -88,29 +128,37 @@ def eliminar_municipio(municipio_id: int, db: Session = Depends(get_db)):
     return
 
 # --- RUTAS PARA ROLE ---
-@app.post("/roles/", response_model=schemas.RoleRead, status_code=201)
+@router.post("/roles/", response_model=schemas.RoleRead, status_code=201)
 def crear_role(role: schemas.RoleCreate, db: Session = Depends(get_db)):
     return crud.create_role(db=db, role=role)
 
-@app.get("/roles/", response_model=List[schemas.RoleRead])
-def leer_roles(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_roles(db, skip=skip, limit=limit)
-
-@app.get("/roles/{role_id}", response_model=schemas.RoleRead)
+@router.get("/roles/", response_model=List[schemas.RoleRead])
+def leer_roles(request: Request, response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, db: Session = Depends(get_db)):
+    # Si la tabla no cambió desde la versión que tiene el cliente, 304 sin consultar el listado
+    etag = versiones.etag("role", db.execute(versiones.consulta_tabla("role")).scalar())
+    if (no_modificado := versiones.no_modificado(request, response, etag)):
+        return no_modificado
+    roles = crud.get_roles(db, skip=skip, limit=limit, cursor=cursor)
+    cursor_siguiente = next_cursor(roles, "id_role", limit)
+    if cursor_siguiente:
+        response.headers[NEXT_CURSOR_HEADER] = cursor_siguiente
+    return roles
+
+@router.get("/roles/{role_id}", response_model=schemas.RoleRead)
 def leer_role(role_id: int, db: Session = Depends(get_db)):
     db_role = crud.get_role(db, role_id=role_id)
     if not db_role:
         raise HTTPException(status_code=404, detail="Rol no encontrado")
     return db_role
 
-@app.put("/roles/{role_id}", response_model=schemas.RoleRead)
+@router.put("/roles/{role_id}", response_model=schemas.RoleRead)
 def actualizar_role(role_id: int, role: schemas.RoleCreate, db: Session = Depends(get_db)):
     db_role = crud.update_role(db, role_id=role_id, role=role)
     if not db_role:
         raise HTTPException(status_code=404, detail="Rol no encontrado")
     return db_role
 
-@app.delete("/roles/{role_id}", status_code=204)
+@router.delete("/roles/{role_id}", status_code=204)
 def eliminar_role(role_id: int, db: Session = Depends(get_db)):
     eliminado = crud.delete_role(db, role_id=role_id)
     if not eliminado:
@@ -118,29 +166,33 @@ def eliminar_role(role_id: int, db: Session = Depends(get_db)):
     return
 
 # --- RUTAS PARA USUARIO ---
-@app.post("/usuarios/", response_model=schemas.UsuarioRead, status_code=201)
+@router.post("/usuarios/", response_model=schemas.UsuarioRead, status_code=201)
 def crear_usuario(usuario: schemas.UsuarioCreate, db: Session = Depends(get_db)):
     return crud.create_usuario(db=db, usuario=usuario)
 
-@app.get("/usuarios/", response_model=List[schemas.UsuarioRead])
-def leer_usuarios(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_usuarios(db, skip=skip, limit=limit)
+@router.get("/usuarios/", response_model=List[schemas.UsuarioRead])
+def leer_usuarios(response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, db: Session = Depends(get_db)):
+    usuarios = crud.get_usuarios(db, skip=skip, limit=limit, cursor=cursor)
+    cursor_siguiente = next_cursor(usuarios, "id_usuario", limit)
+    if cursor_siguiente:
+        response.headers[NEXT_CURSOR_HEADER] = cursor_siguiente
+    return usuarios
 
-@app.get("/usuarios/{usuario_id}", response_model=schemas.UsuarioRead)
+@router.get("/usuarios/{usuario_id}", response_model=schemas.UsuarioRead)
 def leer_usuario(usuario_id: int, db: Session = Depends(get_db)):
     db_usuario = crud.get_usuario(db, usuario_id=usuario_id)
     if not db_usuario:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
     return db_usuario
 
-@app.put("/usuarios/{usuario_id}", response_model=schemas.UsuarioRead)
+@router.put("/usuarios/{usuario_id}", response_model=schemas.UsuarioRead)
 def actualizar_usuario(usuario_id: int, usuario: schemas.UsuarioCreate, db: Session = Depends(get_db)):
     db_usuario = crud.update_usuario(db, usuario_id=usuario_id, usuario=usuario)
     if not db_usuario:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
     return db_usuario
 
-@app.delete("/usuarios/{usuario_id}", status_code=204)
+@router.delete("/usuarios/{usuario_id}", status_code=204)
 def eliminar_usuario(usuario_id: int, db: Session = Depends(get_db)):
     eliminado = crud.delete_usuario(db, usuario_id=usuario_id)
     if not eliminado:
@@ -148,7 +200,7 @@ def eliminar_usuario(usuario_id: int, db: Session = Depends(get_db)):
     return
 
 # --- RUTAS PARA ÁRBOL ---
-@app.post("/arboles/", response_model=schemas.ArbolRead, status_code=201)
+@router.post("/arboles/", response_model=schemas.ArbolRead, status_code=201)
 def crear_arbol(arbol: schemas.ArbolCreate, db: Session = Depends(get_db)):
     if arbol.interferencia_aerea and not arbol.especificaciones_interferencia:
         raise HTTPException(
@@ -157,18 +209,100 @@ def crear_arbol(arbol: schemas.ArbolCreate, db: Session = Depends(get_db)):
         )
     return crud.create_arbol(db=db, arbol=arbol)
 
-@app.get("/arboles/", response_model=List[schemas.ArbolRead])
-def leer_arboles(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_arboles(db, skip=skip, limit=limit)
-
-@app.get("/arboles/{arbol_id}", response_model=schemas.ArbolRead)
-def leer_arbol(arbol_id: int, db: Session = Depends(get_db)):
+@router.post("/arboles/bulk", response_model=schemas.CargaMasivaResultado)
+async def crear_arboles_bulk(request: Request, db: Session = Depends(get_db)):
+    filas = parse_filas(request.headers.get("content-type"), await request.body())
+    # La inserción es bloqueante: se ejecuta fuera del event loop
+    return await run_in_threadpool(crud.create_arboles_bulk, db, filas)
+
+@router.get("/arboles/", response_model=List[schemas.ArbolConUltimaMedicion], response_model_exclude_unset=True)
+def leer_arboles(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    filtros: schemas.ArbolFiltro = Depends(),
+    embed: Optional[str] = Query(None, pattern="^ultima_medicion$"),
+    fields: Optional[str] = Query(None, description="Campos a devolver, separados por comas"),
+    db: Session = Depends(get_db),
+):
+    con_ultima_medicion = embed == "ultima_medicion"
+    campos = respuestas.campos_pedidos(fields, schemas.ArbolRead, "id_arbol")
+    if campos and con_ultima_medicion:
+        raise HTTPException(status_code=400, detail="fields no se puede combinar con embed.")
+    if campos or (respuestas.JSON_FILAS and not con_ultima_medicion):
+        # Las filas ya tienen exactamente los campos de ArbolRead: se serializan sin ORM ni Pydantic
+        filas = crud.get_arboles_filas(db, skip=skip, limit=limit, cursor=cursor, filtros=filtros, campos=campos)
+        return respuestas.respuesta_filas(filas, "id_arbol", limit, schemas.ArbolRead, campos)
+    arboles = crud.get_arboles(db, skip=skip, limit=limit, cursor=cursor, filtros=filtros, con_ultima_medicion=con_ultima_medicion)
+    cursor_siguiente = next_cursor(arboles, "id_arbol", limit)
+    if cursor_siguiente:
+        response.headers[NEXT_CURSOR_HEADER] = cursor_siguiente
+    # Sin embed se serializa como ArbolRead y ultima_medicion queda fuera de la respuesta
+    esquema = schemas.ArbolConUltimaMedicion if con_ultima_medicion else schemas.ArbolRead
+    return [esquema.model_validate(arbol) for arbol in arboles]
+
+@router.get("/arboles/export")
+def exportar_arboles(
+    request: Request,
+    formato: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    id_municipio: Optional[int] = None,
+    fecha_desde: Optional[date] = None,
+    fecha_hasta: Optional[date] = None,
+):
+    contenido = exportacion.exportar_arboles(
+        formato, replica=database.usa_replica(request), id_municipio=id_municipio, fecha_desde=fecha_desde, fecha_hasta=fecha_hasta
+    )
+    return StreamingResponse(
+        contenido,
+        media_type=exportacion.MEDIA_TYPES[formato],
+        headers={"Content-Disposition": f'attachment; filename="arboles.{formato}"'},
+    )
+
+@router.get("/arboles/bbox", response_model=List[schemas.ArbolRead])
+def leer_arboles_bbox(
+    min_lat: float = Query(..., ge=-90, le=90),
+    min_lon: float = Query(..., ge=-180, le=180),
+    max_lat: float = Query(..., ge=-90, le=90),
+    max_lon: float = Query(..., ge=-180, le=180),
+    limit: int = Query(500, ge=1, le=5000),
+    db: Session = Depends(get_db),
+):
+    return crud.get_arboles_bbox(db, min_lat=min_lat, min_lon=min_lon, max_lat=max_lat, max_lon=max_lon, limit=limit)
+
+@router.get("/arboles/near", response_model=List[schemas.ArbolRead])
+def leer_arboles_cercanos(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radio_m: float = Query(..., gt=0, le=10000),
+    limit: int = Query(100, ge=1, le=5000),
+    db: Session = Depends(get_db),
+):
+    return crud.get_arboles_cercanos(db, lat=lat, lon=lon, radio_m=radio_m, limit=limit)
+
+@router.get("/arboles/full", response_model=List[schemas.ArbolDetalle])
+def leer_arboles_detalle(response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, db: Session = Depends(get_db)):
+    arboles = crud.get_arboles_detalle(db, skip=skip, limit=limit, cursor=cursor)
+    cursor_siguiente = next_cursor(arboles, "id_arbol", limit)
+    if cursor_siguiente:
+        response.headers[NEXT_CURSOR_HEADER] = cursor_siguiente
+    return arboles
+
+@router.get("/arboles/{arbol_id}/full", response_model=schemas.ArbolDetalle)
+def leer_arbol_detalle(arbol_id: int, db: Session = Depends(get_db)):
+    return crud.get_arbol_detalle(db, arbol_id=arbol_id)
+
+@router.get("/arboles/{arbol_id}", response_model=schemas.ArbolRead)
+def leer_arbol(arbol_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
+    version = db.execute(versiones.consulta_arbol(arbol_id)).scalar()
+    if version is not None and (no_modificado := versiones.no_modificado(request, response, versiones.etag(f"arbol-{arbol_id}", version))):
+        return no_modificado
     db_arbol = crud.get_arbol(db, arbol_id=arbol_id)
     if not db_arbol:
         raise HTTPException(status_code=404, detail="Árbol no encontrado")
     return db_arbol
 
-@app.put("/arboles/{arbol_id}", response_model=schemas.ArbolRead)
+@router.put("/arboles/{arbol_id}", response_model=schemas.ArbolRead)
 def actualizar_arbol(arbol_id: int, arbol: schemas.ArbolCreate, db: Session = Depends(get_db)):
     if arbol.interferencia_aerea and not arbol.especificaciones_interferencia:
         raise HTTPException(
@@ -180,7 +314,7 @@ def actualizar_arbol(arbol_id: int, arbol: schemas.ArbolCreate, db: Session = De
         raise HTTPException(status_code=404, detail="Árbol no encontrado")
     return db_arbol
 
-@app.delete("/arboles/{arbol_id}", status_code=204)
+@router.delete("/arboles/{arbol_id}", status_code=204)
 def eliminar_arbol(arbol_id: int, db: Session = Depends(get_db)):
     eliminado = crud.delete_arbol(db, arbol_id=arbol_id)
     if not eliminado:
@@ -188,7 +322,7 @@ def eliminar_arbol(arbol_id: int, db: Session = Depends(get_db)):
     return
 
 # --- RUTAS PARA MEDICIÓN ---
-@app.post("/mediciones/", response_model=schemas.MedicionRead, status_code=201)
+@router.post("/mediciones/", response_model=schemas.MedicionRead, status_code=201)
 def crear_medicion(medicion: schemas.MedicionCreate, db: Session = Depends(get_db)):
     if medicion.interferencia_aerea and not medicion.especificaciones_interferencia:
         raise HTTPException(
@@ -197,18 +331,26 @@ def crear_medicion(medicion: schemas.MedicionCreate, db: Session = Depends(get_d
         )
     return crud.create_medicion(db=db, medicion=medicion)
 
-@app.get("/mediciones/", response_model=List[schemas.MedicionRead])
-def leer_mediciones(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_mediciones(db, skip=skip, limit=limit)
-
-@app.get("/mediciones/{medicion_id}", response_model=schemas.MedicionRead)
+@router.get("/mediciones/", response_model=List[schemas.MedicionRead])
+def leer_mediciones(response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, filtros: schemas.MedicionFiltro = Depends(), fields: Optional[str] = Query(None, description="Campos a devolver, separados por comas"), db: Session = Depends(get_db)):
+    campos = respuestas.campos_pedidos(fields, schemas.MedicionRead, "id_medicion")
+    if campos or respuestas.JSON_FILAS:
+        filas = crud.get_mediciones_filas(db, skip=skip, limit=limit, cursor=cursor, filtros=filtros, campos=campos)
+        return respuestas.respuesta_filas(filas, "id_medicion", limit, schemas.MedicionRead, campos)
+    mediciones = crud.get_mediciones(db, skip=skip, limit=limit, cursor=cursor, filtros=filtros)
+    cursor_siguiente = next_cursor(mediciones, "id_medicion", limit)
+    if cursor_siguiente:
+        response.headers[NEXT_CURSOR_HEADER] = cursor_siguiente
+    return mediciones
+
+@router.get("/mediciones/{medicion_id}", response_model=schemas.MedicionRead)
 def leer_medicion(medicion_id: int, db: Session = Depends(get_db)):
     db_medicion = crud.get_medicion(db, medicion_id=medicion_id)
     if not db_medicion:
         raise HTTPException(status_code=404, detail="Medición no encontrada")
     return db_medicion
 
-@app.put("/mediciones/{medicion_id}", response_model=schemas.MedicionRead)
+@router.put("/mediciones/{medicion_id}", response_model=schemas.MedicionRead)
 def actualizar_medicion(medicion_id: int, medicion: schemas.MedicionCreate, db: Session = Depends(get_db)):
     if medicion.interferencia_aerea and not medicion.especificaciones_interferencia:
         raise HTTPException(
@@ -220,7 +362,7 @@ def actualizar_medicion(medicion_id: int, medicion: schemas.MedicionCreate, db:
         raise HTTPException(status_code=404, detail="Medición no encontrada")
     return db_medicion
 
-@app.delete("/mediciones/{medicion_id}", status_code=204)
+@router.delete("/mediciones/{medicion_id}", status_code=204)
 def eliminar_medicion(medicion_id: int, db: Session = Depends(get_db)):
     eliminado = crud.delete_medicion(db, medicion_id=medicion_id)
     if not eliminado:
@@ -228,35 +370,167 @@ def eliminar_medicion(medicion_id: int, db: Session = Depends(get_db)):
     return
 
 # --- RUTAS PARA FOTO ---
-@app.post("/fotos/", response_model=schemas.FotoRead, status_code=201)
+@router.post("/fotos/", response_model=schemas.FotoRead, status_code=201)
 def crear_foto(foto: schemas.FotoCreate, db: Session = Depends(get_db)):
     try:
         return crud.create_foto(db=db, foto=foto)
     except Exception:
         raise HTTPException(status_code=409, detail="Conflicto al crear la foto.")
 
-@app.get("/fotos/", response_model=List[schemas.FotoRead])
-def leer_fotos(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_fotos(db, skip=skip, limit=limit)
+@router.post("/fotos/upload", response_model=schemas.FotoRead, status_code=201)
+def subir_foto(
+    response: Response,
+    id_medicion: int = Form(...),
+    tipo_foto: str = Form(...),
+    archivo: UploadFile = File(...),
+    db: Session = Depends(get_db),
+):
+    # UploadFile ya volcó a disco las imágenes grandes; el almacén las copia por bloques
+    db_foto, creada = crud.create_foto_archivo(db, id_medicion, tipo_foto, archivo.file, archivo.content_type)
+    if not creada:
+        response.status_code = 200
+    return db_foto
 
-@app.get("/fotos/{foto_id}", response_model=schemas.FotoRead)
-def leer_foto(foto_id: int, db: Session = Depends(get_db)):
+@router.get("/fotos/{foto_id}/archivo")
+def descargar_foto(
+    foto_id: int,
+    request: Request,
+    size: str = Query("original", pattern="^(original|thumb|medium)$"),
+    db: Session = Depends(get_db),
+):
+    db_foto = crud.get_foto(db, foto_id=foto_id)
+    if not db_foto.sha256:
+        raise HTTPException(status_code=404, detail="La foto no tiene archivo almacenado")
+    return respuesta_archivo(request, *derivados.archivo_para(db_foto, size))
+
+@router.get("/fotos/", response_model=List[schemas.FotoRead])
+def leer_fotos(response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, db: Session = Depends(get_db)):
+    fotos = crud.get_fotos(db, skip=skip, limit=limit, cursor=cursor)
+    cursor_siguiente = next_cursor(fotos, "id_foto", limit)
+    if cursor_siguiente:
+        response.headers[NEXT_CURSOR_HEADER] = cursor_siguiente
+    return fotos
+
+@router.get("/fotos/{foto_id}", response_model=schemas.FotoRead)
+def leer_foto(
+    foto_id: int,
+    request: Request,
+    size: Optional[str] = Query(None, pattern="^(original|thumb|medium)$"),
+    db: Session = Depends(get_db),
+):
     db_foto = crud.get_foto(db, foto_id=foto_id)
     if not db_foto:
         raise HTTPException(status_code=404, detail="Foto no encontrada")
+    # Con size se sirve la imagen en lugar de sus datos
+    if size and db_foto.sha256:
+        return respuesta_archivo(request, *derivados.archivo_para(db_foto, size))
     return db_foto
 
-@app.put("/fotos/{foto_id}", response_model=schemas.FotoRead)
+@router.put("/fotos/{foto_id}", response_model=schemas.FotoRead)
 def actualizar_foto(foto_id: int, foto: schemas.FotoCreate, db: Session = Depends(get_db)):
     db_foto = crud.update_foto(db, foto_id=foto_id, foto=foto)
     if not db_foto:
         raise HTTPException(status_code=404, detail="Foto no encontrada")
     return db_foto
 
-@app.delete("/fotos/{foto_id}", status_code=204)
+@router.delete("/fotos/{foto_id}", status_code=204)
 def eliminar_foto(foto_id: int, db: Session = Depends(get_db)):
     eliminado = crud.delete_foto(db, foto_id=foto_id)
     if not eliminado:
         raise HTTPException(status_code=404, detail="Foto no encontrada")
     return
 
+# --- SINCRONIZACIÓN ---
+@router.post("/sync", response_model=schemas.SyncResultado)
+def sincronizar(lote: schemas.SyncLote, db: Session = Depends(get_db)):
+    return crud.sync_lote(db, lote)
+
+# --- ESTADÍSTICAS ---
+@router.get("/estadisticas/municipios/{municipio_id}", response_model=schemas.EstadisticasMunicipio)
+def leer_estadisticas_municipio(municipio_id: int, db: Session = Depends(get_db)):
+    return crud.get_estadisticas_municipio(db, municipio_id=municipio_id)
+
+# --- RUTAS DE DIAGNÓSTICO ---
+@router.get("/cache/stats")
+def leer_estadisticas_cache():
+    return cache_stats()
+
+@router.get("/sql/stats")
+def leer_estadisticas_sql():
+    return query_stats.snapshot()
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def leer_metricas():
+    motores = {"sync": database.get_engine()}
+    for numero, motor in enumerate(database.replicas.motores()):
+        motores[f"replica{numero}"] = motor
+    if database.async_engine is not None:
+        motores["async"] = database.async_engine.sync_engine
+    contenido = render_pool_metrics(motores) + hash_stats.render() + render_http_metrics(metricas_actuales()) + render_tiempos_arranque()
+    return PlainTextResponse(contenido, media_type="text/plain; version=0.0.4")
+
+
+def render_tiempos_arranque() -> str:
+    """Renderiza los tiempos de importación y arranque en formato de texto de Prometheus."""
+    return (
+        "# HELP app_import_seconds Tiempo de importación de la aplicación en este proceso.\n"
+        "# TYPE app_import_seconds gauge\n"
+        f"app_import_seconds {tiempos_arranque['import_seconds']}\n"
+        "# HELP app_startup_seconds Duración del arranque (lifespan) en este proceso.\n"
+        "# TYPE app_startup_seconds gauge\n"
+        f"app_startup_seconds {tiempos_arranque['startup_seconds']}\n"
+    )
+
+
+def _lifespan(crear_esquema: bool):
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        inicio = time.perf_counter()
+        # Crear el motor no abre conexiones: sólo create_all necesita llegar a la base
+        motor = database.get_engine()
+        if crear_esquema:
+            await run_in_threadpool(models.Base.metadata.create_all, bind=motor)
+        tiempos_arranque["startup_seconds"] = time.perf_counter() - inicio
+        logger.info(
+            "Aplicación lista: importación %.0f ms, arranque %.0f ms",
+            tiempos_arranque["import_seconds"] * 1000,
+            tiempos_arranque["startup_seconds"] * 1000,
+        )
+        yield
+        await database.dispose_engines()
+
+    return lifespan
+
+
+def create_app(crear_esquema: bool = CREATE_SCHEMA, async_database: bool = ASYNC_DATABASE) -> FastAPI:
+    """Crea la aplicación FastAPI con sus middlewares y rutas, sin conectarse a la base."""
+    app = FastAPI(
+        title="API REST - Gestión de Árboles",
+        description="API para gestionar información de árboles, municipios, especies, usuarios, mediciones y más.",
+        version="2.0.0",
+        lifespan=_lifespan(crear_esquema),
+    )
+
+    # Compresión gzip/brotli de las respuestas que superan COMPRESSION_MIN_SIZE
+    if COMPRESSION:
+        app.add_middleware(CompresionMiddleware)
+
+    # Consultas SQL por petición: cabecera Server-Timing, /sql/stats y aviso de N+1 en el log
+    if SQL_METRICS:
+        app.add_middleware(QueryStatsMiddleware)
+
+    # Peticiones, latencia y tamaños por ruta para /metrics; al ser el más externo mide los bytes ya comprimidos
+    app.add_middleware(HttpMetricsMiddleware)
+
+    # Con ASYNC_DATABASE, las lecturas se atienden con sesiones asíncronas.
+    # El router se registra antes que las rutas síncronas para tener prioridad.
+    if async_database:
+        from .async_routes import router as async_router
+        app.include_router(async_router)
+    app.include_router(router)
+    return app
+
+
+# Instancia usada por `uvicorn app.main:app` (equivale a `uvicorn --factory app.main:create_app`)
+app = create_app()
+tiempos_arranque["import_seconds"] = time.perf_counter() - _inicio_importacion
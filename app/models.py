@@ -7,6 +7,10 @@ from sqlalchemy import (
     Date,
     ForeignKey,
     CheckConstraint,
+    Index,
+    PrimaryKeyConstraint,
+    false,
+    text,
 )
 from sqlalchemy.orm import relationship, validates
 from .database import Base
@@ -34,6 +38,7 @@ class Municipio(Base):
     provincia = relationship("Provincia", back_populates="municipios")
     usuarios = relationship("Usuario", back_populates="municipio", cascade="all, delete-orphan")
     arboles = relationship("Arbol", back_populates="municipio", cascade="all, delete-orphan")
+    estadisticas = relationship("EstadisticaMunicipio", cascade="all, delete-orphan", passive_deletes=True)
 
 
 class Especie(Base):
@@ -112,17 +117,30 @@ class Arbol(Base):
     protegido = Column(Boolean, nullable=False, default=False)
     fecha_censo = Column(Date, nullable=False)
     id_usuario = Column(Integer, ForeignKey("usuario.id_usuario", ondelete="SET NULL"))
+    geohash = Column(String(12), nullable=True, index=True)  # Celda geohash para consultas espaciales
+    # Medición más reciente (fecha_medicion, id_medicion); la mantiene crud al escribir mediciones.
+    # Sin FK para no crear un ciclo arbol <-> medicion en create_all/drop_all.
+    id_ultima_medicion = Column(Integer, nullable=True)
+    # Versión de la fila para ETag de /arboles/{id}; crud la incrementa en cada cambio
+    version = Column(Integer, nullable=False, default=1, server_default=text("1"))
 
     especie = relationship("Especie", back_populates="arboles")
     municipio = relationship("Municipio", back_populates="arboles")
     usuario = relationship("Usuario", back_populates="arboles")
     mediciones = relationship("Medicion", back_populates="arbol", cascade="all, delete-orphan")
+    ultima_medicion = relationship(
+        "Medicion", primaryjoin="foreign(Arbol.id_ultima_medicion) == Medicion.id_medicion", viewonly=True
+    )
 
     __table_args__ = (
         CheckConstraint("altura IN ('1-2 m', '>3 m', '3-5 m', '> 5m')"),
         CheckConstraint("diametro_tronco IN ('1-5 cm', '5-15 cm', '> 15 cm', 'Especificar')"),
         CheckConstraint("ambito IN ('Urbano', 'Rural', 'Otro')"),
         CheckConstraint("interferencia_aerea IN ('Línea alta', 'Iluminaria y media', 'Baja')"),
+        # Filtros de /arboles/ por municipio; id_arbol al final sirve al orden y al cursor
+        Index("ix_arbol_municipio_intervencion", "id_municipio", "requiere_intervencion", "id_arbol"),
+        Index("ix_arbol_municipio_especie", "id_municipio", "id_especie", "id_arbol"),
+        Index("ix_arbol_municipio_fecha_censo", "id_municipio", "fecha_censo"),
     )
 
     @validates("altura", "diametro_tronco", "ambito", "interferencia_aerea")
@@ -151,12 +169,25 @@ class Medicion(Base):
     ambito = Column(String, nullable=False)
     distancia_entre_ejemplares = Column(String, nullable=False)
     distancia_al_cordon = Column(String, nullable=False)
+    interferencia_aerea = Column(String, nullable=True)
+    tipo_cable = Column(String, nullable=True)
+    requiere_intervencion = Column(Boolean, nullable=False, default=False, server_default=false())
+    tipo_intervencion = Column(String, nullable=True)
+    tratamiento_previo = Column(String, nullable=True)
+    cazuela = Column(String, nullable=True)
+    protegido = Column(Boolean, nullable=False, default=False, server_default=false())
     id_usuario = Column(Integer, ForeignKey("usuario.id_usuario", ondelete="SET NULL"))
+    clave_sync = Column(String(64), nullable=True, unique=True, index=True)  # Clave de idempotencia del dispositivo (POST /sync)
 
     arbol = relationship("Arbol", back_populates="mediciones")
     usuario = relationship("Usuario", back_populates="mediciones")
     fotos = relationship("Foto", back_populates="medicion", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # Historial de un árbol ordenado por fecha
+        Index("ix_medicion_arbol_fecha", "id_arbol", "fecha_medicion"),
+    )
+
 #  modelo Medicion
 class Foto(Base):
     __tablename__ = "foto"
@@ -165,5 +196,35 @@ class Foto(Base):
     id_medicion = Column(Integer, ForeignKey("medicion.id_medicion", ondelete="CASCADE"), nullable=False)
     tipo_foto = Column(String, nullable=False)
     ruta_foto = Column(String, nullable=False)
+    # Archivo subido al almacén (almacenamiento.py); nulos en fotos registradas sólo por ruta
+    sha256 = Column(String(64), nullable=True, index=True)
+    tamano_bytes = Column(Integer, nullable=True)
+    content_type = Column(String, nullable=True)
+    # Derivados WebP generados en segundo plano (derivados.py); nulos hasta que estén listos
+    ruta_thumb = Column(String, nullable=True)
+    ruta_medium = Column(String, nullable=True)
+    clave_sync = Column(String(64), nullable=True, unique=True, index=True)  # Clave de idempotencia del dispositivo (POST /sync)
+
+    medicion = relationship("Medicion", back_populates="fotos")
+
+
+class EstadisticaMunicipio(Base):
+    """Resumen de árboles por municipio, mantenido de forma incremental desde crud (ver estadisticas.py)."""
+    __tablename__ = "estadistica_municipio"
+
+    id_municipio = Column(Integer, ForeignKey("municipio.id_municipio", ondelete="CASCADE"), nullable=False)
+    dimension = Column(String(32), nullable=False)
+    valor = Column(String, nullable=False)
+    cantidad = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        PrimaryKeyConstraint("id_municipio", "dimension", "valor"),
+    )
+
+
+class VersionTabla(Base):
+    """Contador de versión por tabla para ETag de los listados (ver versiones.py)."""
+    __tablename__ = "version_tabla"
 
-    medicion = relationship("Medicion", back_populates="fotos")
\ No newline at end of file
+    tabla = Column(String(64), primary_key=True)
+    version = Column(Integer, nullable=False, default=1)
@@ -0,0 +1,49 @@
+import base64
+import json
+from typing import Optional
+
+from fastapi import HTTPException
+
+# Cabecera donde se devuelve el cursor de la página siguiente
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(last_id: int) -> str:
+    """Codifica el último ID de una página como un cursor opaco."""
+    payload = json.dumps({"id": last_id}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    """Decodifica un cursor opaco y devuelve el último ID visto."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        last_id = json.loads(base64.urlsafe_b64decode(padded.encode()))["id"]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor de paginación inválido.")
+    if not isinstance(last_id, int):
+        raise HTTPException(status_code=400, detail="Cursor de paginación inválido.")
+    return last_id
+
+
+def apply_pagination(query, pk_column, skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    """Aplica paginación por cursor (keyset) o por offset a una consulta (Query o select) ordenada por su clave primaria."""
+    query = query.order_by(pk_column)
+    if cursor:
+        # Keyset: el índice de la clave primaria salta directo a la página pedida
+        query = query.filter(pk_column > decode_cursor(cursor))
+    elif skip:
+        query = query.offset(skip)
+    return query.limit(limit)
+
+
+def paginate(query, pk_column, skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    """Ejecuta una Query del ORM con paginación por cursor u offset."""
+    return apply_pagination(query, pk_column, skip=skip, limit=limit, cursor=cursor).all()
+
+
+def next_cursor(items: list, pk_name: str, limit: int) -> Optional[str]:
+    """Devuelve el cursor de la página siguiente, o None si no hay más resultados."""
+    if not items or len(items) < limit:
+        return None
+    return encode_cursor(getattr(items[-1], pk_name))
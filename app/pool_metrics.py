@@ -0,0 +1,120 @@
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+
+class PoolStats:
+    """Contadores acumulados de un pool de conexiones."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.invalidations = 0
+        self.wait_count = 0
+        self.wait_sum = 0.0
+        self.wait_max = 0.0
+
+    def record_wait(self, segundos: float, timeout: bool = False):
+        with self._lock:
+            self.wait_count += 1
+            self.wait_sum += segundos
+            self.wait_max = max(self.wait_max, segundos)
+            if timeout:
+                self.timeouts += 1
+
+    def incr(self, campo: str):
+        with self._lock:
+            setattr(self, campo, getattr(self, campo) + 1)
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool que mide cuánto espera cada checkout por una conexión libre."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        inicio = time.perf_counter()
+        try:
+            conexion = super()._do_get()
+        except PoolTimeoutError:
+            self.stats.record_wait(time.perf_counter() - inicio, timeout=True)
+            raise
+        self.stats.record_wait(time.perf_counter() - inicio)
+        return conexion
+
+    def recreate(self):
+        # Conservar los contadores si el pool se recrea (por ejemplo, tras dispose())
+        nuevo = super().recreate()
+        nuevo.stats = self.stats
+        return nuevo
+
+
+def instrument_engine(engine):
+    """Registra los eventos del pool del motor para contar conexiones, checkouts e invalidaciones."""
+    pool = engine.pool
+    if not hasattr(pool, "stats"):
+        pool.stats = PoolStats()
+    stats = pool.stats
+
+    event.listen(engine, "connect", lambda *args: stats.incr("connects"))
+    event.listen(engine, "checkout", lambda *args: stats.incr("checkouts"))
+    event.listen(engine, "invalidate", lambda *args: stats.incr("invalidations"))
+    return engine
+
+
+def pool_snapshot(engine) -> dict:
+    """Devuelve el estado actual del pool y sus contadores acumulados."""
+    pool = engine.pool
+    stats = getattr(pool, "stats", PoolStats())
+    estado = {
+        "size": pool.size() if hasattr(pool, "size") else 0,
+        "checked_out": pool.checkedout() if hasattr(pool, "checkedout") else 0,
+        "checked_in": pool.checkedin() if hasattr(pool, "checkedin") else 0,
+        # overflow() es negativo mientras el pool no alcanzó su tamaño base
+        "overflow": max(pool.overflow(), 0) if hasattr(pool, "overflow") else 0,
+    }
+    estado.update(
+        connects=stats.connects,
+        checkouts=stats.checkouts,
+        timeouts=stats.timeouts,
+        invalidations=stats.invalidations,
+        wait_count=stats.wait_count,
+        wait_sum=stats.wait_sum,
+        wait_max=stats.wait_max,
+    )
+    return estado
+
+
+# Métricas expuestas: (nombre, tipo, ayuda, {sufijo: clave en pool_snapshot})
+_METRICAS = [
+    ("db_pool_size", "gauge", "Tamaño base del pool de conexiones.", {"": "size"}),
+    ("db_pool_checked_out", "gauge", "Conexiones en uso.", {"": "checked_out"}),
+    ("db_pool_checked_in", "gauge", "Conexiones libres en el pool.", {"": "checked_in"}),
+    ("db_pool_overflow", "gauge", "Conexiones abiertas por encima del tamaño base.", {"": "overflow"}),
+    ("db_pool_connects_total", "counter", "Conexiones nuevas abiertas.", {"": "connects"}),
+    ("db_pool_checkouts_total", "counter", "Conexiones entregadas por el pool.", {"": "checkouts"}),
+    ("db_pool_checkout_timeouts_total", "counter", "Checkouts que agotaron pool_timeout.", {"": "timeouts"}),
+    ("db_pool_invalidations_total", "counter", "Conexiones invalidadas.", {"": "invalidations"}),
+    ("db_pool_checkout_wait_seconds", "summary", "Espera por una conexión libre.", {"_sum": "wait_sum", "_count": "wait_count"}),
+    ("db_pool_checkout_wait_max_seconds", "gauge", "Mayor espera observada por una conexión.", {"": "wait_max"}),
+]
+
+
+def render_pool_metrics(engines: dict) -> str:
+    """Renderiza el estado de los pools en formato de texto de Prometheus."""
+    snapshots = {nombre: pool_snapshot(engine) for nombre, engine in engines.items()}
+    lineas = []
+    for nombre, tipo, ayuda, series in _METRICAS:
+        lineas.append(f"# HELP {nombre} {ayuda}")
+        lineas.append(f"# TYPE {nombre} {tipo}")
+        for motor, snapshot in snapshots.items():
+            for sufijo, clave in series.items():
+                lineas.append(f'{nombre}{sufijo}{{engine="{motor}"}} {snapshot[clave]}')
+    return "\n".join(lineas) + "\n"
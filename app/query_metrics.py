@@ -0,0 +1,159 @@
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Optional
+
+from decouple import config
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+
+SQL_METRICS = config("SQL_METRICS", default=True, cast=bool)
+# Veces que una misma consulta SELECT puede repetirse en una petición antes de marcarla como probable N+1
+SQL_N_MAS_1_UMBRAL = config("SQL_N_MAS_1_UMBRAL", default=5, cast=int)
+
+# Etiqueta de las peticiones que no coinciden con ninguna ruta, para no crear una serie por URL
+SIN_RUTA = "unmatched"
+
+logger = logging.getLogger(__name__)
+
+
+class RequestQueries:
+    """Consultas ejecutadas durante una petición: cantidad, tiempo en la base y repeticiones por sentencia."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+    def record(self, statement: str, segundos: float):
+        self.count += 1
+        self.seconds += segundos
+        self.statements[statement] += 1
+
+    def repeated(self, umbral: int = SQL_N_MAS_1_UMBRAL) -> list:
+        """Sentencias SELECT repetidas al menos `umbral` veces: el patrón típico de un N+1."""
+        return [
+            (statement, veces)
+            for statement, veces in self.statements.most_common()
+            if veces >= umbral and statement.lstrip().upper().startswith("SELECT")
+        ]
+
+
+# Consultas de la petición en curso; las rutas síncronas la heredan al pasar al threadpool
+_actual: ContextVar[Optional[RequestQueries]] = ContextVar("consultas_peticion", default=None)
+
+
+class RouteQueryStats:
+    """Acumulado de consultas por ruta desde el arranque del proceso."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rutas = {}
+
+    def record(self, ruta: str, consultas: RequestQueries, repetidas: list):
+        with self._lock:
+            stats = self._rutas.setdefault(ruta, {
+                "requests": 0,
+                "queries": 0,
+                "queries_max": 0,
+                "db_seconds": 0.0,
+                "n_plus_one": 0,
+                "repeated_statements": {},
+            })
+            stats["requests"] += 1
+            stats["queries"] += consultas.count
+            stats["queries_max"] = max(stats["queries_max"], consultas.count)
+            stats["db_seconds"] += consultas.seconds
+            if repetidas:
+                stats["n_plus_one"] += 1
+                for statement, veces in repetidas:
+                    stats["repeated_statements"][statement] = max(stats["repeated_statements"].get(statement, 0), veces)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                ruta: {
+                    **stats,
+                    "repeated_statements": dict(stats["repeated_statements"]),
+                    "queries_avg": round(stats["queries"] / stats["requests"], 2),
+                    "db_ms_avg": round(stats["db_seconds"] * 1000 / stats["requests"], 3),
+                }
+                for ruta, stats in sorted(self._rutas.items())
+            }
+
+    def reset(self):
+        with self._lock:
+            self._rutas.clear()
+
+
+query_stats = RouteQueryStats()
+
+
+def instrument_queries(engine):
+    """Registra los eventos del motor que miden cada consulta y la asignan a la petición en curso."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _antes(conn, cursor, statement, parameters, context, executemany):
+        # El inicio va en el contexto de la sentencia: si falla, se descarta con él
+        context._query_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _despues(conn, cursor, statement, parameters, context, executemany):
+        inicio = context._query_start
+        consultas = _actual.get()
+        if consultas is not None:
+            consultas.record(statement, time.perf_counter() - inicio)
+
+    return engine
+
+
+@lru_cache(maxsize=1024)
+def _sin_convertidores(path: str) -> str:
+    return re.sub(r"\{(\w+):\w+\}", r"{\1}", path)
+
+
+def plantilla_ruta(scope, defecto: str) -> str:
+    """Plantilla de la ruta resuelta, sin convertidores ({arbol_id:int} → {arbol_id}), o `defecto` si no coincidió ninguna."""
+    # Router deja en el scope la ruta resuelta: se agrupa por plantilla, no por cada ID.
+    # Sin convertidores, las etiquetas son las mismas con o sin las rutas asíncronas.
+    ruta = scope.get("route")
+    return _sin_convertidores(ruta.path) if hasattr(ruta, "path") else defecto
+
+
+def _nombre_ruta(scope) -> str:
+    return f"{scope['method']} {plantilla_ruta(scope, SIN_RUTA)}"
+
+
+class QueryStatsMiddleware:
+    """Mide las consultas de cada petición, las informa en Server-Timing y las acumula por ruta."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        consultas = RequestQueries()
+        token = _actual.set(consultas)
+
+        async def send_con_server_timing(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", f'db;dur={consultas.seconds * 1000:.1f};desc="{consultas.count} queries"')
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_con_server_timing)
+        finally:
+            _actual.reset(token)
+            ruta = _nombre_ruta(scope)
+            repetidas = consultas.repeated()
+            for statement, veces in repetidas:
+                logger.warning("Probable N+1 en %s: la misma consulta se ejecutó %d veces: %s", ruta, veces, " ".join(statement.split())[:300])
+            query_stats.record(ruta, consultas, repetidas)
@@ -0,0 +1,71 @@
+from functools import lru_cache
+from typing import List, Optional, Sequence
+
+from decouple import config
+from fastapi import HTTPException, Response
+from pydantic import TypeAdapter, create_model
+
+from .pagination import NEXT_CURSOR_HEADER, next_cursor
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional: sin él los listados se serializan con el response_model
+    orjson = None
+
+# Serializar los listados grandes directamente desde las filas de la consulta, sin
+# instanciar objetos del ORM ni validar cada elemento con Pydantic. Requiere orjson.
+# Es opcional: mientras está apagado, el response_model sigue validando cada listado.
+JSON_FILAS = config("JSON_FILAS", default=False, cast=bool) and orjson is not None
+
+
+class FilasJSONResponse(Response):
+    """Respuesta JSON renderizada con orjson (fechas en ISO 8601, igual que Pydantic)."""
+
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
+
+
+def columnas_esquema(modelo, esquema) -> list:
+    """Columnas de la tabla de un modelo que corresponden a los campos de un esquema de lectura, en su orden."""
+    return [modelo.__table__.c[nombre] for nombre in esquema.model_fields]
+
+
+def campos_pedidos(fields: Optional[str], esquema, pk_name: str) -> Optional[tuple]:
+    """Valida el parámetro fields= contra un esquema; devuelve los campos en el orden del esquema, siempre con la clave primaria."""
+    if not fields:
+        return None
+    pedidos = {campo.strip() for campo in fields.split(",") if campo.strip()}
+    desconocidos = pedidos - set(esquema.model_fields)
+    if desconocidos:
+        raise HTTPException(status_code=400, detail=f"Campos desconocidos: {', '.join(sorted(desconocidos))}.")
+    # La clave primaria se incluye siempre: el cursor de la página siguiente depende de ella
+    return tuple(campo for campo in esquema.model_fields if campo in pedidos or campo == pk_name)
+
+
+@lru_cache(maxsize=256)
+def esquema_parcial(esquema, campos: tuple):
+    """Modelo reducido de un esquema de lectura con sólo los campos indicados (se crea una vez por combinación)."""
+    definiciones = {campo: (esquema.model_fields[campo].annotation, esquema.model_fields[campo]) for campo in campos}
+    return create_model(f"{esquema.__name__}Parcial", __config__={"from_attributes": True}, **definiciones)
+
+
+@lru_cache(maxsize=256)
+def _adaptador(esquema) -> TypeAdapter:
+    return TypeAdapter(List[esquema])
+
+
+def respuesta_filas(filas: Sequence, pk_name: str, limit: int, esquema, campos: Optional[tuple] = None) -> Response:
+    """Serializa una página de filas (Row) con la cabecera del cursor de la página siguiente."""
+    headers = {}
+    cursor_siguiente = next_cursor(filas, pk_name, limit)
+    if cursor_siguiente:
+        headers[NEXT_CURSOR_HEADER] = cursor_siguiente
+    contenido = [dict(fila._mapping) for fila in filas]
+    if orjson is None:
+        # Sin orjson, las filas se validan y serializan con el esquema (reducido a los campos pedidos)
+        adaptador = _adaptador(esquema_parcial(esquema, campos) if campos else esquema)
+        return Response(adaptador.dump_json(adaptador.validate_python(contenido)), media_type="application/json", headers=headers)
+    # Con orjson, las filas ya traen sólo las columnas del esquema y se vuelcan tal cual
+    return FilasJSONResponse(contenido, headers=headers)
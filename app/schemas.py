@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr, field_validator, Field
-from typing import Optional, List, Annotated
+from typing import Optional, List, Annotated, Dict
 from datetime import date
 
 # --- Provincia Schemas ---
@@ -103,6 +103,24 @@ class UsuarioRead(UsuarioBase):
     class Config:
         from_attributes = True
 
+# --- Autenticación Schemas ---
+class TokenData(BaseModel):
+    email: Optional[str] = None
+
+class Principal(BaseModel):
+    """Usuario autenticado con los permisos de su rol, tal como se guarda en caché."""
+    id_usuario: int
+    id_municipio: int
+    id_role: int
+    nombre: str
+    email: str
+    is_active: Optional[bool] = True
+    is_superuser: Optional[bool] = False
+    role: RoleRead
+
+    class Config:
+        from_attributes = True
+
 # --- Arbol Schemas ---
 class ArbolBase(BaseModel):
     id_especie: int
@@ -133,10 +151,36 @@ class ArbolCreate(ArbolBase):
 
 class ArbolRead(ArbolBase):
     id_arbol: int
+    id_ultima_medicion: Optional[int] = None
 
     class Config:
         from_attributes = True
 
+class ArbolFiltro(BaseModel):
+    id_municipio: Optional[int] = None
+    id_especie: Optional[int] = None
+    requiere_intervencion: Optional[bool] = None
+    protegido: Optional[bool] = None
+    altura: Optional[Annotated[str, Field(pattern="^(1-2 m|>3 m|3-5 m|> 5m)$")]] = None
+    fecha_desde: Optional[date] = None
+    fecha_hasta: Optional[date] = None
+
+class ErrorFila(BaseModel):
+    fila: int
+    detalle: str
+
+class CargaMasivaResultado(BaseModel):
+    insertados: int
+    errores: List[ErrorFila]
+
+class EstadisticasMunicipio(BaseModel):
+    id_municipio: int
+    total: int
+    especie: Dict[str, int]
+    altura: Dict[str, int]
+    requiere_intervencion: Dict[str, int]
+    tipo_intervencion: Dict[str, int]
+
 # --- Medicion Schemas ---
 class MedicionBase(BaseModel):
     id_arbol: int
@@ -166,6 +210,16 @@ class MedicionRead(MedicionBase):
     class Config:
         from_attributes = True
 
+class ArbolConUltimaMedicion(ArbolRead):
+    ultima_medicion: Optional[MedicionRead] = None
+
+class MedicionFiltro(BaseModel):
+    id_arbol: Optional[int] = None
+    id_usuario: Optional[int] = None
+    requiere_intervencion: Optional[bool] = None
+    fecha_desde: Optional[date] = None
+    fecha_hasta: Optional[date] = None
+
 # --- Foto Schemas ---
 class FotoBase(BaseModel):
     id_medicion: int
@@ -177,6 +231,44 @@ class FotoCreate(FotoBase):
 
 class FotoRead(FotoBase):
     id_foto: int
+    sha256: Optional[str] = None
+    tamano_bytes: Optional[int] = None
+    content_type: Optional[str] = None
+    ruta_thumb: Optional[str] = None
+    ruta_medium: Optional[str] = None
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+# --- Sincronización de dispositivos ---
+class SyncMedicion(MedicionCreate):
+    clave: Annotated[str, Field(min_length=1, max_length=64)]
+
+class SyncFoto(FotoBase):
+    clave: Annotated[str, Field(min_length=1, max_length=64)]
+    id_medicion: Optional[int] = None
+    clave_medicion: Optional[str] = None
+
+class SyncLote(BaseModel):
+    mediciones: List[SyncMedicion] = []
+    fotos: List[SyncFoto] = []
+
+class SyncError(BaseModel):
+    clave: str
+    detalle: str
+
+class SyncResultado(BaseModel):
+    mediciones: Dict[str, int]
+    fotos: Dict[str, int]
+    creadas: int
+    repetidas: int
+    errores: List[SyncError]
+
+# --- Esquemas anidados de detalle ---
+class MedicionDetalle(MedicionRead):
+    fotos: List[FotoRead] = []
+
+class ArbolDetalle(ArbolRead):
+    especie: EspecieRead
+    municipio: MunicipioRead
+    mediciones: List[MedicionDetalle] = []
@@ -0,0 +1,44 @@
+from typing import Optional
+
+from fastapi import Request, Response
+from sqlalchemy import insert, select, update
+
+from . import models
+
+# Tablas cuyos listados se sirven con ETag; crud incrementa su versión en cada escritura
+TABLAS_VERSIONADAS = ("provincia", "municipio", "role")
+
+_version = models.VersionTabla.__table__
+
+
+def incrementar(db, *tablas: str) -> None:
+    """Incrementa la versión de las tablas dentro de la transacción de la escritura."""
+    for tabla in tablas:
+        actualizadas = db.execute(
+            update(_version).where(_version.c.tabla == tabla).values(version=_version.c.version + 1)
+        ).rowcount
+        if not actualizadas:
+            db.execute(insert(_version).values(tabla=tabla, version=1))
+
+
+def consulta_tabla(tabla: str):
+    """Consulta de la versión actual de una tabla (una fila por clave primaria, sin ORM)."""
+    return select(_version.c.version).where(_version.c.tabla == tabla)
+
+
+def consulta_arbol(arbol_id: int):
+    """Consulta de la versión de fila de un árbol."""
+    return select(models.Arbol.version).where(models.Arbol.id_arbol == arbol_id)
+
+
+def etag(recurso: str, version: Optional[int]) -> str:
+    return f'W/"{recurso}-{version or 0}"'
+
+
+def no_modificado(request: Request, response: Response, etag_actual: str) -> Optional[Response]:
+    """Anota el ETag en la respuesta y devuelve un 304 si el cliente ya tiene esa versión."""
+    headers = {"ETag": etag_actual, "Cache-Control": "no-cache"}
+    if etag_actual in [valor.strip() for valor in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
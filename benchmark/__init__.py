@@ -0,0 +1,2 @@
+# Suite de rendimiento: `python -m benchmark.semilla` genera un censo sintético y
+# `python -m benchmark.carga` mide la latencia de las rutas principales.
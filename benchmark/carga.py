@@ -0,0 +1,213 @@
+"""Mide latencia y throughput de las rutas principales con clientes concurrentes: python -m benchmark.carga --url http://localhost:8000."""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import httpx
+
+# Porcentaje de aumento del p95 respecto de la línea base que se considera una regresión
+TOLERANCIA = 0.2
+
+
+class Datos:
+    """IDs y coordenadas existentes, obtenidos de la propia API, con los que se arman las peticiones."""
+
+    def __init__(self, municipios: List[int], arboles: List[dict]):
+        self.municipios = municipios
+        self.arboles = arboles
+
+    @classmethod
+    async def cargar(cls, cliente: httpx.AsyncClient, muestra: int = 1000) -> "Datos":
+        municipios = (await cliente.get("/municipios/", params={"limit": muestra})).json()
+        arboles = (await cliente.get("/arboles/", params={"limit": muestra, "fields": "latitude,longitude"})).json()
+        if not municipios or not arboles:
+            raise SystemExit("La base está vacía: generar antes un censo con python -m benchmark.semilla")
+        return cls([m["id_municipio"] for m in municipios], arboles)
+
+
+def _cerca(rnd: random.Random, datos: Datos) -> dict:
+    arbol = rnd.choice(datos.arboles)
+    return {"lat": arbol["latitude"], "lon": arbol["longitude"]}
+
+
+def _rectangulo(rnd: random.Random, datos: Datos, lado: float = 0.01) -> dict:
+    centro = _cerca(rnd, datos)
+    return {
+        "min_lat": centro["lat"] - lado,
+        "min_lon": centro["lon"] - lado,
+        "max_lat": centro["lat"] + lado,
+        "max_lon": centro["lon"] + lado,
+    }
+
+
+# Escenarios: nombre → (peso relativo, función que arma (ruta, parámetros))
+ESCENARIOS: Dict[str, tuple] = {
+    "GET /arboles/": (4, lambda rnd, datos: ("/arboles/", {"limit": 100})),
+    "GET /arboles/?id_municipio": (4, lambda rnd, datos: ("/arboles/", {"id_municipio": rnd.choice(datos.municipios), "limit": 100})),
+    "GET /arboles/?fields": (2, lambda rnd, datos: ("/arboles/", {"fields": "latitude,longitude,requiere_intervencion", "limit": 1000})),
+    "GET /arboles/?embed": (1, lambda rnd, datos: ("/arboles/", {"embed": "ultima_medicion", "limit": 100})),
+    "GET /arboles/{id}": (6, lambda rnd, datos: (f"/arboles/{rnd.choice(datos.arboles)['id_arbol']}", {})),
+    "GET /arboles/{id}/full": (2, lambda rnd, datos: (f"/arboles/{rnd.choice(datos.arboles)['id_arbol']}/full", {})),
+    "GET /arboles/full": (1, lambda rnd, datos: ("/arboles/full", {"limit": 50})),
+    "GET /arboles/near": (3, lambda rnd, datos: ("/arboles/near", {**_cerca(rnd, datos), "radio_m": 500})),
+    "GET /arboles/bbox": (2, lambda rnd, datos: ("/arboles/bbox", _rectangulo(rnd, datos))),
+    "GET /mediciones/?id_arbol": (3, lambda rnd, datos: ("/mediciones/", {"id_arbol": rnd.choice(datos.arboles)["id_arbol"]})),
+    "GET /estadisticas/municipios/{id}": (2, lambda rnd, datos: (f"/estadisticas/municipios/{rnd.choice(datos.municipios)}", {})),
+    "GET /provincias/": (1, lambda rnd, datos: ("/provincias/", {})),
+    "GET /municipios/": (1, lambda rnd, datos: ("/municipios/", {})),
+}
+
+
+def percentil(valores: List[float], p: float) -> float:
+    """Percentil p (0-100) con interpolación lineal entre las muestras ordenadas."""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    posicion = (len(ordenados) - 1) * p / 100
+    inferior = int(posicion)
+    superior = min(inferior + 1, len(ordenados) - 1)
+    return ordenados[inferior] + (ordenados[superior] - ordenados[inferior]) * (posicion - inferior)
+
+
+def resumir(latencias: List[float], errores: int, segundos: float) -> dict:
+    """Resume las latencias (en segundos) de una ruta en milisegundos."""
+    return {
+        "peticiones": len(latencias),
+        "errores": errores,
+        "rps": round(len(latencias) / segundos, 2) if segundos else 0.0,
+        "p50_ms": round(percentil(latencias, 50) * 1000, 2),
+        "p95_ms": round(percentil(latencias, 95) * 1000, 2),
+        "p99_ms": round(percentil(latencias, 99) * 1000, 2),
+        "max_ms": round(max(latencias, default=0) * 1000, 2),
+    }
+
+
+async def medir(
+    cliente: httpx.AsyncClient,
+    peticiones: int = 1000,
+    concurrencia: int = 10,
+    escenarios: Optional[Dict[str, tuple]] = None,
+    calentamiento: int = 50,
+    semilla: int = 1,
+) -> dict:
+    """Ejecuta las peticiones repartidas entre los escenarios con `concurrencia` clientes simultáneos."""
+    escenarios = escenarios or ESCENARIOS
+    rnd = random.Random(semilla)
+    datos = await Datos.cargar(cliente)
+    nombres = list(escenarios)
+    pesos = [escenarios[nombre][0] for nombre in nombres]
+
+    # El plan se arma antes de medir para que todas las ejecuciones con la misma semilla pidan lo mismo
+    plan = []
+    for nombre in rnd.choices(nombres, weights=pesos, k=calentamiento + peticiones):
+        ruta, parametros = escenarios[nombre][1](rnd, datos)
+        plan.append((nombre, ruta, parametros))
+
+    latencias: Dict[str, List[float]] = {nombre: [] for nombre in nombres}
+    errores: Dict[str, int] = {nombre: 0 for nombre in nombres}
+    pendientes = iter(enumerate(plan))
+
+    async def cliente_concurrente():
+        for numero, (nombre, ruta, parametros) in pendientes:
+            inicio = time.perf_counter()
+            try:
+                response = await cliente.get(ruta, params=parametros)
+                fallo = response.status_code >= 400
+            except httpx.HTTPError:
+                fallo = True
+            duracion = time.perf_counter() - inicio
+            if numero < calentamiento:
+                continue
+            if fallo:
+                errores[nombre] += 1
+            else:
+                latencias[nombre].append(duracion)
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(cliente_concurrente() for _ in range(concurrencia)))
+    segundos = time.perf_counter() - inicio
+
+    todas = [valor for valores in latencias.values() for valor in valores]
+    return {
+        "meta": {
+            "fecha": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "base_url": str(cliente.base_url),
+            "peticiones": peticiones,
+            "concurrencia": concurrencia,
+            "segundos": round(segundos, 2),
+        },
+        "total": resumir(todas, sum(errores.values()), segundos),
+        "rutas": {nombre: resumir(latencias[nombre], errores[nombre], segundos) for nombre in nombres if latencias[nombre] or errores[nombre]},
+    }
+
+
+def comparar(actual: dict, base: dict, tolerancia: float = TOLERANCIA) -> List[str]:
+    """Lista las rutas cuyo p95 empeoró más que la tolerancia, o que empezaron a fallar, respecto de una ejecución anterior."""
+    regresiones = []
+    for nombre, previo in base.get("rutas", {}).items():
+        medido = actual["rutas"].get(nombre)
+        if medido is None:
+            continue
+        if medido["p95_ms"] > previo["p95_ms"] * (1 + tolerancia):
+            regresiones.append(f"{nombre}: p95 {previo['p95_ms']} ms → {medido['p95_ms']} ms")
+        if medido["errores"] > previo["errores"]:
+            regresiones.append(f"{nombre}: errores {previo['errores']} → {medido['errores']}")
+    return regresiones
+
+
+def _cliente(url: Optional[str]) -> httpx.AsyncClient:
+    if url:
+        return httpx.AsyncClient(base_url=url, timeout=60, limits=httpx.Limits(max_connections=None))
+    # Sin URL se mide la aplicación en el mismo proceso, sin servidor HTTP de por medio
+    from app.main import app
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark", timeout=60)
+
+
+async def ejecutar(url: Optional[str], **opciones) -> dict:
+    async with _cliente(url) as cliente:
+        return await medir(cliente, **opciones)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Mide p50/p95/p99 y throughput por ruta.")
+    parser.add_argument("--url", help="URL de un servidor en marcha; sin ella se mide la app en el mismo proceso")
+    parser.add_argument("--peticiones", type=int, default=1000)
+    parser.add_argument("--concurrencia", type=int, default=10)
+    parser.add_argument("--calentamiento", type=int, default=50, help="Peticiones iniciales que no se miden")
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--salida", help="Archivo JSON de resultados (por defecto, salida estándar)")
+    parser.add_argument("--comparar", help="Resultados JSON de una ejecución anterior; sale con código 1 si hay regresiones")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA)
+    args = parser.parse_args(argv)
+
+    resultado = asyncio.run(ejecutar(
+        args.url,
+        peticiones=args.peticiones,
+        concurrencia=args.concurrencia,
+        calentamiento=args.calentamiento,
+        semilla=args.semilla,
+    ))
+    contenido = json.dumps(resultado, indent=2, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as archivo:
+            archivo.write(contenido + "\n")
+    else:
+        print(contenido)
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as archivo:
+            regresiones = comparar(resultado, json.load(archivo), args.tolerancia)
+        for regresion in regresiones:
+            print(f"REGRESIÓN {regresion}", file=sys.stderr)
+        if regresiones:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
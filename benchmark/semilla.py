@@ -0,0 +1,216 @@
+"""Genera un censo sintético para medir rendimiento: python -m benchmark.semilla --arboles 1000000."""
+
+import argparse
+import json
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import func, insert, select, text
+
+from app import crud, estadisticas, geo, models
+from app.database import engine
+
+# Rectángulo donde se ubican los municipios sintéticos
+LAT_MIN, LAT_MAX = -40.0, -25.0
+LON_MIN, LON_MAX = -70.0, -55.0
+# Dispersión, en grados, de los árboles alrededor del centro de su municipio
+DISPERSION = 0.05
+
+ALTURAS = sorted(crud.ALTURA_VALUES)
+DIAMETROS = sorted(crud.DIAMETRO_TRONCO_VALUES)
+AMBITOS = sorted(crud.AMBITO_VALUES)
+INTERFERENCIAS = sorted(crud.INTERFERENCIA_AEREA_VALUES)
+TIPOS_CABLE = sorted(crud.TIPO_CABLE_VALUES - {""})
+INTERVENCIONES = sorted(crud.TIPO_INTERVENCION_VALUES - {""})
+
+
+def _siguiente_id(conn, columna) -> int:
+    return (conn.execute(select(func.max(columna))).scalar() or 0) + 1
+
+
+def _datos_comunes(rnd: random.Random, lat: float, lon: float) -> dict:
+    requiere = rnd.random() < 0.3
+    return {
+        "latitude": lat,
+        "longitude": lon,
+        "altura": rnd.choice(ALTURAS),
+        "diametro_tronco": rnd.choice(DIAMETROS),
+        "ambito": rnd.choice(AMBITOS),
+        "distancia_entre_ejemplares": f"{rnd.randint(2, 15)} m",
+        "distancia_al_cordon": f"{rnd.randint(0, 3)} m",
+        "interferencia_aerea": rnd.choice(INTERFERENCIAS),
+        "tipo_cable": rnd.choice(TIPOS_CABLE),
+        "requiere_intervencion": requiere,
+        "tipo_intervencion": rnd.choice(INTERVENCIONES) if requiere else None,
+        "tratamiento_previo": None,
+        "cazuela": None,
+        "protegido": rnd.random() < 0.05,
+    }
+
+
+def _catalogos(conn, rnd: random.Random, provincias: int, municipios_por_provincia: int, especies: int, etiqueta: str) -> tuple:
+    """Crea provincias, municipios, especies, un rol y un usuario; devuelve (municipios, especies, id_usuario)."""
+    id_provincia = _siguiente_id(conn, models.Provincia.id_provincia)
+    id_municipio = _siguiente_id(conn, models.Municipio.id_municipio)
+    id_especie = _siguiente_id(conn, models.Especie.id_especie)
+
+    filas_provincia, filas_municipio = [], []
+    for p in range(provincias):
+        filas_provincia.append({"id_provincia": id_provincia + p, "nombre": f"Provincia {etiqueta}-{p}"})
+        for m in range(municipios_por_provincia):
+            filas_municipio.append({
+                "id_municipio": id_municipio + len(filas_municipio),
+                "id_provincia": id_provincia + p,
+                "nombre": f"Municipio {etiqueta}-{p}-{m}",
+                "latitude": rnd.uniform(LAT_MIN, LAT_MAX),
+                "longitude": rnd.uniform(LON_MIN, LON_MAX),
+            })
+    filas_especie = [
+        {"id_especie": id_especie + e, "nombre_cientifico": f"Species {etiqueta}-{e}", "nombre_comun": f"Especie {e}", "origen": rnd.choice(["nativo", "exotico"])}
+        for e in range(especies)
+    ]
+    conn.execute(insert(models.Provincia), filas_provincia)
+    conn.execute(insert(models.Municipio), filas_municipio)
+    conn.execute(insert(models.Especie), filas_especie)
+
+    id_role = conn.execute(insert(models.Role).values(role_name=f"benchmark-{etiqueta}").returning(models.Role.id_role)).scalar_one()
+    id_usuario = conn.execute(
+        insert(models.Usuario)
+        .values(
+            id_municipio=filas_municipio[0]["id_municipio"],
+            id_role=id_role,
+            nombre="Benchmark",
+            email=f"benchmark-{etiqueta}@example.com",
+            hashed_password="!",
+            is_active=False,
+            date_joined=date.today(),
+        )
+        .returning(models.Usuario.id_usuario)
+    ).scalar_one()
+    return filas_municipio, [fila["id_especie"] for fila in filas_especie], id_usuario
+
+
+def _ajustar_secuencias(conn) -> None:
+    """En PostgreSQL, adelanta las secuencias por encima de los IDs insertados explícitamente."""
+    if conn.dialect.name != "postgresql":
+        return
+    for columna in (
+        models.Provincia.id_provincia,
+        models.Municipio.id_municipio,
+        models.Especie.id_especie,
+        models.Arbol.id_arbol,
+        models.Medicion.id_medicion,
+    ):
+        tabla = columna.table.name
+        conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{tabla}', '{columna.name}'), "
+            f"(SELECT COALESCE(MAX({columna.name}), 1) FROM {tabla}))"
+        ))
+
+
+def sembrar(
+    provincias: int = 5,
+    municipios_por_provincia: int = 20,
+    especies: int = 50,
+    arboles: int = 10_000,
+    mediciones_por_arbol: int = 2,
+    lote: int = 5_000,
+    semilla: int = 1,
+    conexion=engine,
+    progreso=None,
+) -> dict:
+    """Inserta un censo sintético reproducible por lotes y devuelve cuántas filas creó de cada tabla."""
+    rnd = random.Random(semilla)
+    etiqueta = f"{semilla}-{int(time.time())}"
+    models.Base.metadata.create_all(bind=conexion)
+
+    with conexion.begin() as conn:
+        municipios, ids_especie, id_usuario = _catalogos(conn, rnd, provincias, municipios_por_provincia, especies, etiqueta)
+        id_arbol = _siguiente_id(conn, models.Arbol.id_arbol)
+        id_medicion = _siguiente_id(conn, models.Medicion.id_medicion)
+
+    creados = 0
+    while creados < arboles:
+        filas_arbol, filas_medicion = [], []
+        for _ in range(min(lote, arboles - creados)):
+            municipio = rnd.choice(municipios)
+            lat = municipio["latitude"] + rnd.uniform(-DISPERSION, DISPERSION)
+            lon = municipio["longitude"] + rnd.uniform(-DISPERSION, DISPERSION)
+            fecha_censo = date(2015, 1, 1) + timedelta(days=rnd.randint(0, 3650))
+            arbol = _datos_comunes(rnd, lat, lon)
+            arbol.update(
+                id_arbol=id_arbol,
+                id_especie=rnd.choice(ids_especie),
+                id_municipio=municipio["id_municipio"],
+                calle=f"Calle {rnd.randint(1, 500)}",
+                numero_aprox=rnd.randint(1, 5000),
+                identificacion=f"bench-{id_arbol}",
+                barrio=None,
+                fecha_censo=fecha_censo,
+                id_usuario=id_usuario,
+                geohash=geo.encode_geohash(lat, lon),
+                id_ultima_medicion=None,
+            )
+            # Mediciones en orden cronológico: la última generada es la más reciente
+            fecha = fecha_censo
+            for _ in range(mediciones_por_arbol):
+                fecha += timedelta(days=rnd.randint(30, 365))
+                medicion = _datos_comunes(rnd, lat, lon)
+                medicion.update(id_medicion=id_medicion, id_arbol=id_arbol, fecha_medicion=fecha, id_usuario=id_usuario)
+                filas_medicion.append(medicion)
+                arbol["id_ultima_medicion"] = id_medicion
+                id_medicion += 1
+            filas_arbol.append(arbol)
+            id_arbol += 1
+
+        with conexion.begin() as conn:
+            conn.execute(insert(models.Arbol), filas_arbol)
+            if filas_medicion:
+                conn.execute(insert(models.Medicion), filas_medicion)
+            estadisticas.aplicar(conn, estadisticas.contar(filas_arbol))
+        creados += len(filas_arbol)
+        if progreso:
+            progreso(creados, arboles)
+
+    with conexion.begin() as conn:
+        _ajustar_secuencias(conn)
+
+    return {
+        "provincias": provincias,
+        "municipios": len(municipios),
+        "especies": len(ids_especie),
+        "arboles": creados,
+        "mediciones": creados * mediciones_por_arbol,
+    }
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Genera un censo sintético en DATABASE_URL.")
+    parser.add_argument("--provincias", type=int, default=5)
+    parser.add_argument("--municipios-por-provincia", type=int, default=20)
+    parser.add_argument("--especies", type=int, default=50)
+    parser.add_argument("--arboles", type=int, default=10_000)
+    parser.add_argument("--mediciones-por-arbol", type=int, default=2)
+    parser.add_argument("--lote", type=int, default=5_000, help="Árboles por transacción")
+    parser.add_argument("--semilla", type=int, default=1, help="Semilla aleatoria, para repetir el mismo censo")
+    args = parser.parse_args(argv)
+
+    inicio = time.perf_counter()
+    resultado = sembrar(
+        provincias=args.provincias,
+        municipios_por_provincia=args.municipios_por_provincia,
+        especies=args.especies,
+        arboles=args.arboles,
+        mediciones_por_arbol=args.mediciones_por_arbol,
+        lote=args.lote,
+        semilla=args.semilla,
+        progreso=lambda hechos, total: print(f"{hechos}/{total} árboles", file=sys.stderr),
+    )
+    resultado["segundos"] = round(time.perf_counter() - inicio, 2)
+    print(json.dumps(resultado))
+
+
+if __name__ == "__main__":
+    main()
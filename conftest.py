@@ -15,3 +15,11 @@ def test_db():
 def client():
     with TestClient(app) as c:
         yield c
+
+# Las cachés en memoria sobreviven entre módulos; cada módulo recrea las tablas
+@pytest.fixture(scope="module", autouse=True)
+def limpiar_caches():
+    from app.cache import catalogos, principales
+    for cache in list(catalogos.values()) + [principales]:
+        cache.invalidate()
+    yield
@@ -1,6 +1,13 @@
+import io
+import json
 import pytest
+from datetime import date
+from types import SimpleNamespace
+from fastapi import HTTPException
 from fastapi.testclient import TestClient
-from app.main import app
+from app.main import app, create_app
+from app import crud, database, http_metrics, models, query_metrics, respuestas, schemas
+from sqlalchemy import text
 from app.database import Base, engine, SessionLocal
 
 # Crear un cliente de pruebas
@@ -61,3 +68,667 @@ def test_eliminar_provincia(client):
     # Verifica que la provincia fue eliminada
     response = client.get(f"/provincias/{provincia_id}")
     assert response.status_code == 404
+
+def test_paginacion_por_cursor(client):
+    for nombre in ("Cursor Uno", "Cursor Dos", "Cursor Tres"):
+        client.post("/provincias/", json={"nombre": nombre})
+
+    primera = client.get("/provincias/", params={"limit": 2})
+    assert primera.status_code == 200
+    cursor = primera.headers["X-Next-Cursor"]
+
+    segunda = client.get("/provincias/", params={"limit": 2, "cursor": cursor})
+    assert segunda.status_code == 200
+    ids_primera = [p["id_provincia"] for p in primera.json()]
+    ids_segunda = [p["id_provincia"] for p in segunda.json()]
+    assert ids_segunda and min(ids_segunda) > max(ids_primera)
+
+def test_cursor_invalido(client):
+    response = client.get("/provincias/", params={"cursor": "no-es-un-cursor"})
+    assert response.status_code == 400
+
+# --- Datos de prueba para árboles ---
+@pytest.fixture(scope="module")
+def catalogo(client):
+    db = SessionLocal()
+    try:
+        provincia = crud.create_provincia(db, schemas.ProvinciaCreate(nombre="Provincia Arbolada"))
+        municipio = crud.create_municipio(db, schemas.MunicipioCreate(id_provincia=provincia.id_provincia, nombre="Municipio Arbolado"))
+        especie = crud.create_especie(db, schemas.EspecieCreate(nombre_cientifico="Tipuana tipu", nombre_comun="Tipa", origen="nativo"))
+        yield {"id_municipio": municipio.id_municipio, "id_especie": especie.id_especie}
+    finally:
+        db.close()
+
+def datos_arbol(catalogo, **extra):
+    datos = {
+        "id_especie": catalogo["id_especie"],
+        "id_municipio": catalogo["id_municipio"],
+        "latitude": -34.6037,
+        "longitude": -58.3816,
+        "altura": "3-5 m",
+        "diametro_tronco": "5-15 cm",
+        "ambito": "Urbano",
+        "distancia_entre_ejemplares": "5 m",
+        "distancia_al_cordon": "1 m",
+        "interferencia_aerea": "Baja",
+        "requiere_intervencion": False,
+        "protegido": False,
+        "fecha_censo": date(2024, 5, 1).isoformat(),
+    }
+    datos.update(extra)
+    return datos
+
+def crear_arbol(catalogo, **extra):
+    db = SessionLocal()
+    try:
+        return crud.create_arbol(db, schemas.ArbolCreate(**datos_arbol(catalogo, **extra))).id_arbol
+    finally:
+        db.close()
+
+def test_arboles_bbox_y_cercanos(client, catalogo):
+    centro = crear_arbol(catalogo, latitude=-34.6037, longitude=-58.3816)
+    vecino = crear_arbol(catalogo, latitude=-34.6040, longitude=-58.3820)
+    lejano = crear_arbol(catalogo, latitude=-31.4201, longitude=-64.1888)
+
+    response = client.get("/arboles/bbox", params={"min_lat": -34.61, "min_lon": -58.39, "max_lat": -34.60, "max_lon": -58.37})
+    assert response.status_code == 200
+    ids = {a["id_arbol"] for a in response.json()}
+    assert {centro, vecino} <= ids
+    assert lejano not in ids
+
+    response = client.get("/arboles/near", params={"lat": -34.6037, "lon": -58.3816, "radio_m": 100})
+    assert response.status_code == 200
+    assert [a["id_arbol"] for a in response.json()][:2] == [centro, vecino]
+    # Se cortan los más cercanos antes de cargar los árboles completos
+    response = client.get("/arboles/near", params={"lat": -34.6037, "lon": -58.3816, "radio_m": 100, "limit": 1})
+    assert [a["id_arbol"] for a in response.json()] == [centro]
+
+def test_filtros_de_arboles(client, catalogo):
+    protegido = crear_arbol(catalogo, protegido=True, requiere_intervencion=True, altura="> 5m", fecha_censo="2025-03-01")
+    comun = crear_arbol(catalogo, fecha_censo="2025-03-02")
+
+    response = client.get("/arboles/", params={"id_municipio": catalogo["id_municipio"], "protegido": True, "limit": 500})
+    assert response.status_code == 200
+    ids = [a["id_arbol"] for a in response.json()]
+    assert protegido in ids and comun not in ids
+
+    response = client.get("/arboles/", params={"altura": "> 5m", "requiere_intervencion": "true", "fecha_desde": "2025-01-01"})
+    assert [a["id_arbol"] for a in response.json()] == [protegido]
+
+    response = client.get("/arboles/", params={"altura": "10 m"})
+    assert response.status_code == 422
+
+def test_estadisticas_municipio(client, catalogo):
+    db = SessionLocal()
+    try:
+        municipio = crud.create_municipio(db, schemas.MunicipioCreate(id_provincia=crud.get_municipio(db, catalogo["id_municipio"]).id_provincia, nombre="Municipio Estadístico"))
+        otro = {**catalogo, "id_municipio": municipio.id_municipio}
+    finally:
+        db.close()
+    primero = crear_arbol(otro, requiere_intervencion=True, tipo_intervencion="Raleo")
+    crear_arbol(otro, altura="> 5m")
+    client.post("/arboles/bulk", json=[datos_arbol(otro), datos_arbol(otro, id_especie=999999)])
+
+    db = SessionLocal()
+    try:
+        crud.update_arbol(db, primero, schemas.ArbolCreate(**datos_arbol(otro, altura="1-2 m")))
+    finally:
+        db.close()
+
+    response = client.get(f"/estadisticas/municipios/{municipio.id_municipio}")
+    assert response.status_code == 200
+    resumen = response.json()
+    assert resumen["total"] == 3
+    assert resumen["altura"] == {"1-2 m": 1, "> 5m": 1, "3-5 m": 1}
+    assert resumen["requiere_intervencion"] == {"false": 3}
+    assert resumen["tipo_intervencion"] == {"ninguna": 3}
+    assert resumen["especie"] == {str(catalogo["id_especie"]): 3}
+
+    client.delete(f"/arboles/{primero}")
+    assert client.get(f"/estadisticas/municipios/{municipio.id_municipio}").json()["total"] == 2
+    assert client.get("/estadisticas/municipios/999999").status_code == 404
+
+def test_carga_masiva_arboles(client, catalogo):
+    validas = [datos_arbol(catalogo, identificacion=f"bulk-{i}") for i in range(3)]
+    invalida = datos_arbol(catalogo, altura="enorme")
+    sin_municipio = datos_arbol(catalogo, id_municipio=999999)
+    response = client.post("/arboles/bulk", json=validas + [invalida, sin_municipio])
+    assert response.status_code == 200
+    resultado = response.json()
+    assert resultado["insertados"] == 3
+    assert [e["fila"] for e in resultado["errores"]] == [4, 5]
+
+def test_carga_masiva_arboles_csv(client, catalogo):
+    fila = datos_arbol(catalogo, identificacion="bulk-csv")
+    columnas = ",".join(fila)
+    valores = ",".join(str(v) for v in fila.values())
+    response = client.post(
+        "/arboles/bulk",
+        content=f"{columnas}\n{valores}\n",
+        headers={"Content-Type": "text/csv"},
+    )
+    assert response.status_code == 200
+    assert response.json() == {"insertados": 1, "errores": []}
+
+def test_exportar_arboles(client, catalogo):
+    crear_arbol(catalogo, identificacion="export-1", fecha_censo="2023-01-15")
+
+    response = client.get("/arboles/export", params={"formato": "ndjson", "fecha_hasta": "2023-12-31"})
+    assert response.status_code == 200
+    filas = [json.loads(linea) for linea in response.text.splitlines()]
+    assert [f["identificacion"] for f in filas] == ["export-1"]
+
+    response = client.get("/arboles/export", params={"formato": "csv", "id_municipio": catalogo["id_municipio"]})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert response.text.splitlines()[0].startswith("id_arbol,")
+
+def test_arbol_detalle_anidado(client, catalogo):
+    id_arbol = crear_arbol(catalogo, identificacion="detalle-1")
+    db = SessionLocal()
+    try:
+        medicion = models.Medicion(
+            id_arbol=id_arbol,
+            fecha_medicion=date(2024, 6, 1),
+            altura="3-5 m",
+            diametro_tronco="5-15 cm",
+            ambito="Urbano",
+            distancia_entre_ejemplares="5 m",
+            distancia_al_cordon="1 m",
+            interferencia_aerea="Baja",
+            fotos=[models.Foto(tipo_foto="General", ruta_foto="fotos/1.jpg")],
+        )
+        db.add(medicion)
+        db.commit()
+    finally:
+        db.close()
+
+    response = client.get(f"/arboles/{id_arbol}/full")
+    assert response.status_code == 200
+    detalle = response.json()
+    assert detalle["especie"]["nombre_comun"] == "Tipa"
+    assert detalle["municipio"]["id_municipio"] == catalogo["id_municipio"]
+    assert detalle["mediciones"][0]["fotos"][0]["ruta_foto"] == "fotos/1.jpg"
+
+    response = client.get("/arboles/full", params={"limit": 500})
+    assert response.status_code == 200
+    assert id_arbol in [a["id_arbol"] for a in response.json()]
+
+def test_ultima_medicion_por_arbol(client, catalogo):
+    id_arbol = crear_arbol(catalogo, identificacion="ultima-1")
+    db = SessionLocal()
+    try:
+        role = crud.create_role(db, schemas.RoleCreate(role_name="Medidor"))
+        usuario = models.Usuario(
+            id_municipio=catalogo["id_municipio"], id_role=role.id_role, nombre="Medidor",
+            email="medidor@example.com", hashed_password="x", date_joined=date(2024, 1, 1),
+        )
+        db.add(usuario)
+        db.commit()
+
+        def medir(fecha):
+            datos = {k: v for k, v in datos_arbol(catalogo).items() if k in schemas.MedicionCreate.model_fields}
+            medicion = schemas.MedicionCreate(**datos, id_arbol=id_arbol, id_usuario=usuario.id_usuario, fecha_medicion=fecha)
+            return crud.create_medicion(db, medicion).id_medicion
+
+        reciente = medir(date(2024, 9, 1))
+        anterior = medir(date(2024, 3, 1))
+    finally:
+        db.close()
+
+    def arbol_listado(**params):
+        arboles = client.get("/arboles/", params={"limit": 500, **params}).json()
+        return next(a for a in arboles if a["id_arbol"] == id_arbol)
+
+    assert "ultima_medicion" not in arbol_listado()
+    assert arbol_listado()["id_ultima_medicion"] == reciente
+    assert arbol_listado(embed="ultima_medicion")["ultima_medicion"]["id_medicion"] == reciente
+
+    db = SessionLocal()
+    try:
+        crud.delete_medicion(db, reciente)
+    finally:
+        db.close()
+    assert arbol_listado(embed="ultima_medicion")["ultima_medicion"]["id_medicion"] == anterior
+
+def test_subida_y_descarga_de_fotos(client, catalogo, tmp_path, monkeypatch):
+    from app.almacenamiento import almacen
+    monkeypatch.setattr(almacen, "raiz", tmp_path)
+    id_arbol = crear_arbol(catalogo, identificacion="foto-1")
+    db = SessionLocal()
+    try:
+        medicion = models.Medicion(
+            id_arbol=id_arbol, fecha_medicion=date(2024, 6, 1), altura="3-5 m", diametro_tronco="5-15 cm",
+            ambito="Urbano", distancia_entre_ejemplares="5 m", distancia_al_cordon="1 m",
+        )
+        db.add(medicion)
+        db.commit()
+        id_medicion = medicion.id_medicion
+    finally:
+        db.close()
+
+    contenido = b"\xff\xd8\xff" + b"foto" * 1000
+    datos = {"id_medicion": str(id_medicion), "tipo_foto": "general"}
+    response = client.post("/fotos/upload", data=datos, files={"archivo": ("a.jpg", contenido, "image/jpeg")})
+    assert response.status_code == 201
+    foto = response.json()
+    assert foto["tamano_bytes"] == len(contenido)
+
+    # Volver a subir el mismo contenido devuelve la misma foto sin duplicar el archivo
+    response = client.post("/fotos/upload", data=datos, files={"archivo": ("b.jpg", contenido, "image/jpeg")})
+    assert response.status_code == 200
+    assert response.json()["id_foto"] == foto["id_foto"]
+    assert len([p for p in tmp_path.rglob("*") if p.is_file()]) == 1
+
+    response = client.get(f"/fotos/{foto['id_foto']}/archivo")
+    assert response.status_code == 200
+    assert response.content == contenido
+    etag = response.headers["etag"]
+    assert client.get(f"/fotos/{foto['id_foto']}/archivo", headers={"If-None-Match": etag}).status_code == 304
+    response = client.get(f"/fotos/{foto['id_foto']}/archivo", headers={"Range": "bytes=0-2"})
+    assert response.status_code == 206
+    assert response.content == contenido[:3]
+
+    response = client.post("/fotos/upload", data=datos, files={"archivo": ("a.txt", b"hola", "text/plain")})
+    assert response.status_code == 415
+
+def test_miniaturas_en_segundo_plano(client, catalogo, tmp_path, monkeypatch):
+    Image = pytest.importorskip("PIL.Image")
+    from app import derivados
+    from app.almacenamiento import almacen
+    monkeypatch.setattr(almacen, "raiz", tmp_path)
+    monkeypatch.setattr(derivados, "_executor", None)
+    id_arbol = crear_arbol(catalogo, identificacion="miniatura-1")
+    db = SessionLocal()
+    try:
+        medicion = models.Medicion(
+            id_arbol=id_arbol, fecha_medicion=date(2024, 6, 1), altura="3-5 m", diametro_tronco="5-15 cm",
+            ambito="Urbano", distancia_entre_ejemplares="5 m", distancia_al_cordon="1 m",
+        )
+        db.add(medicion)
+        db.commit()
+        id_medicion = medicion.id_medicion
+    finally:
+        db.close()
+
+    imagen = io.BytesIO()
+    Image.new("RGB", (2000, 1000), "green").save(imagen, "PNG")
+    response = client.post(
+        "/fotos/upload",
+        data={"id_medicion": str(id_medicion), "tipo_foto": "general"},
+        files={"archivo": ("arbol.png", imagen.getvalue(), "image/png")},
+    )
+    assert response.status_code == 201
+    id_foto = response.json()["id_foto"]
+
+    # Esperar a que el pool termine los derivados encolados
+    derivados._executor.shutdown(wait=True)
+    foto = client.get(f"/fotos/{id_foto}").json()
+    assert foto["ruta_thumb"] and foto["ruta_medium"]
+
+    response = client.get(f"/fotos/{id_foto}", params={"size": "thumb"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/webp"
+    assert max(Image.open(io.BytesIO(response.content)).size) == 256
+
+def test_sync_idempotente(client, catalogo):
+    id_arbol = crear_arbol(catalogo, identificacion="sync-1")
+    db = SessionLocal()
+    try:
+        role = crud.create_role(db, schemas.RoleCreate(role_name="Dispositivo"))
+        usuario = models.Usuario(
+            id_municipio=catalogo["id_municipio"], id_role=role.id_role, nombre="Tablet",
+            email="tablet@example.com", hashed_password="x", date_joined=date(2024, 1, 1),
+        )
+        db.add(usuario)
+        db.commit()
+        id_usuario = usuario.id_usuario
+    finally:
+        db.close()
+
+    medicion = {k: v for k, v in datos_arbol(catalogo).items() if k in schemas.MedicionCreate.model_fields}
+    lote = {
+        "mediciones": [
+            {**medicion, "clave": "m-1", "id_arbol": id_arbol, "id_usuario": id_usuario, "fecha_medicion": "2024-10-01"},
+            {**medicion, "clave": "m-2", "id_arbol": 999999, "id_usuario": id_usuario, "fecha_medicion": "2024-10-01"},
+        ],
+        "fotos": [
+            {"clave": "f-1", "clave_medicion": "m-1", "tipo_foto": "general", "ruta_foto": "fotos/sync.jpg"},
+            {"clave": "f-2", "clave_medicion": "m-2", "tipo_foto": "general", "ruta_foto": "fotos/sync2.jpg"},
+        ],
+    }
+    response = client.post("/sync", json=lote)
+    assert response.status_code == 200
+    resultado = response.json()
+    assert resultado["creadas"] == 2
+    assert set(resultado["mediciones"]) == {"m-1"}
+    assert set(resultado["fotos"]) == {"f-1"}
+    assert {e["clave"] for e in resultado["errores"]} == {"m-2", "f-2"}
+
+    # Reenviar el mismo lote no escribe nada y devuelve los mismos IDs
+    repetido = client.post("/sync", json=lote).json()
+    assert repetido["creadas"] == 0
+    assert repetido["repetidas"] == 2
+    assert repetido["mediciones"] == resultado["mediciones"]
+    assert repetido["fotos"] == resultado["fotos"]
+
+def test_sync_medicion_sin_usuario(client, catalogo):
+    id_arbol = crear_arbol(catalogo, identificacion="sync-sin-usuario")
+    medicion = {k: v for k, v in datos_arbol(catalogo).items() if k in schemas.MedicionCreate.model_fields}
+    lote = {"mediciones": [{**medicion, "clave": "sin-usuario-1", "id_arbol": id_arbol, "id_usuario": None, "fecha_medicion": "2024-11-01"}]}
+
+    resultado = client.post("/sync", json=lote).json()
+    assert resultado["errores"] == []
+    assert resultado["creadas"] == 1 and set(resultado["mediciones"]) == {"sin-usuario-1"}
+
+    repetido = client.post("/sync", json=lote).json()
+    assert (repetido["creadas"], repetido["repetidas"]) == (0, 1)
+    assert repetido["mediciones"] == resultado["mediciones"]
+
+def test_baja_de_usuario_invalida_sus_arboles_en_cache(client, catalogo):
+    db = SessionLocal()
+    try:
+        role = crud.create_role(db, schemas.RoleCreate(role_name="Censista Temporal"))
+        usuario = models.Usuario(
+            id_municipio=catalogo["id_municipio"], id_role=role.id_role, nombre="Temporal",
+            email="temporal@example.com", hashed_password="x", date_joined=date(2024, 1, 1),
+        )
+        db.add(usuario)
+        db.commit()
+        id_usuario = usuario.id_usuario
+    finally:
+        db.close()
+    id_arbol = crear_arbol(catalogo, identificacion="del-usuario", id_usuario=id_usuario)
+
+    medicion = {k: v for k, v in datos_arbol(catalogo).items() if k in schemas.MedicionCreate.model_fields}
+    medicion.update(id_arbol=id_arbol, fecha_medicion="2024-12-01")
+    assert client.post("/sync", json={"mediciones": [{**medicion, "clave": "baja-1"}]}).json()["creadas"] == 1
+
+    # Los árboles del usuario se eliminan en cascada y dejan de figurar como existentes
+    assert client.delete(f"/usuarios/{id_usuario}").status_code == 204
+    response = client.post("/sync", json={"mediciones": [{**medicion, "clave": "baja-2"}]})
+    assert response.status_code == 200
+    assert response.json()["errores"] == [{"clave": "baja-2", "detalle": f"El árbol con ID {id_arbol} no existe."}]
+
+def test_sync_ignora_arboles_obsoletos_en_cache(client, catalogo):
+    id_arbol = crear_arbol(catalogo, identificacion="obsoleto")
+    medicion = {k: v for k, v in datos_arbol(catalogo).items() if k in schemas.MedicionCreate.model_fields}
+    medicion.update(id_arbol=id_arbol, fecha_medicion="2024-12-01")
+    assert client.post("/sync", json={"mediciones": [{**medicion, "clave": "obsoleto-1"}]}).json()["creadas"] == 1
+
+    # Borrado hecho por otro proceso: la caché de este sigue dando el árbol por existente
+    db = SessionLocal()
+    try:
+        db.query(models.Medicion).filter(models.Medicion.id_arbol == id_arbol).delete()
+        db.query(models.Arbol).filter(models.Arbol.id_arbol == id_arbol).delete()
+        db.commit()
+    finally:
+        db.close()
+    response = client.post("/sync", json={"mediciones": [{**medicion, "clave": "obsoleto-2"}]})
+    assert response.status_code == 200
+    assert response.json()["errores"] == [{"clave": "obsoleto-2", "detalle": f"El árbol con ID {id_arbol} no existe."}]
+
+def test_etag_de_listados_y_arboles(client, catalogo):
+    response = client.get("/provincias/")
+    etag = response.headers["etag"]
+    assert client.get("/provincias/", headers={"If-None-Match": etag}).status_code == 304
+
+    client.post("/provincias/", json={"nombre": "Provincia Versionada"})
+    response = client.get("/provincias/", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+    id_arbol = crear_arbol(catalogo, identificacion="etag-1")
+    etag = client.get(f"/arboles/{id_arbol}").headers["etag"]
+    assert client.get(f"/arboles/{id_arbol}", headers={"If-None-Match": etag}).status_code == 304
+    db = SessionLocal()
+    try:
+        crud.update_arbol(db, id_arbol, schemas.ArbolCreate(**datos_arbol(catalogo, identificacion="etag-2")))
+    finally:
+        db.close()
+    response = client.get(f"/arboles/{id_arbol}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["identificacion"] == "etag-2"
+
+def test_listados_desde_filas_y_comprimidos(client, catalogo, monkeypatch):
+    for numero in range(12):
+        crear_arbol(catalogo, identificacion=f"comprimido-{numero}")
+
+    id_arbol = crear_arbol(catalogo, identificacion="comprimido-medido")
+    db = SessionLocal()
+    try:
+        datos = {k: v for k, v in datos_arbol(catalogo, tratamiento_previo="poda").items() if k in schemas.MedicionCreate.model_fields}
+        for dia in (1, 2, 3):
+            crud.create_medicion(db, schemas.MedicionCreate(**datos, id_arbol=id_arbol, fecha_medicion=date(2024, 7, dia)))
+    finally:
+        db.close()
+
+    # Las filas serializadas con orjson coinciden campo a campo con el response_model
+    pytest.importorskip("orjson")
+    for ruta, params in (("/arboles/", {"limit": 5}), ("/mediciones/", {"id_arbol": id_arbol, "limit": 2})):
+        modelo = client.get(ruta, params=params)
+        monkeypatch.setattr(respuestas, "JSON_FILAS", True)
+        rapido = client.get(ruta, params=params)
+        monkeypatch.setattr(respuestas, "JSON_FILAS", False)
+        assert rapido.json() and rapido.json() == modelo.json()
+        assert [list(fila) for fila in rapido.json()] == [list(fila) for fila in modelo.json()]
+        assert rapido.headers["x-next-cursor"] == modelo.headers["x-next-cursor"]
+
+    response = client.get("/arboles/", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert len(response.json()) >= 12
+    pequena = client.get("/provincias/", params={"limit": 1}, headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in pequena.headers
+
+    pytest.importorskip("brotli")
+    response = client.get("/arboles/", headers={"Accept-Encoding": "gzip, br"})
+    assert response.headers["content-encoding"] == "br"
+
+def test_compresion_en_streaming_y_tipos_excluidos():
+    from starlette.applications import Starlette
+    from starlette.responses import Response, StreamingResponse
+    from starlette.routing import Route
+    from app.compresion import CompresionMiddleware
+
+    pytest.importorskip("brotli")
+    def bloques():
+        for i in range(50):
+            yield f"fila {i};".encode() * 40
+
+    aplicacion = Starlette(routes=[
+        Route("/stream", lambda request: StreamingResponse(bloques(), media_type="text/csv")),
+        Route("/imagen", lambda request: Response(b"\xff" * 5000, media_type="image/jpeg")),
+    ])
+    aplicacion.add_middleware(CompresionMiddleware, codificaciones=("br", "gzip"), minimum_size=100)
+    cliente = TestClient(aplicacion)
+
+    esperado = b"".join(bloques())
+    for codificacion in ("gzip", "br"):
+        response = cliente.get("/stream", headers={"Accept-Encoding": codificacion})
+        assert response.headers["content-encoding"] == codificacion
+        assert "content-length" not in response.headers
+        assert response.content == esperado
+    response = cliente.get("/imagen", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers and len(response.content) == 5000
+
+def test_listados_con_fields(client, catalogo, monkeypatch):
+    crear_arbol(catalogo, identificacion="fields-1")
+    response = client.get("/arboles/", params={"fields": "latitude,longitude,requiere_intervencion", "limit": 2})
+    assert response.status_code == 200
+    assert set(response.json()[0]) == {"id_arbol", "latitude", "longitude", "requiere_intervencion"}
+    assert "x-next-cursor" in response.headers
+
+    # Sin orjson se serializa con el modelo reducido, con el mismo resultado
+    monkeypatch.setattr(respuestas, "orjson", None)
+    assert client.get("/arboles/", params={"fields": "latitude,longitude,requiere_intervencion", "limit": 2}).json() == response.json()
+    mediciones = client.get("/mediciones/", params={"fields": "fecha_medicion"}).json()
+    assert all(set(medicion) == {"id_medicion", "fecha_medicion"} for medicion in mediciones)
+
+    assert client.get("/arboles/", params={"fields": "latitude,clave"}).status_code == 400
+    assert client.get("/arboles/", params={"fields": "latitude", "embed": "ultima_medicion"}).status_code == 400
+
+def test_consultas_por_peticion(client, catalogo, caplog):
+    response = client.post("/provincias/", json={"nombre": "Provincia Instrumentada"})
+    assert response.headers["server-timing"].startswith("db;dur=")
+    assert 'queries"' in response.headers["server-timing"]
+
+    client.get(f"/arboles/{crear_arbol(catalogo, identificacion='sql-1')}")
+    stats = client.get("/sql/stats").json()
+    assert stats["POST /provincias/"]["queries"] >= 2
+    assert stats["GET /arboles/{arbol_id}"]["requests"] >= 1
+    # Las rutas asíncronas declaran {arbol_id:int}; la etiqueta es la misma en ambos modos
+    assert query_metrics.plantilla_ruta({"route": SimpleNamespace(path="/arboles/{arbol_id:int}/full")}, "") == "/arboles/{arbol_id}/full"
+    assert query_metrics.plantilla_ruta({}, "unmatched") == "unmatched"
+    # Las URL sin ruta comparten una sola entrada
+    client.get("/no-existe/1")
+    client.get("/no-existe/2")
+    stats = client.get("/sql/stats").json()
+    assert "GET unmatched" in stats and not [ruta for ruta in stats if "no-existe" in ruta]
+
+    # Una sentencia fallida no deja inicios pendientes en la conexión
+    db = SessionLocal()
+    try:
+        with pytest.raises(Exception):
+            db.execute(text("SELECT * FROM tabla_inexistente"))
+        db.rollback()
+        assert "query_start" not in db.connection().info
+    finally:
+        db.close()
+
+    # La misma SELECT repetida en una petición se marca como probable N+1
+    consultas = query_metrics.RequestQueries()
+    for _ in range(query_metrics.SQL_N_MAS_1_UMBRAL):
+        consultas.record("SELECT * FROM medicion WHERE id_arbol = ?", 0.001)
+    consultas.record("UPDATE arbol SET version = ?", 0.001)
+    assert consultas.repeated() == [("SELECT * FROM medicion WHERE id_arbol = ?", query_metrics.SQL_N_MAS_1_UMBRAL)]
+
+def test_escrituras_en_una_sentencia(client, catalogo, monkeypatch):
+    consultas = query_metrics.RequestQueries()
+    token = query_metrics._actual.set(consultas)
+    try:
+        id_arbol = crear_arbol(catalogo, identificacion="returning-1")
+    finally:
+        query_metrics._actual.reset(token)
+    # Sin SELECT de existencia ni refresh: INSERT ... RETURNING y el resumen por municipio
+    assert not [statement for statement in consultas.statements if statement.lstrip().upper().startswith("SELECT")]
+    assert client.get(f"/arboles/{id_arbol}").json()["identificacion"] == "returning-1"
+
+    # Las FK rechazan la escritura y se responde con el mismo 400 de antes
+    db = SessionLocal()
+    try:
+        with pytest.raises(HTTPException) as error:
+            crud.create_arbol(db, schemas.ArbolCreate(**datos_arbol(catalogo, id_municipio=999999)))
+        assert (error.value.status_code, error.value.detail) == (400, "El municipio con ID 999999 no existe.")
+        with pytest.raises(HTTPException) as error:
+            crud.update_arbol(db, id_arbol, schemas.ArbolCreate(**datos_arbol(catalogo, id_especie=999999)))
+        assert (error.value.status_code, error.value.detail) == (400, "La especie con ID 999999 no existe.")
+        with pytest.raises(HTTPException) as error:
+            crud.create_foto(db, schemas.FotoCreate(id_medicion=999999, tipo_foto="copa", ruta_foto="x.jpg"))
+        assert (error.value.status_code, error.value.detail) == (400, "La medición con ID 999999 no existe.")
+        with pytest.raises(HTTPException) as error:
+            crud.update_foto(db, 999999, schemas.FotoCreate(id_medicion=999999, tipo_foto="copa", ruta_foto="x.jpg"))
+        assert error.value.status_code == 404
+
+        # Medición eliminada entre la lectura del árbol anterior y el UPDATE
+        datos = {k: v for k, v in datos_arbol(catalogo).items() if k in schemas.MedicionCreate.model_fields}
+        medicion = schemas.MedicionCreate(**{**datos, "id_arbol": id_arbol, "fecha_medicion": date(2024, 12, 1)})
+        id_medicion = crud.create_medicion(db, medicion).id_medicion
+        monkeypatch.setattr(crud, "_actualizar", lambda *args: None)
+        with pytest.raises(HTTPException) as error:
+            crud.update_medicion(db, id_medicion, medicion)
+        assert (error.value.status_code, error.value.detail) == (404, "Medición no encontrada")
+    finally:
+        db.close()
+    assert client.get(f"/arboles/{id_arbol}").json()["id_especie"] == catalogo["id_especie"]
+
+def test_cache_de_catalogos(client, catalogo):
+    antes = client.get("/cache/stats").json()["municipio"]
+    client.get(f"/estadisticas/municipios/{catalogo['id_municipio']}")
+    client.get(f"/estadisticas/municipios/{catalogo['id_municipio']}")
+    despues = client.get("/cache/stats").json()["municipio"]
+    assert despues["hits"] >= antes["hits"] + 2
+
+def test_metricas_del_pool(client):
+    client.get("/provincias/")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert 'db_pool_checkouts_total{engine="sync"}' in response.text
+    assert "# TYPE db_pool_checkout_wait_seconds summary" in response.text
+
+@pytest.mark.parametrize("modo", ["sync", "async"])
+def test_lecturas_en_replica(client, catalogo, tmp_path, monkeypatch, modo):
+    if modo == "async":
+        pytest.importorskip("aiosqlite")
+    # La réplica es otra base SQLite con datos propios; la segunda URL no se puede abrir
+    url_replica = f"sqlite:///{tmp_path / 'replica.db'}"
+    replicas = database.Replicas([f"sqlite:///{tmp_path / 'no-existe' / 'caida.db'}", url_replica])
+    Base.metadata.create_all(bind=replicas.motores()[1])
+    with replicas.motores()[1].begin() as conn:
+        conn.execute(models.Provincia.__table__.insert().values(nombre="Provincia En Replica"))
+    monkeypatch.setattr(database, "replicas", replicas)
+    nombre = f"Provincia Recien Creada {modo.title()}"
+
+    with TestClient(create_app(async_database=modo == "async")) as cliente:
+        for _ in range(3):
+            nombres = [p["nombre"] for p in cliente.get("/provincias/", params={"limit": 1000}).json()]
+            assert nombres == ["Provincia En Replica"]
+        assert replicas.candidatas() == [replicas.motores()[1]]
+
+        # Tras escribir, el mismo cliente lee de la primaria y ve su cambio
+        cliente.post("/provincias/", json={"nombre": nombre})
+        nombres = [p["nombre"] for p in cliente.get("/provincias/", params={"limit": 1000}).json()]
+        assert nombre in nombres and "Provincia En Replica" not in nombres
+        # La exportación respeta la misma decisión: el árbol recién creado sólo está en la primaria
+        identificacion = f"exportado-{modo}"
+        crear_arbol(catalogo, identificacion=identificacion)
+        assert identificacion in cliente.get("/arboles/export").text
+        cliente.cookies.clear()
+        assert identificacion not in cliente.get("/arboles/export").text
+        assert nombre in [p["nombre"] for p in cliente.get("/provincias/", params={"limit": 1000}, headers={"X-Read-Primary": "1"}).json()]
+
+        # Sin réplicas disponibles se lee de la primaria
+        replicas.marcar_caida(1)
+        assert nombre in [p["nombre"] for p in cliente.get("/provincias/", params={"limit": 1000}).json()]
+
+def test_create_app_sin_create_all(monkeypatch):
+    from app import main
+
+    def create_all(*args, **kwargs):
+        raise AssertionError("Con CREATE_SCHEMA=false el esquema lo gestiona Alembic")
+
+    monkeypatch.setattr(models.Base.metadata, "create_all", create_all)
+    with TestClient(main.create_app(crear_esquema=False)) as c:
+        assert c.get("/provincias/").status_code == 200
+        texto = c.get("/metrics").text
+    assert main.tiempos_arranque["import_seconds"] > 0
+    assert "app_startup_seconds " in texto
+
+def test_metricas_http_por_ruta(client, tmp_path):
+    client.get("/provincias/")
+    client.get("/provincias/999999")
+    texto = client.get("/metrics").text
+    assert 'http_requests_total{method="GET",route="/provincias/",status="200"}' in texto
+    assert 'http_requests_total{method="GET",route="/provincias/{provincia_id}",status="404"}' in texto
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/provincias/",le="+Inf"}' in texto
+    assert "# TYPE http_response_size_bytes histogram" in texto
+
+    # Con varios workers, cada proceso vuelca sus métricas y /metrics las suma
+    otro_worker = http_metrics.HttpMetrics()
+    otro_worker.start("GET")
+    otro_worker.finish("GET", "/provincias/", 200, 0.02, 0, 512)
+    otro_worker.start("GET")  # Petición en curso de un proceso que ya terminó
+    (tmp_path / "999999999.json").write_text(json.dumps(otro_worker.snapshot()))
+    local = http_metrics.HttpMetrics()
+    local.start("GET")
+    local.finish("GET", "/provincias/", 200, 0.2, 0, 512)
+    volcado = http_metrics.VolcadoMultiproceso(str(tmp_path), local)
+    total = volcado.leer()
+    assert total["requests"]["GET|/provincias/|200"] == 2
+    assert total["histograms"]["http_request_duration_seconds"]["GET|/provincias/"][-1] == pytest.approx(0.22)
+    assert total["in_flight"]["GET"] == 0
+
+    # El volcado del proceso terminado se integra en finalizados.json y se elimina, sin contarse dos veces
+    assert not (tmp_path / "999999999.json").exists()
+    assert (tmp_path / http_metrics.FINALIZADOS).exists()
+    assert volcado.leer() == total
@@ -0,0 +1,109 @@
+import asyncio
+import pytest
+from datetime import date
+from fastapi.testclient import TestClient
+
+pytest.importorskip("aiosqlite")
+
+from app import crud, crud_async, database, schemas
+from app.database import DATABASE_URL, SessionLocal, create_async_session_factory
+from app.main import create_app
+
+pytestmark = pytest.mark.skipif(not DATABASE_URL.startswith("sqlite"), reason="Requiere una base SQLite de pruebas")
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_crud_async_lee_lo_escrito_por_crud(test_db, client):
+    client.post("/provincias/", json={"nombre": "Provincia Asincrona"})
+
+    async def leer():
+        async_engine, AsyncSessionLocal = create_async_session_factory(DATABASE_URL)
+        try:
+            async with AsyncSessionLocal() as db:
+                provincias = await crud_async.get_provincias(db, limit=500)
+                return [p.nombre for p in provincias]
+        finally:
+            await async_engine.dispose()
+
+    assert "Provincia Asincrona" in run(leer())
+
+
+@pytest.fixture(scope="module")
+def async_client(test_db):
+    with TestClient(create_app(async_database=True)) as c:
+        yield c
+
+
+@pytest.fixture(scope="module")
+def censo(test_db):
+    db = SessionLocal()
+    try:
+        provincia = crud.create_provincia(db, schemas.ProvinciaCreate(nombre="Provincia Del Censo Asincrono"))
+        municipio = crud.create_municipio(db, schemas.MunicipioCreate(id_provincia=provincia.id_provincia, nombre="Municipio Asincrono"))
+        especie = crud.create_especie(db, schemas.EspecieCreate(nombre_cientifico="Jacaranda mimosifolia", nombre_comun="Jacarandá", origen="nativo"))
+        comunes = {
+            "altura": "3-5 m", "diametro_tronco": "5-15 cm", "ambito": "Urbano", "distancia_entre_ejemplares": "5 m",
+            "distancia_al_cordon": "1 m", "interferencia_aerea": "Baja", "requiere_intervencion": False, "protegido": False,
+        }
+        arboles = [
+            crud.create_arbol(db, schemas.ArbolCreate(
+                **comunes, id_especie=especie.id_especie, id_municipio=municipio.id_municipio,
+                latitude=-34.6 - numero / 1000, longitude=-58.4, identificacion=f"async-{numero}", fecha_censo=date(2024, 1, 1),
+            )).id_arbol
+            for numero in range(5)
+        ]
+        crud.create_medicion(db, schemas.MedicionCreate(**comunes, id_arbol=arboles[0], fecha_medicion=date(2024, 6, 1)))
+        return {"provincia": provincia.id_provincia, "municipio": municipio.id_municipio, "arboles": arboles}
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def sesiones_asincronas(monkeypatch):
+    """Cuenta las sesiones asíncronas abiertas: sólo las rutas de async_routes las usan."""
+    abiertas = []
+    original = database.get_async_session_factory
+    monkeypatch.setattr(database, "get_async_session_factory", lambda: abiertas.append(1) or original())
+    return abiertas
+
+
+def test_rutas_asincronas_responden_como_las_sincronas(client, async_client, censo, sesiones_asincronas):
+    id_arbol = censo["arboles"][0]
+    rutas = [
+        ("/provincias/", {"limit": 500}),
+        (f"/provincias/{censo['provincia']}", {}),
+        ("/arboles/", {"limit": 500}),
+        (f"/arboles/{id_arbol}", {}),
+        (f"/arboles/{id_arbol}/full", {}),
+        ("/arboles/", {"fields": "latitude,identificacion", "limit": 500}),
+        ("/arboles/", {"embed": "ultima_medicion", "limit": 500}),
+        ("/mediciones/", {"fields": "fecha_medicion", "id_arbol": id_arbol}),
+    ]
+    for ruta, params in rutas:
+        antes = len(sesiones_asincronas)
+        asincrona = async_client.get(ruta, params=params)
+        assert asincrona.status_code == 200, ruta
+        assert len(sesiones_asincronas) == antes + 1, ruta
+        assert asincrona.json() == client.get(ruta, params=params).json(), ruta
+
+    # Las rutas sin versión asíncrona siguen resolviéndose con las síncronas
+    antes = len(sesiones_asincronas)
+    assert async_client.get("/arboles/bbox", params={"min_lat": -35, "min_lon": -59, "max_lat": -34, "max_lon": -58}).status_code == 200
+    assert len(sesiones_asincronas) == antes
+    assert async_client.get(f"/arboles/{10**9}").status_code == 404
+    assert async_client.get("/arboles/", params={"fields": "latitude,clave"}).status_code == 400
+
+
+def test_rutas_asincronas_paginan_por_cursor(async_client, censo):
+    vistos, cursor = [], None
+    while True:
+        params = {"limit": 2, "id_municipio": censo["municipio"], "cursor": cursor}
+        response = async_client.get("/arboles/", params={k: v for k, v in params.items() if v is not None})
+        vistos += [arbol["id_arbol"] for arbol in response.json()]
+        cursor = response.headers.get("x-next-cursor")
+        if not cursor:
+            break
+    assert vistos == sorted(censo["arboles"])
@@ -0,0 +1,87 @@
+import asyncio
+import threading
+from datetime import date, timedelta
+import pytest
+from fastapi import HTTPException
+from app import auth, crud, models, schemas
+from app.cache import principales
+from app.database import SessionLocal
+
+
+def test_hash_y_verificacion_en_pool():
+    async def probar():
+        hashed = await auth.get_password_hash("secreto")
+        return await auth.verify_password("secreto", hashed), await auth.verify_password("otro", hashed)
+
+    assert asyncio.run(probar()) == (True, False)
+    assert auth.hash_stats.completed >= 3
+
+
+def test_pool_de_hash_rechaza_sin_cupo(monkeypatch):
+    monkeypatch.setattr(auth, "_hash_slots", threading.BoundedSemaphore(1))
+    auth._hash_slots.acquire()
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(auth.get_password_hash("secreto"))
+    assert error.value.status_code == 503
+
+
+def test_cancelar_peticion_no_libera_cupo_en_uso(monkeypatch):
+    monkeypatch.setattr(auth, "_hash_slots", threading.BoundedSemaphore(1))
+    en_curso, continuar = threading.Event(), threading.Event()
+
+    def lento():
+        en_curso.set()
+        continuar.wait(5)
+
+    async def probar():
+        tarea = asyncio.create_task(auth._run_in_hash_pool(lento))
+        await asyncio.to_thread(en_curso.wait, 5)
+        tarea.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await tarea
+        # bcrypt sigue ocupando el hilo: el cupo no vuelve hasta que termina
+        ocupado = not auth._hash_slots.acquire(blocking=False)
+        continuar.set()
+        return ocupado
+
+    assert asyncio.run(probar())
+    assert auth._hash_slots.acquire(timeout=5)
+
+
+def test_principal_en_cache_e_invalidacion(test_db):
+    db = SessionLocal()
+    try:
+        provincia = crud.create_provincia(db, schemas.ProvinciaCreate(nombre="Provincia Auth"))
+        municipio = crud.create_municipio(db, schemas.MunicipioCreate(id_provincia=provincia.id_provincia, nombre="Municipio Auth"))
+        role = crud.create_role(db, schemas.RoleCreate(role_name="Censista", can_create_relevamientos=True))
+        usuario = models.Usuario(
+            id_municipio=municipio.id_municipio,
+            id_role=role.id_role,
+            nombre="Ana",
+            email="ana@example.com",
+            hashed_password="x",
+            date_joined=date(2024, 1, 1),
+        )
+        db.add(usuario)
+        db.commit()
+        token = auth.create_access_token({"sub": "ana@example.com"}, timedelta(minutes=5))
+
+        principal = asyncio.run(auth.get_current_user(token=token, db=db))
+        assert principal.role.can_create_relevamientos
+        hits = principales.hits
+        assert asyncio.run(auth.get_current_user(token=token, db=db)) == principal
+        assert principales.hits == hits + 1
+
+        crud.update_usuario(db, usuario.id_usuario, schemas.UsuarioCreate(
+            id_municipio=municipio.id_municipio,
+            id_role=role.id_role,
+            nombre="Ana",
+            email="ana@example.com",
+            hashed_password="x",
+            is_active=False,
+            date_joined=date(2024, 1, 1),
+        ))
+        assert asyncio.run(auth.get_current_user(token=token, db=db)).is_active is False
+    finally:
+        db.close()
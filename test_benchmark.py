@@ -0,0 +1,39 @@
+import asyncio
+import pytest
+from app.database import Base, SessionLocal, engine
+from app import models
+from benchmark import carga, semilla
+
+@pytest.fixture(scope="module")
+def censo():
+    resultado = semilla.sembrar(provincias=2, municipios_por_provincia=3, especies=4, arboles=60, mediciones_por_arbol=2, lote=25)
+    yield resultado
+    Base.metadata.drop_all(bind=engine)
+
+def test_semilla_genera_un_censo_coherente(censo):
+    assert censo["arboles"] == 60 and censo["mediciones"] == 120
+    db = SessionLocal()
+    try:
+        arbol = db.query(models.Arbol).filter(models.Arbol.identificacion.like("bench-%")).first()
+        ultima = max(arbol.mediciones, key=lambda medicion: medicion.fecha_medicion)
+        assert arbol.id_ultima_medicion == ultima.id_medicion
+        assert arbol.geohash
+    finally:
+        db.close()
+
+def test_carga_reporta_percentiles_por_ruta(censo):
+    resultado = asyncio.run(carga.ejecutar(None, peticiones=60, concurrencia=4, calentamiento=5))
+    assert resultado["total"]["peticiones"] == 60
+    assert resultado["total"]["errores"] == 0
+    for ruta in resultado["rutas"].values():
+        assert ruta["p50_ms"] <= ruta["p95_ms"] <= ruta["p99_ms"] <= ruta["max_ms"]
+
+    # Una ejecución idéntica pero el doble de lenta se marca como regresión
+    lenta = {"rutas": {nombre: {**ruta, "p95_ms": ruta["p95_ms"] * 2 + 1} for nombre, ruta in resultado["rutas"].items()}}
+    assert carga.comparar(lenta, resultado)
+    assert not carga.comparar(resultado, resultado)
+
+def test_percentil():
+    assert carga.percentil([], 95) == 0.0
+    assert carga.percentil([1.0, 2.0, 3.0, 4.0, 5.0], 50) == 3.0
+    assert carga.percentil([1.0, 2.0], 99) == pytest.approx(1.99)